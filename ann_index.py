@@ -0,0 +1,421 @@
+import os, sys, json, time, argparse
+from pathlib import Path
+
+import numpy as np
+
+from vector_store import VectorStore, INT_NULL
+
+# Campos filtrables que pdf-to-chunks.py agrega a cada chunk
+FILTER_FIELDS = ("year", "month", "account", "number")
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", 16))
+# Si el filtro deja menos filas que esto, se hace búsqueda exacta solo sobre ellas
+BRUTE_FORCE_MAX = int(os.getenv("ANN_BRUTE_FORCE_MAX", 10_000))
+# Valores con al menos N/BITMAP_DENSITY filas tienen bitmap precalculado; los raros, lista de ids
+BITMAP_DENSITY = 256
+
+
+def filter_union(record):
+    """
+    {campo: valores} de filtro de un chunk: los propios y, en un canónico de dedup_chunks.py,
+    los de cada duplicado en `refs` (sin repetir, el propio primero).
+    """
+    refs = record.get("refs") or ()
+    return {f: list(dict.fromkeys(v for v in (record.get(f), *(r.get(f) for r in refs)) if v is not None))
+            for f in FILTER_FIELDS}
+
+
+def _normalize(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def train_kmeans(sample, nlist, n_iter=10, seed=0):
+    """K-means esférico (los vectores E5 están normalizados: similitud = producto punto)."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(sample, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        filled = np.flatnonzero(counts)
+        sums[filled] = np.add.reduceat(sample[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[filled])
+        empty = counts == 0
+        # Centroides vacíos se re-siembran con puntos al azar
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids.astype(np.float32)
+
+
+def _assign(vectors, centroids, block=65536):
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block):
+        out[start:start + block] = np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+    return out
+
+
+def _top_k(scores, ids, k):
+    if len(scores) > k:
+        part = np.argpartition(-scores, k)[:k]
+        scores, ids = scores[part], ids[part]
+    order = np.argsort(-scores)
+    return ids[order], scores[order]
+
+
+class IVFIndex:
+    """
+    Índice IVF-Flat sobre NumPy: k-means en `nlist` listas, vectores contiguos por lista,
+    búsqueda en las `nprobe` listas más cercanas. Las filas agregadas después de construir
+    van a un segmento delta (búsqueda exacta) hasta compact().
+    Los ids devueltos son números de fila del VectorStore de origen.
+    """
+
+    def __init__(self, centroids):
+        self.centroids = centroids
+        self.nlist, self.dim = centroids.shape
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.row_ids = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        self.delta_vectors, self.delta_ids = [], []
+        # Por campo: lista de valores y código (índice en esa lista) de cada fila; -1 = nulo
+        self.values = {f: [] for f in FILTER_FIELDS}
+        self.codes = {f: np.zeros(0, dtype=np.int32) for f in FILTER_FIELDS}
+        self._value_pos = {f: {} for f in FILTER_FIELDS}
+        # Valores adicionales de filas con varios (canónicos con refs): pares (fila, código)
+        self.extra = {f: (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32)) for f in FILTER_FIELDS}
+        self._filters_dirty = True
+
+    # ---------------- Construcción ----------------
+    def __len__(self):
+        return len(self.codes[FILTER_FIELDS[0]])
+
+    def add(self, vectors, metadata):
+        """
+        Agrega vectores (filas consecutivas a partir de len(self)) y sus metadatos {campo: valores}.
+        Un valor puede ser una lista: la fila cumple el filtro con cualquiera de ellos.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        start = len(self)
+        self.delta_vectors.append(vectors)
+        self.delta_ids.append(np.arange(start, start + len(vectors), dtype=np.int64))
+        for f in FILTER_FIELDS:
+            pos = self._value_pos[f]
+            codes = np.empty(len(vectors), dtype=np.int32)
+            extra_rows, extra_codes = [], []
+            for i, v in enumerate(metadata.get(f, [None] * len(vectors))):
+                values = [x for x in dict.fromkeys(v if isinstance(v, (list, tuple)) else [v]) if x is not None]
+                codes[i] = -1
+                for j, x in enumerate(values):
+                    if x not in pos:
+                        pos[x] = len(self.values[f])
+                        self.values[f].append(x)
+                    if j == 0:
+                        codes[i] = pos[x]
+                    else:
+                        extra_rows.append(start + i)
+                        extra_codes.append(pos[x])
+            self.codes[f] = np.concatenate([self.codes[f], codes])
+            if extra_rows:
+                rows, other = self.extra[f]
+                self.extra[f] = (np.concatenate([rows, np.asarray(extra_rows, dtype=np.int64)]),
+                                 np.concatenate([other, np.asarray(extra_codes, dtype=np.int32)]))
+        self._filters_dirty = True
+
+    def compact(self):
+        """Mueve el segmento delta a las listas invertidas (vectores contiguos por lista)."""
+        if not self.delta_vectors:
+            return
+        new_vecs = np.concatenate(self.delta_vectors)
+        new_ids = np.concatenate(self.delta_ids)
+        old_lists = np.repeat(np.arange(self.nlist), np.diff(self.offsets))
+        lists = np.concatenate([old_lists, _assign(new_vecs, self.centroids)])
+        order = np.argsort(lists, kind="stable")
+        self.vectors = np.concatenate([np.asarray(self.vectors), new_vecs])[order]
+        self.row_ids = np.concatenate([np.asarray(self.row_ids), new_ids])[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=self.nlist))]).astype(np.int64)
+        self.delta_vectors, self.delta_ids = [], []
+
+    def _build_filters(self):
+        """Ids por valor (ordenados) para todos los valores y bitmaps empaquetados para los frecuentes."""
+        n = len(self)
+        self.filter_ids, self.bitmaps = {}, {}
+        for f in FILTER_FIELDS:
+            extra_rows, extra_codes = self.extra[f]
+            rows = np.concatenate([np.arange(n, dtype=np.int64), extra_rows])
+            codes = np.concatenate([self.codes[f], extra_codes])
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(-1, len(self.values[f]) + 1))
+            self.filter_ids[f], self.bitmaps[f] = {}, {}
+            for c in range(len(self.values[f])):
+                ids = rows[order[bounds[c + 1]:bounds[c + 2]]]
+                if len(extra_rows):
+                    ids = np.unique(ids)
+                self.filter_ids[f][c] = ids
+                if len(ids) * BITMAP_DENSITY >= n:
+                    mask = np.zeros(n, dtype=bool)
+                    mask[ids] = True
+                    self.bitmaps[f][c] = np.packbits(mask)
+        self._filters_dirty = False
+
+    # ---------------- Filtros ----------------
+    def _filter(self, filters):
+        """
+        Traduce {campo: valor o lista de valores} a ids de fila (si es selectivo) o a una
+        máscara booleana. Devuelve (ids, mask); uno de los dos es None. (None, None) = sin filtro.
+        """
+        if not filters:
+            return None, None
+        if self._filters_dirty:
+            self._build_filters()
+        n = len(self)
+        sparse, dense = [], []
+        for f, wanted in filters.items():
+            wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            codes = [self._value_pos[f][v] for v in wanted if v in self._value_pos[f]]
+            if not codes:
+                return np.zeros(0, dtype=np.int64), None
+            if all(c in self.bitmaps[f] for c in codes):
+                packed = self.bitmaps[f][codes[0]]
+                for c in codes[1:]:
+                    packed = packed | self.bitmaps[f][c]
+                dense.append(packed)
+            else:
+                sparse.append(np.sort(np.concatenate([self.filter_ids[f][c] for c in codes])))
+        if sparse:
+            ids = sparse[0]
+            for other in sparse[1:]:
+                ids = np.intersect1d(ids, other, assume_unique=True)
+            for packed in dense:
+                # Consulta bit a bit solo de los ids candidatos (packbits es big-endian por byte)
+                ids = ids[(packed[ids >> 3] >> (7 - (ids & 7)).astype(np.uint8)) & 1 == 1]
+            if len(ids) <= BRUTE_FORCE_MAX:
+                return ids, None
+            mask = np.zeros(n, dtype=bool)
+            mask[ids] = True
+            return None, mask
+        packed = dense[0]
+        for other in dense[1:]:
+            packed = packed & other
+        mask = np.unpackbits(packed, count=n).view(bool)
+        if mask.sum() <= BRUTE_FORCE_MAX:
+            return np.flatnonzero(mask), None
+        return None, mask
+
+    # ---------------- Búsqueda ----------------
+    def _position_of_rows(self):
+        key = (len(self), len(self.row_ids))
+        if getattr(self, "_row_pos_key", None) != key:
+            self._row_pos = np.full(len(self), -1, dtype=np.int64)
+            self._row_pos[self.row_ids] = np.arange(len(self.row_ids))
+            self._row_pos_key = key
+        return self._row_pos
+
+    def _vectors_of(self, ids):
+        """Vectores de filas arbitrarias (listas invertidas + delta)."""
+        pos = self._position_of_rows()[ids]
+        out = np.empty((len(ids), self.dim), dtype=np.float32)
+        in_main = pos >= 0
+        # Lectura en orden de disco: con memmap evita saltos aleatorios
+        order = np.argsort(pos[in_main])
+        dest = np.flatnonzero(in_main)[order]
+        out[dest] = self.vectors[pos[in_main][order]]
+        if (~in_main).any():
+            delta = np.concatenate(self.delta_vectors)
+            delta_start = int(self.delta_ids[0][0])
+            out[~in_main] = delta[ids[~in_main] - delta_start]
+        return out
+
+    def search(self, query, k=10, filters=None, nprobe=ANN_NPROBE):
+        """Top-k (ids de fila, similitudes) para un vector de consulta normalizado."""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        ids, mask = self._filter(filters)
+        if ids is not None:
+            # Filtro selectivo: búsqueda exacta sobre las filas que lo cumplen
+            if not len(ids):
+                return ids, np.zeros(0, dtype=np.float32)
+            return _top_k(self._vectors_of(ids) @ query, ids, k)
+
+        probe = np.argpartition(-(self.centroids @ query), min(nprobe, self.nlist) - 1)[:nprobe]
+        cand_scores, cand_ids = [], []
+        for l in probe:
+            a, b = self.offsets[l], self.offsets[l + 1]
+            if a == b:
+                continue
+            rows = self.row_ids[a:b]
+            vecs = self.vectors[a:b]
+            if mask is not None:
+                keep = mask[rows]
+                rows, vecs = rows[keep], vecs[keep]
+            cand_scores.append(vecs @ query)
+            cand_ids.append(rows)
+        for vecs, rows in zip(self.delta_vectors, self.delta_ids):
+            if mask is not None:
+                keep = mask[rows]
+                rows, vecs = rows[keep], vecs[keep]
+            cand_scores.append(vecs @ query)
+            cand_ids.append(rows)
+        if not cand_scores:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return _top_k(np.concatenate(cand_scores), np.concatenate(cand_ids), k)
+
+    def brute_force(self, query, k=10, filters=None):
+        """Búsqueda exacta sobre todo el índice (referencia para recall)."""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        ids, mask = self._filter(filters)
+        if ids is not None:
+            return _top_k(self._vectors_of(ids) @ query, ids, k)
+        # Sin filtro selectivo: se recorren todos los segmentos en orden, sin gather
+        scores = [self.vectors @ query] + [v @ query for v in self.delta_vectors]
+        rows = np.concatenate([self.row_ids] + self.delta_ids)
+        scores = np.concatenate(scores)
+        if mask is not None:
+            keep = mask[rows]
+            scores, rows = scores[keep], rows[keep]
+        return _top_k(scores, rows, k)
+
+    # ---------------- Persistencia ----------------
+    def save(self, out_dir):
+        self.compact()
+        out = Path(out_dir)
+        out.mkdir(parents=True, exist_ok=True)
+        np.save(out / "centroids.npy", self.centroids)
+        np.save(out / "vectors.npy", self.vectors)
+        np.save(out / "row_ids.npy", self.row_ids)
+        np.save(out / "offsets.npy", self.offsets)
+        for f in FILTER_FIELDS:
+            np.save(out / f"codes_{f}.npy", self.codes[f])
+            np.save(out / f"extra_{f}.npy", np.vstack(self.extra[f]).astype(np.int64))
+        with open(out / "values.json", "w", encoding="utf-8") as fh:
+            json.dump(self.values, fh, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, index_dir, mmap=True):
+        d = Path(index_dir)
+        mode = "r" if mmap else None
+        index = cls(np.load(d / "centroids.npy"))
+        index.vectors = np.load(d / "vectors.npy", mmap_mode=mode)
+        index.row_ids = np.load(d / "row_ids.npy")
+        index.offsets = np.load(d / "offsets.npy")
+        with open(d / "values.json", encoding="utf-8") as fh:
+            index.values = json.load(fh)
+        for f in FILTER_FIELDS:
+            index.codes[f] = np.load(d / f"codes_{f}.npy")
+            index._value_pos[f] = {v: i for i, v in enumerate(index.values[f])}
+            # Índices guardados antes de los valores múltiples no tienen extra_<campo>.npy
+            if (d / f"extra_{f}.npy").exists():
+                rows, codes = np.load(d / f"extra_{f}.npy")
+                index.extra[f] = (rows.astype(np.int64), codes.astype(np.int32))
+        # Bitmaps y mapa fila→posición listos antes de atender consultas (concurrentes)
+        index._build_filters()
+        index._position_of_rows()
+        return index
+
+
+def _store_metadata(store, start, stop):
+    meta = {}
+    for f in FILTER_FIELDS:
+        if f in store.ints:
+            col = store.ints[f][start:stop]
+            meta[f] = [None if v == INT_NULL else int(v) for v in col]
+        else:
+            meta[f] = [store.strs[f][i] for i in range(start, stop)]
+    # Canónicos de dedup_chunks.py: también cumplen los filtros de los duplicados que representan
+    for i in range(start, stop):
+        extra = store.strs["extra"][i]
+        if not extra or '"refs"' not in extra:
+            continue
+        record = {f: meta[f][i - start] for f in FILTER_FIELDS}
+        record["refs"] = json.loads(extra).get("refs")
+        for f, values in filter_union(record).items():
+            meta[f][i - start] = [int(v) for v in values] if f in store.ints else values
+    return meta
+
+
+def build_from_store(store_dir, nlist=None, block=100_000, seed=0):
+    """Construye el índice desde un VectorStore (salida de embed_chunks.py --out-format store)."""
+    store = VectorStore(store_dir)
+    n = len(store)
+    # ~2·√N listas: con unos pocos millones de chunks, nprobe=16 recorre ~15k vectores por consulta
+    nlist = nlist or max(1, min(int(2 * np.sqrt(n)), n))
+    rng = np.random.default_rng(seed)
+    sample_ids = np.sort(rng.choice(n, size=min(n, nlist * 32), replace=False))
+    sample = _normalize(np.asarray(store.vectors[sample_ids], dtype=np.float32) *
+                        (store.scales[sample_ids, None] if store.scales is not None else 1.0))
+    index = IVFIndex(train_kmeans(sample, nlist, seed=seed))
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        index.add(store.vectors_f32(start, stop), _store_metadata(store, start, stop))
+    index.compact()
+    return index
+
+
+def evaluate(index, queries, k=10, filters=None, nprobe=ANN_NPROBE):
+    """recall@k del IVF contra búsqueda exacta, QPS de ambos y percentiles de latencia del IVF."""
+    approx, times = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        approx.append(index.search(q, k, filters, nprobe)[0])
+        times.append(time.perf_counter() - t0)
+    t_ann = sum(times)
+    t0 = time.perf_counter()
+    exact = [index.brute_force(q, k, filters)[0] for q in queries]
+    t_exact = time.perf_counter() - t0
+    hits = sum(len(np.intersect1d(a, e)) for a, e in zip(approx, exact))
+    total = sum(len(e) for e in exact)
+    return {
+        "recall_at_k": hits / total if total else 1.0,
+        "qps_ann": len(queries) / t_ann,
+        "qps_exact": len(queries) / t_exact,
+        "mean_ms_ann": 1000 * t_ann / len(queries),
+        "p50_ms_ann": 1000 * float(np.percentile(times, 50)),
+        "p90_ms_ann": 1000 * float(np.percentile(times, 90)),
+        "p99_ms_ann": 1000 * float(np.percentile(times, 99)),
+    }
+
+
+def _parse_filters(items):
+    filters = {}
+    for item in items or []:
+        field, _, value = item.partition("=")
+        filters[field] = int(value) if value.lstrip("-").isdigit() and field in ("year", "number") else value
+    return filters
+
+
+if __name__ == "__main__":
+    # Uso:
+    #   python ann_index.py build store_dir index_dir [--nlist 2048]
+    #   python ann_index.py bench store_dir index_dir --queries 200 --k 10 [--filter year=2015 --filter month=Enero]
+    parser = argparse.ArgumentParser(description="Índice ANN local (IVF sobre NumPy) con filtros por metadatos")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("build")
+    p.add_argument("store_dir")
+    p.add_argument("index_dir")
+    p.add_argument("--nlist", type=int, default=None)
+    p = sub.add_parser("bench")
+    p.add_argument("store_dir")
+    p.add_argument("index_dir")
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--nprobe", type=int, default=ANN_NPROBE)
+    p.add_argument("--filter", action="append", help="campo=valor (year, month, account, number)")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        t0 = time.perf_counter()
+        index = build_from_store(args.store_dir, args.nlist)
+        index.save(args.index_dir)
+        print(f"✅ Índice con {len(index)} vectores y {index.nlist} listas en {time.perf_counter() - t0:.1f} s")
+    else:
+        store = VectorStore(args.store_dir)
+        index = IVFIndex.load(args.index_dir)
+        rng = np.random.default_rng(1)
+        # Consultas: vectores del corpus con ruido, para que no coincidan exactamente
+        picks = rng.choice(len(store), size=min(args.queries, len(store)), replace=False)
+        queries = _normalize(np.vstack([store.vectors_f32(i, i + 1) for i in picks]) +
+                             rng.normal(scale=0.02, size=(len(picks), store.dim)).astype(np.float32))
+        r = evaluate(index, queries, args.k, _parse_filters(args.filter), args.nprobe)
+        print(f"📊 recall@{args.k}={r['recall_at_k']:.3f}  ANN {r['qps_ann']:.0f} QPS "
+              f"(media {r['mean_ms_ann']:.2f} ms, p50 {r['p50_ms_ann']:.2f} ms, p99 {r['p99_ms_ann']:.2f} ms)  "
+              f"exacta {r['qps_exact']:.0f} QPS")
+    sys.exit(0)
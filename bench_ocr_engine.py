@@ -0,0 +1,63 @@
+import sys, time, argparse, tempfile
+
+from ocr_engine import TesserocrEngine, PytesseractEngine
+from ocr_pages import ensure_tesseract
+from rasterizer import count_pages, render_pages
+
+# Uso: python bench_ocr_engine.py archivo.pdf --pages 5 --repeat 3
+# Compara el costo por página de cada motor OCR sobre las mismas páginas ya rasterizadas,
+# así la diferencia es solo overhead del motor (fork, PNG, carga del traineddata).
+
+
+def bench(engine, inputs, repeat):
+    # Una pasada de calentamiento: tesserocr carga el traineddata aquí, una única vez
+    engine.image_to_string(inputs[0])
+    times = []
+    for _ in range(repeat):
+        for item in inputs:
+            t0 = time.perf_counter()
+            engine.image_to_string(item)
+            times.append(time.perf_counter() - t0)
+    times.sort()
+    return {
+        "mean_ms": 1000 * sum(times) / len(times),
+        "p50_ms": 1000 * times[len(times) // 2],
+        "pages_per_s": len(times) / sum(times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de motores OCR por página")
+    parser.add_argument("pdf")
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--lang", default="spa")
+    args = parser.parse_args()
+
+    last = min(args.pages, count_pages(args.pdf))
+    with tempfile.TemporaryDirectory(prefix="bench_ocr_") as tmp:
+        paths = render_pages(args.pdf, 1, last, args.dpi, output_folder=tmp)
+        images = render_pages(args.pdf, 1, last, args.dpi)
+
+        results = {}
+        ensure_tesseract()
+        # pytesseract con imagen PIL: el camino original (guarda PNG temporal + fork)
+        results["pytesseract (PIL→PNG)"] = bench(PytesseractEngine(args.lang), images, args.repeat)
+        # pytesseract con ruta .pgm: sin re-codificar, pero sigue haciendo fork por página
+        results["pytesseract (ruta .pgm)"] = bench(PytesseractEngine(args.lang), paths, args.repeat)
+        try:
+            results["tesserocr (en memoria)"] = bench(TesserocrEngine(args.lang), images, args.repeat)
+        except ImportError:
+            print("⚠️ tesserocr no está instalado; se omite el motor en proceso (pip install tesserocr).")
+
+    base = results["pytesseract (PIL→PNG)"]["mean_ms"]
+    print(f"📊 {last} páginas × {args.repeat} repeticiones a {args.dpi} dpi")
+    for name, r in results.items():
+        print(f"{name:26s} media {r['mean_ms']:8.1f} ms  p50 {r['p50_ms']:8.1f} ms  "
+              f"{r['pages_per_s']:6.2f} pág/s  ahorro {base - r['mean_ms']:7.1f} ms/pág")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,536 @@
+import os, io, re, sys, json, time, types, shutil, zlib, argparse, platform, tempfile, textwrap, subprocess, importlib.util
+from contextlib import redirect_stdout
+from datetime import date
+from pathlib import Path
+
+from metrics import MetricsRecorder, reset_peak_rss, peak_rss_mb, children_peak_rss_mb
+
+# Uso:
+#   python bench_pipeline.py --docs 4 --pages 10 --out metrics/bench.json
+#   python bench_pipeline.py --docs 4 --pages 10 --baseline metrics/bench.json   (marca regresiones)
+#
+# Benchmark offline del pipeline: genera PDFs sintéticos (digitales con capa de texto y
+# "escaneados" sin ella) a partir de las OP de ejemplo del repo, reemplaza SQL Server por
+# una conexión pyodbc falsa en memoria (corre el código real de db_conector) y Azure Blob por
+# carpetas locales (BLOB_LOCAL_DIR), y mide cada etapa.
+
+HERE = Path(__file__).resolve().parent
+SAMPLES = ("175922-OP_0004.txt", "175924_OP_0001.txt")
+KINDS = ("digital", "scanned")
+# Binarios que usa el pipeline para cada tipo (poppler-utils y tesseract)
+REQUIRED_TOOLS = {"digital": ("pdfinfo", "pdftotext"), "scanned": ("pdfinfo", "pdftoppm", "tesseract")}
+# Una métrica *_per_s que cae más que esto (o un pico de memoria que sube más) es regresión
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", 0.10))
+# Etapas que se reportan pero no se comparan: la latencia de SQL es simulada y sin ella
+# la medición es solo overhead de Python, demasiado ruidosa para marcar regresiones
+UNGATED_STAGES = ("sql_metadata",)
+
+_PAGE_MARK = re.compile(r"^--- Página \d+ ---$", re.MULTILINE)
+# A4 en puntos PDF
+_PAGE_W, _PAGE_H, _MARGIN = 595, 842, 40
+
+
+def load_sample_pages(paths=SAMPLES):
+    """Páginas de texto de las OP de ejemplo (separadas por '--- Página N ---')."""
+    pages = []
+    for name in paths:
+        text = (HERE / name).read_text(encoding="utf-8")
+        pages.extend(p.strip() for p in _PAGE_MARK.split(text) if p.strip())
+    return pages
+
+
+def make_pages(doc_no, n_pages, samples):
+    # Encabezado propio por página: los documentos no son idénticos entre sí
+    return [f"ORDEN DE PAGO {doc_no:06d} - página {i + 1}\n\n{samples[(doc_no + i) % len(samples)]}"
+            for i in range(n_pages)]
+
+
+def _wrap(text, width):
+    lines = []
+    for line in text.splitlines():
+        lines.extend(textwrap.wrap(line, width) or [""])
+    return lines
+
+
+def _pdf_escape(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(path, pages, font_size=8):
+    """PDF digital mínimo (Helvetica, WinAnsi) con una capa de texto por página; sin dependencias."""
+    leading = font_size * 1.25
+    max_lines = int((_PAGE_H - 2 * _MARGIN) / leading)
+    # 1 catálogo, 2 árbol de páginas, 3 fuente; luego (página, contenido) por cada página
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages)))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, text in enumerate(pages):
+        ops = [f"BT /F1 {font_size} Tf {leading:.2f} TL {_MARGIN} {_PAGE_H - _MARGIN} Td"]
+        ops += [f"({_pdf_escape(line)}) '" for line in _wrap(text, 110)[:max_lines]]
+        ops.append("ET")
+        stream = zlib.compress("\n".join(ops).encode("cp1252", "replace"))
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_PAGE_W} {_PAGE_H}] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        objects.append(f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode()
+                       + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{off:010d} 00000 n \n".encode() for off in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    Path(path).write_bytes(out)
+
+
+def _load_font(size):
+    from PIL import ImageFont
+    for name in ("DejaVuSans.ttf", "arial.ttf", "Arial.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1
+        return ImageFont.load_default()
+
+
+def write_scanned_pdf(path, pages, dpi=200):
+    """PDF "escaneado": cada página es solo una imagen (sin capa de texto), con leve giro y desenfoque."""
+    from PIL import Image, ImageDraw, ImageFilter
+    w, h = _PAGE_W * dpi // 72, _PAGE_H * dpi // 72
+    margin, size = _MARGIN * dpi // 72, 9 * dpi // 72
+    font = _load_font(size)
+    images = []
+    for text in pages:
+        img = Image.new("L", (w, h), 255)
+        draw = ImageDraw.Draw(img)
+        y = margin
+        for line in _wrap(text, 95):
+            if y > h - margin:
+                break
+            draw.text((margin, y), line, fill=0, font=font)
+            y += int(size * 1.3)
+        img = img.rotate(0.4, resample=Image.BICUBIC, fillcolor=255).filter(ImageFilter.GaussianBlur(0.6))
+        images.append(img)
+    images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+
+
+def build_fixtures(root, kinds=KINDS, docs=4, pages=10, dpi=200):
+    """
+    Escribe los PDFs en <root>/v-ia-files (el contenedor de LocalBlobStore) y devuelve
+    {kind: {file_id: metadatos}} con la misma forma que db_conection.
+    """
+    samples = load_sample_pages()
+    container = Path(root) / "v-ia-files"
+    container.mkdir(parents=True, exist_ok=True)
+    fixtures, file_id = {}, 1
+    for kind in kinds:
+        fixtures[kind] = {}
+        for _ in range(docs):
+            name = f"BENCH_{kind}_{file_id:06d}"
+            content = make_pages(file_id, pages, samples)
+            if kind == "scanned":
+                write_scanned_pdf(container / f"{name}.pdf", content, dpi)
+            else:
+                write_text_pdf(container / f"{name}.pdf", content)
+            fixtures[kind][file_id] = {
+                "pdf_name": f"{name}.pdf",
+                "number": file_id,
+                "year": 2023,
+                "month": "Enero",
+                "account_number_homologated": "1001210002790",
+            }
+            file_id += 1
+    return fixtures
+
+
+class FakeSqlServer:
+    """
+    Conexión pyodbc falsa con las tres tablas que lee db_conector, en memoria: el benchmark
+    corre el código real de db_conection / db_metadata_batch. Cada execute es un viaje al
+    servidor y cuesta `latency_s` simulados.
+    """
+    FILES = ("file_id", "consecutive", "file_type", "pdf_name", "file_path", "file_url", "creation_date",
+             "payments_accounts_relation_id")
+    PAYMENTS = ("payments_accounts_relation_id", "payment_date", "number",
+                *(f"col_{i}" for i in range(3, 16)), "higher_account_id")
+    HIGHER = ("higher_account_id", "code", "name", "level", "account_number_homologated")
+
+    def __init__(self, rows, latency_s=0.0):
+        months = {name: n for n, name in _db_conector().meses_es.items()}
+        self.latency_s = latency_s
+        self.round_trips = 0
+        self.files, self.payments, self.higher = {}, {}, {}
+        for file_id, meta in rows.items():
+            self.files[file_id] = (file_id, file_id, "pdf", meta["pdf_name"], None, None, None, file_id)
+            self.payments[file_id] = (file_id, date(meta["year"], months[meta["month"]], 1), float(meta["number"]),
+                                      *([None] * 13), file_id)
+            self.higher[file_id] = (file_id, None, None, None, meta["account_number_homologated"])
+
+    def round_trip(self):
+        self.round_trips += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+    def cursor(self):
+        return _FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _FakeCursor:
+    def __init__(self, server):
+        self.server = server
+        self.description = None
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        s, params = self.server, list(params)
+        s.round_trip()
+        self.description, self._rows = None, []
+        if "TOP 0" in sql:
+            cols = s.FILES if "tbl_files_op_final" in sql else s.PAYMENTS if "payments_accounts" in sql else s.HIGHER
+            # Como en pyodbc: una tupla por columna con el nombre en la primera posición
+            self.description = [(c,) for c in cols]
+        elif " JOIN " in sql:
+            ids = range(params[0], params[1] + 1) if "BETWEEN" in sql else params
+            for i in ids:
+                if i in s.files:
+                    f = s.files[i]
+                    p = s.payments[f[7]]
+                    self._rows.append((f[1], f[3], p[1], p[2], s.higher[p[16]][4]))
+        else:
+            table = (s.files if "tbl_files_op_final" in sql else
+                     s.payments if "tbl_payments_accounts_relation_final" in sql else s.higher)
+            if params and params[0] in table:
+                self._rows = [table[params[0]]]
+        return self
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        pass
+
+
+def _db_conector():
+    """
+    Importa db_conector. Si pyodbc no se puede importar (sin unixODBC), registra antes un
+    módulo mínimo para que cargue; el benchmark nunca se conecta a SQL Server.
+    """
+    try:
+        import pyodbc  # noqa: F401
+    except ImportError:
+        stub = types.ModuleType("pyodbc")
+
+        def connect(*args, **kwargs):
+            raise RuntimeError("benchmark offline: no hay conexión a SQL Server")
+
+        stub.connect = connect
+        stub.Error = type("Error", (Exception,), {})
+        sys.modules["pyodbc"] = stub
+    import db_conector
+    return db_conector
+
+
+def use_fake_sql(server):
+    """Todas las consultas de db_conector (y de pdf-to-chunks) van a `server`."""
+    db = _db_conector()
+    db.get_connection = lambda: server
+    return db
+
+
+def load_chunks_module():
+    """pdf-to-chunks.py no es importable por nombre (guiones): se carga desde su ruta."""
+    # Importa db_conector con pyodbc o sin él (ver _db_conector)
+    _db_conector()
+    spec = importlib.util.spec_from_file_location("pdf_to_chunks", HERE / "pdf-to-chunks.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _measure(fn):
+    """(resultado, segundos, pico RSS MB) de fn(); el pico se reinicia antes donde se puede (Linux)."""
+    reset_peak_rss()
+    t0 = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - t0
+    peak = peak_rss_mb()
+    return result, seconds, None if peak is None else round(peak, 1)
+
+
+def _rate(n, seconds):
+    return round(n / seconds, 3) if seconds > 0 else None
+
+
+def bench_chunk_text(chunks_mod, samples, repeat=5, min_s=0.2):
+    """chunk_text sobre ~1,6 MB de texto; cada repetición llama en bucle hasta `min_s` y se toma la mejor."""
+    text = "\n\n".join(samples * 200)
+    reset_peak_rss()
+    best = None
+    for _ in range(repeat):
+        loops, t0 = 0, time.perf_counter()
+        while True:
+            parts = chunks_mod.chunk_text(text)
+            loops += 1
+            seconds = time.perf_counter() - t0
+            if seconds >= min_s:
+                break
+        best = seconds / loops if best is None else min(best, seconds / loops)
+    peak = peak_rss_mb()
+    return {
+        "chars": len(text),
+        "chunks": len(parts),
+        "seconds": round(best, 6),
+        "chunks_per_s": _rate(len(parts), best),
+        "mb_per_s": _rate(len(text.encode("utf-8")) / 1e6, best),
+        "peak_rss_mb": None if peak is None else round(peak, 1),
+    }
+
+
+def bench_metadata(rows, latency_s, n=500):
+    """Documentos por segundo con db_conection (3 consultas por documento) vs iter_metadata (por lotes)."""
+    # n ids contiguos con los metadatos de los fixtures, como un barrido por rango
+    metas = list(rows.values())
+    rows = {i: metas[i % len(metas)] for i in range(1, n + 1)}
+    ids = list(rows)
+    per_doc = FakeSqlServer(rows, latency_s)
+    db = use_fake_sql(per_doc)
+    # db_conection imprime cada fila encontrada
+    with redirect_stdout(io.StringIO()):
+        _, per_doc_s, _ = _measure(lambda: [db.db_conection(i, "op") for i in ids])
+    batched = FakeSqlServer(rows, latency_s)
+    db.get_connection = lambda: batched
+    _, batched_s, _ = _measure(lambda: list(db.iter_metadata(ids, "op")))
+    return {
+        "docs": n,
+        "latency_ms": latency_s * 1000,
+        "per_doc_round_trips": per_doc.round_trips,
+        "batched_round_trips": batched.round_trips,
+        "per_doc_docs_per_s": _rate(n, per_doc_s),
+        "batched_docs_per_s": _rate(n, batched_s),
+    }
+
+
+def bench_pipeline(chunks_mod, rows, work, kind, latency_s=0.0):
+    """Corre run_pipeline completo (descarga local → texto/OCR → chunks → subida local) sobre un tipo de PDF."""
+    from ocr_pages import OcrPool
+    use_fake_sql(FakeSqlServer(rows, latency_s))
+    chunks_mod.DOWNLOAD_DIR = str(work / "descargas")
+    recorder = MetricsRecorder(f"bench_{kind}", out_dir=work / "metrics", profile_every=0)
+    log = chunks_mod.get_logger("chunks")
+    with OcrPool() as ocr_pool:
+        (ok, fail), seconds, peak = _measure(
+            lambda: chunks_mod.run_pipeline(list(rows), log, cache=None, metrics=recorder, ocr_pool=ocr_pool))
+    summary = recorder.summary()
+    recorder.close()
+    # El recorder reinicia VmHWM entre documentos: el pico de la etapa es el mayor de los dos
+    if peak is not None:
+        peak = max(peak, summary["peak_rss_mb"])
+    totals = summary["totals"]
+    children = children_peak_rss_mb()
+    return {
+        "docs": len(rows),
+        "ok": ok,
+        "fail": fail,
+        "pages": totals.get("pages", 0),
+        "pages_ocr": totals.get("pages_ocr", 0),
+        "chunks": totals.get("chunks", 0),
+        "seconds": round(seconds, 3),
+        "pages_per_s": _rate(totals.get("pages", 0), seconds),
+        "chunks_per_s": _rate(totals.get("chunks", 0), seconds),
+        "stages_s": summary["stages_s"],
+        "render_cpu_s": totals.get("render_cpu_s"),
+        "ocr_cpu_s": totals.get("ocr_cpu_s"),
+        "peak_rss_mb": peak,
+        # Pico de un worker del OcrPool en una página (los workers viven toda la corrida)
+        "ocr_peak_rss_mb": summary.get("ocr_peak_rss_mb"),
+        "children_peak_rss_mb": None if children is None else round(children, 1),
+    }
+
+
+def collect_chunks(store_root, out_path):
+    """Une los JSONL subidos al contenedor local de chunks en un solo archivo (entrada de embed_chunks)."""
+    n = 0
+    with open(out_path, "w", encoding="utf-8") as out:
+        for path in sorted((Path(store_root) / "v-ia-op").glob("*.jsonl")):
+            for line in path.read_text(encoding="utf-8").splitlines():
+                if line.strip():
+                    out.write(line + "\n")
+                    n += 1
+    return n
+
+
+def bench_embed(in_path, work, backend="torch", batch_size=64):
+    import embed_chunks
+    recorder = MetricsRecorder("bench_embeddings", out_dir=work / "metrics", profile_every=0)
+    total, seconds, peak = _measure(lambda: embed_chunks.main(
+        str(in_path), str(work / "vectors.jsonl"), batch_size, backend=backend, use_cache=False, metrics=recorder))
+    summary = recorder.summary()
+    recorder.close()
+    return {
+        "backend": backend,
+        "chunks": total,
+        "seconds": round(seconds, 3),
+        "embeddings_per_s": _rate(total, seconds),
+        "stages_s": summary["stages_s"],
+        "peak_rss_mb": peak,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance=BENCH_TOLERANCE):
+    """Lista de regresiones: tasas (*_per_s) que bajan o picos de memoria que suben más de `tolerance`."""
+    regressions = []
+    for stage, cur in results["stages"].items():
+        if stage in UNGATED_STAGES:
+            continue
+        base = baseline.get("stages", {}).get(stage)
+        if not isinstance(base, dict) or not isinstance(cur, dict):
+            continue
+        for key, value in cur.items():
+            old = base.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            if key.endswith("_per_s") and change < -tolerance:
+                regressions.append({"stage": stage, "metric": key, "baseline": old, "current": value,
+                                    "change": round(change, 4)})
+            elif key.endswith("peak_rss_mb") and change > tolerance:
+                regressions.append({"stage": stage, "metric": key, "baseline": old, "current": value,
+                                    "change": round(change, 4)})
+    return regressions
+
+
+def print_report(results):
+    print(f"\n📊 Benchmark {results['meta']['commit'] or ''} ({results['meta']['config']})")
+    for stage, r in results["stages"].items():
+        if "skipped" in r:
+            print(f"{stage:18s} omitido: {r['skipped']}")
+            continue
+        rates = "  ".join(f"{k}={v}" for k, v in r.items() if k.endswith("_per_s"))
+        peak = f"  pico RSS={r['peak_rss_mb']} MB" if r.get("peak_rss_mb") is not None else ""
+        print(f"{stage:18s} {rates}{peak}")
+        if r.get("stages_s"):
+            print(f"{'':18s} etapas (s): {r['stages_s']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline del pipeline PDF → chunks → embeddings")
+    parser.add_argument("--docs", type=int, default=4, help="documentos por tipo de PDF")
+    parser.add_argument("--pages", type=int, default=10, help="páginas por documento")
+    parser.add_argument("--kinds", default=",".join(KINDS), help="digital, scanned o ambos separados por coma")
+    parser.add_argument("--dpi", type=int, default=200, help="resolución de las páginas escaneadas sintéticas")
+    parser.add_argument("--sql-latency-ms", type=float, default=0.0, help="latencia simulada por viaje a SQL")
+    parser.add_argument("--embed-backend", default="torch", help="backend de embed_chunks (torch, onnx, ...)")
+    parser.add_argument("--skip-embed", action="store_true", help="no medir embeddings (evita cargar el modelo)")
+    parser.add_argument("--repeat", type=int, default=5, help="repeticiones de chunk_text (se toma la mejor)")
+    parser.add_argument("--out", default=None, help="JSON de resultados (por defecto metrics/bench_<fecha>.json)")
+    parser.add_argument("--baseline", default=None, help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE)
+    parser.add_argument("--keep", action="store_true", help="conserva la carpeta temporal con los PDFs")
+    args = parser.parse_args()
+
+    kinds = [k.strip() for k in args.kinds.split(",") if k.strip()]
+    unknown = set(kinds) - set(KINDS)
+    if unknown:
+        parser.error(f"tipos desconocidos: {sorted(unknown)}")
+    work = Path(tempfile.mkdtemp(prefix="bench_pipeline_"))
+    # El almacenamiento se resuelve en la primera llamada a get_store(): debe apuntar a la carpeta local antes
+    os.environ["BLOB_LOCAL_DIR"] = str(work / "blob")
+    latency_s = args.sql_latency_ms / 1000
+    config = {"docs": args.docs, "pages": args.pages, "kinds": kinds, "dpi": args.dpi,
+              "sql_latency_ms": args.sql_latency_ms, "embed_backend": args.embed_backend,
+              "ocr_workers": os.getenv("OCR_WORKERS"), "chunk_mode": os.getenv("CHUNK_MODE", "chars")}
+    results = {
+        "meta": {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": config,
+        },
+        "stages": {},
+    }
+    try:
+        print(f"🧪 Generando {args.docs}×{args.pages} páginas por tipo ({', '.join(kinds)}) en {work}")
+        fixtures, gen_s, _ = _measure(lambda: build_fixtures(work / "blob", kinds, args.docs, args.pages, args.dpi))
+        print(f"   listo en {gen_s:.1f} s")
+
+        chunks_mod = load_chunks_module()
+        samples = load_sample_pages()
+        results["stages"]["chunk_text"] = bench_chunk_text(chunks_mod, samples, args.repeat)
+        results["stages"]["sql_metadata"] = bench_metadata(
+            {k: v for rows in fixtures.values() for k, v in rows.items()}, latency_s)
+        for kind in kinds:
+            missing = [tool for tool in REQUIRED_TOOLS[kind] if not shutil.which(tool)]
+            if missing:
+                results["stages"][f"pipeline_{kind}"] = {"skipped": f"faltan {', '.join(missing)} en el PATH"}
+                continue
+            results["stages"][f"pipeline_{kind}"] = bench_pipeline(chunks_mod, fixtures[kind], work, kind, latency_s)
+
+        if args.skip_embed:
+            results["stages"]["embed"] = {"skipped": "--skip-embed"}
+        else:
+            n = collect_chunks(work / "blob", work / "chunks.jsonl")
+            try:
+                results["stages"]["embed"] = bench_embed(work / "chunks.jsonl", work, args.embed_backend)
+            except Exception as e:  # modelo no descargado, backend sin dependencias, ...
+                results["stages"]["embed"] = {"skipped": f"{type(e).__name__}: {e}", "chunks": n}
+    finally:
+        if args.keep:
+            print(f"📁 Fixtures conservados en {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    print_report(results)
+    status = 0
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        results["baseline"] = {"path": args.baseline, "commit": baseline.get("meta", {}).get("commit"),
+                               "tolerance": args.tolerance}
+        results["regressions"] = compare(results, baseline, args.tolerance)
+        if results["regressions"]:
+            status = 1
+            print(f"\n❌ {len(results['regressions'])} regresiones frente a {args.baseline} (tolerancia {args.tolerance:.0%}):")
+            for r in results["regressions"]:
+                print(f"   {r['stage']}.{r['metric']}: {r['baseline']} → {r['current']} ({r['change']:+.1%})")
+        else:
+            print(f"\n✅ Sin regresiones frente a {args.baseline} (tolerancia {args.tolerance:.0%})")
+
+    out = Path(args.out or Path("metrics") / f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"💾 Resultados en {out}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
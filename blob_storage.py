@@ -0,0 +1,198 @@
+import os, sys, json, shutil, hashlib, argparse, tempfile, threading
+from functools import lru_cache
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Descargas por rangos en paralelo y subidas por bloques (azure-storage-blob)
+BLOB_MAX_CONCURRENCY = int(os.getenv("BLOB_MAX_CONCURRENCY", 4))
+BLOB_CHUNK_MB = int(os.getenv("BLOB_CHUNK_MB", 4))
+# La salida JSONL se arma en memoria hasta este tamaño; si lo supera, pasa a disco
+UPLOAD_SPOOL_MB = int(os.getenv("UPLOAD_SPOOL_MB", 16))
+# Si está definido, los contenedores son carpetas locales (pruebas y benchmark sin Azure)
+BLOB_LOCAL_DIR = os.getenv("BLOB_LOCAL_DIR")
+
+
+def _spool_jsonl(records):
+    f = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MB * 1024 * 1024, mode="w+b")
+    for i, r in enumerate(records):
+        if i:
+            f.write(b"\n")
+        f.write(json.dumps(r, ensure_ascii=False).encode("utf-8"))
+    size = f.tell()
+    f.seek(0)
+    return f, size
+
+
+class AzureBlobStore:
+    """
+    Un BlobServiceClient por proceso (pool HTTP reutilizado) y un ContainerClient por contenedor.
+    Funciona igual contra Azurite con AZURE_STORAGE_CONNECTION_STRING="UseDevelopmentStorage=true".
+    """
+
+    def __init__(self, conn_str):
+        from azure.storage.blob import BlobServiceClient
+        chunk = BLOB_CHUNK_MB * 1024 * 1024
+        self.service = BlobServiceClient.from_connection_string(
+            conn_str, max_single_get_size=chunk, max_chunk_get_size=chunk,
+            max_single_put_size=chunk, max_block_size=chunk,
+        )
+        self._containers = {}
+        self._lock = threading.Lock()
+
+    def container(self, name):
+        with self._lock:
+            if name not in self._containers:
+                self._containers[name] = self.service.get_container_client(name)
+            return self._containers[name]
+
+    def download_to_file(self, container, blob_name, path, max_concurrency=BLOB_MAX_CONCURRENCY):
+        """Descarga en streaming al archivo (rangos en paralelo); devuelve el ETag del blob."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        downloader = self.container(container).download_blob(blob_name, max_concurrency=max_concurrency)
+        with open(path, "wb") as f:
+            downloader.readinto(f)
+        return downloader.properties.etag
+
+    def upload_jsonl(self, container, blob_name, records, metadata=None, max_concurrency=BLOB_MAX_CONCURRENCY):
+        """Sube los registros como JSONL sin armar el string completo en memoria; devuelve el ETag."""
+        f, size = _spool_jsonl(records)
+        with f:
+            result = self.container(container).get_blob_client(blob_name).upload_blob(
+                f, length=size, overwrite=True, metadata=metadata, max_concurrency=max_concurrency
+            )
+        return result["etag"]
+
+    def list_props(self, container, prefix=None):
+        """{nombre: {etag, size, metadata}} de todo el contenedor en una sola paginación."""
+        return {
+            b.name: {"etag": b.etag, "size": b.size, "metadata": b.metadata or {}}
+            for b in self.container(container).list_blobs(name_starts_with=prefix, include=["metadata"])
+        }
+
+    def create_container(self, name):
+        from azure.core.exceptions import ResourceExistsError
+        try:
+            self.service.create_container(name)
+        except ResourceExistsError:
+            pass
+
+    def delete_container(self, name):
+        self.service.delete_container(name)
+        with self._lock:
+            self._containers.pop(name, None)
+
+
+class LocalBlobStore:
+    """Mismo contrato que AzureBlobStore sobre carpetas: <root>/<contenedor>/<blob> + <blob>.meta.json."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    @staticmethod
+    def _etag(path):
+        st = path.stat()
+        return '"' + hashlib.md5(f"{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest() + '"'
+
+    def download_to_file(self, container, blob_name, path, max_concurrency=BLOB_MAX_CONCURRENCY):
+        src = self.root / container / blob_name
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(src, path)
+        return self._etag(src)
+
+    def upload_jsonl(self, container, blob_name, records, metadata=None, max_concurrency=BLOB_MAX_CONCURRENCY):
+        dst = self.root / container / blob_name
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        f, _ = _spool_jsonl(records)
+        with f, open(dst, "wb") as out:
+            shutil.copyfileobj(f, out)
+        with open(f"{dst}.meta.json", "w", encoding="utf-8") as m:
+            json.dump(metadata or {}, m)
+        return self._etag(dst)
+
+    def list_props(self, container, prefix=None):
+        base = self.root / container
+        out = {}
+        for p in base.rglob("*") if base.exists() else []:
+            if not p.is_file() or p.name.endswith(".meta.json"):
+                continue
+            name = p.relative_to(base).as_posix()
+            if prefix and not name.startswith(prefix):
+                continue
+            meta = Path(f"{p}.meta.json")
+            out[name] = {
+                "etag": self._etag(p),
+                "size": p.stat().st_size,
+                "metadata": json.loads(meta.read_text(encoding="utf-8")) if meta.exists() else {},
+            }
+        return out
+
+    def create_container(self, name):
+        (self.root / name).mkdir(parents=True, exist_ok=True)
+
+    def delete_container(self, name):
+        shutil.rmtree(self.root / name, ignore_errors=True)
+
+
+@lru_cache(maxsize=1)
+def get_store():
+    """Almacenamiento compartido por el proceso (hilos incluidos). Nunca imprime la cadena de conexión."""
+    load_dotenv()
+    local_dir = os.getenv("BLOB_LOCAL_DIR", BLOB_LOCAL_DIR)
+    if local_dir:
+        return LocalBlobStore(local_dir)
+    conn = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    if not conn:
+        raise RuntimeError("Falta AZURE_STORAGE_CONNECTION_STRING (o BLOB_LOCAL_DIR para carpetas locales).")
+    return AzureBlobStore(conn)
+
+
+def is_up_to_date(output_props, output_blob, source_etag):
+    """True si la salida existe y se generó a partir de esta versión (ETag) del PDF de origen."""
+    props = output_props.get(output_blob)
+    return bool(props and source_etag and props["metadata"].get("source_etag") == source_etag)
+
+
+def selftest(store):
+    """Ida y vuelta contra el almacenamiento configurado (p. ej. Azurite): descarga, subida y listado."""
+    container = "selftest-blob-storage"
+    store.create_container(container)
+    try:
+        payload = os.urandom(3 * BLOB_CHUNK_MB * 1024 * 1024 + 123)
+        records = [{"id": i, "content": "página ñ " * 50} for i in range(2000)]
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp) / "src.bin"
+            src.write_bytes(payload)
+            if isinstance(store, AzureBlobStore):
+                with open(src, "rb") as f:
+                    store.container(container).upload_blob("doc.pdf", f, overwrite=True)
+            else:
+                shutil.copyfile(src, store.root / container / "doc.pdf")
+            etag = store.download_to_file(container, "doc.pdf", Path(tmp) / "out.bin")
+            assert (Path(tmp) / "out.bin").read_bytes() == payload, "la descarga no coincide"
+        store.upload_jsonl(container, "doc.jsonl", records, metadata={"source_etag": etag})
+        props = store.list_props(container)
+        assert set(props) == {"doc.pdf", "doc.jsonl"}, f"listado inesperado: {sorted(props)}"
+        assert is_up_to_date(props, "doc.jsonl", etag), "la marca source_etag no se guardó"
+        assert not is_up_to_date(props, "doc.jsonl", '"otro"')
+        print(f"✅ Selftest OK ({type(store).__name__}): {len(payload)} bytes descargados, "
+              f"{len(records)} registros subidos, ETag verificado")
+    finally:
+        store.delete_container(container)
+
+
+if __name__ == "__main__":
+    # Uso:
+    #   AZURE_STORAGE_CONNECTION_STRING="UseDevelopmentStorage=true" python blob_storage.py --selftest   (Azurite)
+    #   BLOB_LOCAL_DIR=./blob_local python blob_storage.py --selftest
+    #   python blob_storage.py --list v-ia-op
+    parser = argparse.ArgumentParser(description="Capa de acceso a Azure Blob Storage")
+    parser.add_argument("--selftest", action="store_true")
+    parser.add_argument("--list", metavar="CONTENEDOR")
+    args = parser.parse_args()
+    if args.selftest:
+        selftest(get_store())
+    elif args.list:
+        for name, p in sorted(get_store().list_props(args.list).items()):
+            print(f"{p['size']:>12}  {p['etag']}  {name}")
+    sys.exit(0)
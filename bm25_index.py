@@ -0,0 +1,278 @@
+import os, re, sys, json, heapq, argparse, tempfile, unicodedata
+from pathlib import Path
+
+import numpy as np
+
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+# Postings acumulados en memoria antes de volcar un run ordenado a disco
+BM25_RUN_POSTINGS = int(os.getenv("BM25_RUN_POSTINGS", 5_000_000))
+RRF_K = 60
+
+# Números con separadores (cuentas, NIT, valores como 9,860,000.00 o 9.860.000,00) o palabras
+_TOKEN = re.compile(r"\d(?:[\d.,/-]*\d)?|[a-z]+")
+# Decimales al final de un valor: ",00" o ".00"
+_DECIMALS = re.compile(r"[.,]\d{2}$")
+# Confusiones típicas del OCR dentro de números: 1OO1 → 1001, 2l5 → 215
+_OCR_DIGITS = re.compile(r"\d[\doli]*\d")
+_OCR_FIX = str.maketrans("oli", "011")
+# Palabras vacías frecuentes en las OP (sin tildes, ya normalizadas)
+STOPWORDS = frozenset("""
+a al con de del el en es la las lo los o para por que se su sus un una y e u no si
+""".split())
+
+
+def normalize(text):
+    """
+    Minúsculas y sin tildes (NFKD): 'OPERACIÓN' → 'operacion'; la ñ queda como n.
+    También corrige O/l leídas por el OCR en medio de un número.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _OCR_DIGITS.sub(lambda m: m.group().translate(_OCR_FIX), text)
+
+
+def tokenize(text):
+    """
+    Tokens para el índice. Los números se conservan completos con sus separadores y además
+    se agrega la variante solo-dígitos para que '9,860,000.00', '9.860.000,00' y '9860000'
+    coincidan. En valores con decimales la variante es la parte entera ('9860000') más la forma
+    canónica ('9860000.00'), nunca enteros y decimales pegados: '1.50' no debe coincidir con '150'.
+    Las palabras de una letra (ruido típico del OCR) se descartan.
+    """
+    tokens = []
+    for tok in _TOKEN.findall(normalize(text)):
+        if tok[0].isdigit():
+            tokens.append(tok)
+            if _DECIMALS.search(tok):
+                integer = re.sub(r"\D", "", tok[:-3])
+                variants = [integer, f"{integer}.{tok[-2:]}"] if integer else []
+            else:
+                variants = [re.sub(r"\D", "", tok)]
+            tokens.extend(v for v in variants if v != tok)
+        elif len(tok) > 1 and tok not in STOPWORDS:
+            tokens.append(tok)
+    return tokens
+
+
+# ---------------- Varint (vectorizado con NumPy) ----------------
+def varint_encode(values):
+    """Codifica enteros no negativos en varint (7 bits por byte, bit alto = continúa)."""
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b""
+    nbytes = 1 + sum((values >> np.uint64(s)) > 0 for s in range(7, 64, 7)).astype(np.int64)
+    reps = np.repeat(values, nbytes)
+    starts = np.concatenate([[0], np.cumsum(nbytes)[:-1]])
+    pos = np.arange(len(reps)) - np.repeat(starts, nbytes)
+    out = ((reps >> (7 * pos).astype(np.uint64)) & np.uint64(0x7F)).astype(np.uint8)
+    last = np.zeros(len(reps), dtype=bool)
+    last[np.cumsum(nbytes) - 1] = True
+    out[~last] |= 0x80
+    return out.tobytes()
+
+
+def varint_decode(buf):
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    lengths = ends - starts + 1
+    pos = np.arange(len(data)) - np.repeat(starts, lengths)
+    parts = (data & 0x7F).astype(np.uint64) << (7 * pos).astype(np.uint64)
+    return np.add.reduceat(parts, starts).astype(np.int64)
+
+
+def encode_postings(doc_ids, tfs):
+    """Postings de un término: gaps de doc_id y luego frecuencias, ambos en varint."""
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    gaps = np.diff(doc_ids, prepend=0)
+    return varint_encode(gaps) + varint_encode(tfs)
+
+
+def decode_postings(buf, df):
+    values = varint_decode(buf)
+    return np.cumsum(values[:df]), values[df:]
+
+
+# ---------------- Construcción en streaming ----------------
+def _iter_chunks(paths):
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _write_run(postings, path):
+    """Run ordenado por término: una línea JSON por término con (doc_ids, tfs)."""
+    with open(path, "w", encoding="utf-8") as f:
+        for term in sorted(postings):
+            docs, tfs = zip(*postings[term])
+            f.write(json.dumps([term, docs, tfs], ensure_ascii=False) + "\n")
+
+
+def _read_run(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def build_index(jsonl_paths, out_dir, run_postings=BM25_RUN_POSTINGS):
+    """
+    Indexa `content` de los JSONL de chunks (salida de pdf-to-chunks.py / embed_chunks.py)
+    sin cargar el corpus: los postings se acumulan hasta `run_postings`, se vuelcan a runs
+    ordenados y al final se mezclan. El número de documento es la posición del chunk en
+    la secuencia de archivos (coincide con la fila del VectorStore si se construyó igual).
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix="bm25_", dir=out))
+    runs, postings, pending = [], {}, 0
+    doc_lens = []
+    n_docs = 0
+    with open(out / "ids.txt", "w", encoding="utf-8") as ids_file:
+        for chunk in _iter_chunks(jsonl_paths):
+            tokens = tokenize(chunk.get("content") or "")
+            tf = {}
+            for t in tokens:
+                tf[t] = tf.get(t, 0) + 1
+            for t, c in tf.items():
+                postings.setdefault(t, []).append((n_docs, c))
+            pending += len(tf)
+            doc_lens.append(len(tokens))
+            ids_file.write(f"{chunk.get('id', n_docs)}\n")
+            n_docs += 1
+            if pending >= run_postings:
+                runs.append(tmp / f"run_{len(runs)}.jsonl")
+                _write_run(postings, runs[-1])
+                postings, pending = {}, 0
+    if postings:
+        runs.append(tmp / f"run_{len(runs)}.jsonl")
+        _write_run(postings, runs[-1])
+
+    # Mezcla de runs: los doc_ids de cada run son crecientes y los runs están en orden
+    terms, lexicon = [], []
+    offset = 0
+    with open(out / "postings.bin", "wb") as pf:
+        merged = heapq.merge(*(_read_run(r) for r in runs), key=lambda e: e[0])
+        current, docs, tfs = None, [], []
+
+        def flush():
+            nonlocal offset
+            buf = encode_postings(docs, tfs)
+            pf.write(buf)
+            terms.append(current)
+            lexicon.append((offset, len(buf), len(docs)))
+            offset += len(buf)
+
+        for term, d, t in merged:
+            if term != current:
+                if current is not None:
+                    flush()
+                current, docs, tfs = term, [], []
+            docs.extend(d)
+            tfs.extend(t)
+        if current is not None:
+            flush()
+
+    with open(out / "terms.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(terms))
+    np.save(out / "lexicon.npy", np.asarray(lexicon, dtype=np.int64).reshape(-1, 3))
+    np.save(out / "doc_lens.npy", np.asarray(doc_lens, dtype=np.int32))
+    with open(out / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump({"docs": n_docs, "terms": len(terms),
+                   "avgdl": float(np.mean(doc_lens)) if doc_lens else 0.0}, f, indent=2)
+    for r in runs:
+        r.unlink()
+    tmp.rmdir()
+    return n_docs, len(terms)
+
+
+class BM25Index:
+    """Índice invertido en disco: léxico en memoria, postings con np.memmap."""
+
+    def __init__(self, index_dir, k1=BM25_K1, b=BM25_B):
+        d = Path(index_dir)
+        with open(d / "manifest.json", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.n_docs, self.avgdl = manifest["docs"], manifest["avgdl"] or 1.0
+        self.k1, self.b = k1, b
+        with open(d / "terms.txt", encoding="utf-8") as f:
+            self.terms = {t: i for i, t in enumerate(f.read().split("\n"))} if manifest["terms"] else {}
+        self.lexicon = np.load(d / "lexicon.npy")
+        self.doc_lens = np.load(d / "doc_lens.npy")
+        size = os.path.getsize(d / "postings.bin")
+        self.postings = np.memmap(d / "postings.bin", dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+        with open(d / "ids.txt", encoding="utf-8") as f:
+            self.ids = f.read().splitlines()
+        # Normalización de longitud precalculada: k1 * (1 - b + b * dl / avgdl)
+        self._norm = (self.k1 * (1 - self.b + self.b * self.doc_lens / self.avgdl)).astype(np.float32)
+
+    def __len__(self):
+        return self.n_docs
+
+    def postings_of(self, term):
+        i = self.terms.get(term)
+        if i is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        offset, length, df = self.lexicon[i]
+        return decode_postings(self.postings[offset:offset + length].tobytes(), int(df))
+
+    def search(self, query, k=10):
+        """Top-k (números de documento, puntajes BM25) para una consulta en texto libre."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in dict.fromkeys(tokenize(query)):
+            docs, tfs = self.postings_of(term)
+            if not len(docs):
+                continue
+            idf = np.log1p((self.n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            tfs = tfs.astype(np.float32)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[docs])
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return hits, scores[hits]
+
+
+def rrf_fuse(ranked_lists, k=RRF_K, top=None):
+    """
+    Reciprocal Rank Fusion: suma 1 / (k + rango) de cada lista (rango desde 1).
+    `ranked_lists` son secuencias de ids ya ordenadas (p. ej. BM25 y vectores).
+    Devuelve [(id, puntaje)] de mayor a menor.
+    """
+    fused = {}
+    for ranking in ranked_lists:
+        for rank, doc in enumerate(ranking, start=1):
+            fused[doc] = fused.get(doc, 0.0) + 1.0 / (k + rank)
+    ordered = sorted(fused.items(), key=lambda x: -x[1])
+    return ordered[:top] if top else ordered
+
+
+if __name__ == "__main__":
+    # Uso:
+    #   python bm25_index.py build index_dir chunks_a.jsonl chunks_b.jsonl ...
+    #   python bm25_index.py search index_dir "1001210002790" --k 10
+    parser = argparse.ArgumentParser(description="Índice BM25 local sobre el contenido de los chunks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("build")
+    p.add_argument("index_dir")
+    p.add_argument("jsonl", nargs="+")
+    p = sub.add_parser("search")
+    p.add_argument("index_dir")
+    p.add_argument("query")
+    p.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        docs, terms = build_index(args.jsonl, args.index_dir)
+        print(f"✅ {docs} chunks indexados, {terms} términos → {args.index_dir}")
+    else:
+        index = BM25Index(args.index_dir)
+        docs, scores = index.search(args.query, args.k)
+        print(f"🔎 {tokenize(args.query)}")
+        for doc, score in zip(docs, scores):
+            print(f"{score:8.3f}  {index.ids[doc]}")
+    sys.exit(0)
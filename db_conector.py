@@ -1,6 +1,7 @@
 import pyodbc
 from dotenv import load_dotenv
 import os
+import threading
 
 meses_es = {
     1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
@@ -8,20 +9,45 @@ meses_es = {
     9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
 }
 
+load_dotenv()
+USER = os.getenv("SQLSERVER_USER")
+PASS = os.getenv("SQLSERVER_PASS")
+HOST = os.getenv("SQLSERVER_HOST")
+DB   = os.getenv("SQLSERVER_DB")
+SCHEMA = os.getenv("SQLSERVER_SCHEMA")
+
+conectionText = 'DRIVER={ODBC Driver 17 for SQL Server};'+ f'SERVER={HOST};DATABASE={DB};UID={USER};PWD={PASS};Encrypt=yes;TrustServerCertificate=yes;'
+# conectionText = 'DRIVER={ODBC Driver 18 for SQL Server};'+ f'SERVER={HOST};DATABASE={DB};UID={USER};PWD={PASS}' // maquina virtual
+
+# SQL Server admite como máximo 2100 parámetros por consulta
+METADATA_BATCH_SIZE = 1000
+
+# Una conexión por hilo, reutilizada entre llamadas (pyodbc no comparte conexiones entre hilos)
+_local = threading.local()
+_columns = {}
+
+
+def get_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = pyodbc.connect(conectionText)
+        _local.conn = conn
+    return conn
 
-def db_conection(file_id, typeFile):
-    load_dotenv()
-    USER = os.getenv("SQLSERVER_USER")
-    PASS = os.getenv("SQLSERVER_PASS")
-    HOST = os.getenv("SQLSERVER_HOST")
-    DB   = os.getenv("SQLSERVER_DB")
-    SCHEMA = os.getenv("SQLSERVER_SCHEMA")
-    
 
-    conectionText = 'DRIVER={ODBC Driver 17 for SQL Server};'+ f'SERVER={HOST};DATABASE={DB};UID={USER};PWD={PASS};Encrypt=yes;TrustServerCertificate=yes;'
-    # conectionText = 'DRIVER={ODBC Driver 18 for SQL Server};'+ f'SERVER={HOST};DATABASE={DB};UID={USER};PWD={PASS}' // maquina virtual
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        try:
+            conn.close()
+        except pyodbc.Error:
+            # La conexión ya estaba caída: basta con olvidarla
+            pass
 
-    conn = pyodbc.connect(conectionText)
+
+def db_conection(file_id, typeFile):
+    conn = get_connection()
 
     # Crear cursor
     cursor = conn.cursor()
@@ -74,12 +100,121 @@ def db_conection(file_id, typeFile):
                     }
         # print(cleanedRow[3])
         print(type(cleanedRow[3]))
+        cursor.close()
         return results
     else:
         print("No se encontró ningún registro con ese id.")
 
-    # Cerrar conexión
+    # Cerrar cursor (la conexión se reutiliza)
     cursor.close()
-    conn.close()
+
+
+def _column_names(cursor, table):
+    """Nombres de columnas de la tabla, en orden (se consultan una sola vez)."""
+    if table not in _columns:
+        cursor.execute(f"SELECT TOP 0 * FROM {SCHEMA}.{table}")
+        _columns[table] = [d[0] for d in cursor.description]
+    return _columns[table]
+
+
+def _batch_query(cursor, typeFile):
+    """
+    Consulta unida y proyectada equivalente a las tres de db_conection.
+    Las columnas se resuelven por la misma posición que usa db_conection.
+    """
+    if typeFile == "oc-c":
+        files = _column_names(cursor, "tbl_files")
+        return f"SELECT f.file_id, f.[{files[3]}] FROM {SCHEMA}.tbl_files f", "f.file_id"
+    if typeFile != "op":
+        raise ValueError("Tipo no reconocido. Usa 'oc-c' o 'op'.")
+    files = _column_names(cursor, "tbl_files_op_final")
+    payments = _column_names(cursor, "tbl_payments_accounts_relation_final")
+    higher = _column_names(cursor, "tbl_higher_accounts_new")
+    query = (
+        f"SELECT f.consecutive, f.[{files[3]}], p.[{payments[1]}], p.[{payments[2]}], h.[{higher[4]}] "
+        f"FROM {SCHEMA}.tbl_files_op_final f "
+        f"LEFT JOIN {SCHEMA}.tbl_payments_accounts_relation_final p "
+        f"ON p.payments_accounts_relation_id = f.[{files[7]}] "
+        f"LEFT JOIN {SCHEMA}.tbl_higher_accounts_new h "
+        f"ON h.higher_account_id = p.[{payments[16]}]"
+    )
+    return query, "f.consecutive"
+
+
+def _row_to_result(row):
+    pdf_name = row[1].strip() if isinstance(row[1], str) else row[1]
+    results = {
+        "pdf_name": pdf_name,
+        "number": None,
+        "year": None,
+        "month": None,
+        "account_number_homologated": None
+    }
+    if len(row) > 2 and row[3] is not None:
+        results.update({
+            "number": int(float(row[3])),
+            "year": row[2].year,
+            "month": meses_es[row[2].month],
+            "account_number_homologated": row[4]
+        })
+    return results
+
+
+def db_metadata_batch(file_ids, typeFile="op", batch_size=METADATA_BATCH_SIZE):
+    """
+    Resuelve los metadatos de muchos file_id con una consulta unida por lote sobre la
+    conexión reutilizada. Devuelve (resultados, faltantes): {file_id: dict igual al de
+    db_conection} y la lista de ids sin registro.
+    """
+    ids = list(dict.fromkeys(file_ids))
+    cursor = get_connection().cursor()
+    try:
+        query, key = _batch_query(cursor, typeFile)
+        found = {}
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            lo, hi = min(batch), max(batch)
+            if hi - lo + 1 == len(batch):
+                # Lote contiguo (p.ej. un range): basta un BETWEEN
+                cursor.execute(f"{query} WHERE {key} BETWEEN ? AND ?", (lo, hi))
+            else:
+                marks = ", ".join("?" * len(batch))
+                cursor.execute(f"{query} WHERE {key} IN ({marks})", batch)
+            for row in cursor.fetchall():
+                # Igual que fetchone() en db_conection: se queda el primer registro.
+                # Se indexa por texto para no depender del tipo SQL de la columna
+                found.setdefault(str(row[0]).strip(), _row_to_result(row))
+    finally:
+        cursor.close()
+    results = {i: found[str(i)] for i in ids if str(i) in found}
+    missing = [i for i in ids if i not in results]
+    return results, missing
+
+
+def iter_metadata(file_ids, typeFile="op", batch_size=METADATA_BATCH_SIZE):
+    """
+    Genera (file_id, resultado o None, error o None) en el orden de entrada, consultando por lotes.
+    Si un lote falla con un error de pyodbc (conexión caída, timeout) se descarta la conexión
+    del hilo y se reintenta una vez con una nueva; si vuelve a fallar, cada id del lote sale
+    con ese error y el barrido sigue con el lote siguiente.
+    """
+    file_ids = iter(file_ids)
+    while True:
+        batch = [i for _, i in zip(range(batch_size), file_ids)]
+        if not batch:
+            return
+        results, error = {}, None
+        for _ in range(2):
+            try:
+                results, _ = db_metadata_batch(batch, typeFile, batch_size)
+                error = None
+                break
+            except pyodbc.Error as e:
+                close_connection()
+                error = e
+        for file_id in batch:
+            yield file_id, results.get(file_id), error
+
+
 if __name__ == "__main__":
     print(db_conection(5706,"op"))
@@ -0,0 +1,127 @@
+import os, re, sys, json, argparse
+import numpy as np
+
+from ann_index import filter_union
+from bm25_index import normalize
+from log import get_logger
+
+# Similitud Jaccard estimada (shingles de caracteres) a partir de la cual dos chunks son el mismo
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.85))
+# 128 permutaciones en 16 bandas de 8 filas: candidatos desde Jaccard ≈ 0.7; luego se verifica el umbral
+MINHASH_PERM = 128
+LSH_BANDS = 16
+SHINGLE = 5
+
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(20240501)
+_A = _rng.integers(1, int(_PRIME), size=(MINHASH_PERM, 1), dtype=np.uint64)
+_B = _rng.integers(0, int(_PRIME), size=(MINHASH_PERM, 1), dtype=np.uint64)
+_SPACES = re.compile(r"\s+")
+# Campos que no se copian a las referencias (el texto es el del canónico)
+_HEAVY_FIELDS = ("content", "content_vector", "refs")
+
+
+def shingle_hashes(text):
+    """Hashes de los 5-gramas de caracteres del texto normalizado (minúsculas, sin tildes, espacios colapsados)."""
+    data = np.frombuffer(_SPACES.sub(" ", normalize(text)).strip().encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+    if len(data) < SHINGLE:
+        data = np.pad(data, (0, SHINGLE - len(data)))
+    # Hash polinomial de cada ventana de SHINGLE bytes, vectorizado
+    h = np.zeros(len(data) - SHINGLE + 1, dtype=np.uint64)
+    for j in range(SHINGLE):
+        h = (h * np.uint64(257) + data[j:len(data) - SHINGLE + 1 + j]) % _PRIME
+    return np.unique(h)
+
+
+def minhash(text):
+    hashes = shingle_hashes(text)
+    return ((_A * hashes + _B) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def _read_jsonl(paths):
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def find_duplicates(paths, threshold=DEDUP_THRESHOLD):
+    """
+    Primera pasada: asigna cada chunk al primer chunk parecido ya visto (canónico) usando
+    LSH por bandas y verificando la similitud estimada contra su firma. Se compara todo el
+    corpus: la plantilla repetida en miles de OP colapsa en un solo canónico. Solo se guardan
+    en memoria las firmas de los canónicos y las referencias de los duplicados.
+    Devuelve (canonical, refs): canonical[i] es el índice del canónico de i, refs {canónico: [ref]}.
+    """
+    rows = MINHASH_PERM // LSH_BANDS
+    buckets = [{} for _ in range(LSH_BANDS)]
+    signatures = {}
+    canonical, refs = [], {}
+    for i, chunk in enumerate(_read_jsonl(paths)):
+        sig = minhash(chunk.get("content") or "")
+        bands = [sig[b * rows:(b + 1) * rows].tobytes() for b in range(LSH_BANDS)]
+        match = None
+        seen = set()
+        for b, key in enumerate(bands):
+            for cand in buckets[b].get(key, ()):
+                if cand in seen:
+                    continue
+                seen.add(cand)
+                if np.mean(signatures[cand] == sig) >= threshold:
+                    match = cand
+                    break
+            if match is not None:
+                break
+        if match is None:
+            signatures[i] = sig
+            for b, key in enumerate(bands):
+                buckets[b].setdefault(key, []).append(i)
+            canonical.append(i)
+        else:
+            canonical.append(match)
+            refs.setdefault(match, []).append({k: v for k, v in chunk.items() if k not in _HEAVY_FIELDS})
+    return canonical, refs
+
+
+def dedup(paths, out_path, threshold=DEDUP_THRESHOLD):
+    """
+    Escribe solo los chunks canónicos, cada uno con `refs`: los duplicados que representa
+    (id, doc_id, page, chunk_idx y metadatos de la OP), y con <campo>_all: la unión de los
+    campos de filtro propios y de sus refs, para que un filtro por los valores de un
+    duplicado (otro año, cuenta u OP) encuentre al canónico. Segunda pasada en streaming
+    sobre la entrada, así el orden de salida es el original.
+    """
+    canonical, refs = find_duplicates(paths, threshold)
+    kept = 0
+    with open(out_path, "w", encoding="utf-8") as out:
+        for i, chunk in enumerate(_read_jsonl(paths)):
+            if canonical[i] != i:
+                continue
+            if i in refs:
+                chunk["refs"] = refs[i]
+            for f, values in filter_union(chunk).items():
+                chunk[f"{f}_all"] = values
+            out.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            kept += 1
+    total = len(canonical)
+    return {"total": total, "kept": kept, "duplicates": total - kept,
+            "dup_ratio": (total - kept) / total if total else 0.0}
+
+
+if __name__ == "__main__":
+    # Uso: python dedup_chunks.py chunks_a.jsonl [chunks_b.jsonl ...] -o chunks_dedup.jsonl [--threshold 0.85]
+    # Va entre pdf-to-chunks.py y embed_chunks.py: solo se codifican e indexan los canónicos.
+    parser = argparse.ArgumentParser(description="Elimina chunks casi duplicados (MinHash + LSH)")
+    parser.add_argument("inputs", nargs="+")
+    parser.add_argument("-o", "--out", required=True)
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD, help="Jaccard estimado mínimo")
+    args = parser.parse_args()
+
+    log = get_logger("dedup")
+    r = dedup(args.inputs, args.out, args.threshold)
+    msg = (f"{r['total']} chunks → {r['kept']} canónicos, {r['duplicates']} duplicados "
+           f"(ratio de duplicación {r['dup_ratio']:.1%}, umbral {args.threshold})")
+    print(f"🧹 {msg}")
+    log.info(f"Deduplicación {args.inputs}: {msg}")
+    sys.exit(0)
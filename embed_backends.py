@@ -0,0 +1,83 @@
+import os
+from pathlib import Path
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+# torch: un proceso (actual) | multiprocess: lotes repartidos entre núcleos |
+# onnx: ONNX Runtime fp32 | onnx-int8: ONNX con cuantización dinámica int8
+# (onnx requiere: pip install "sentence-transformers[onnx]")
+EMBED_BACKENDS = ("torch", "multiprocess", "onnx", "onnx-int8")
+ONNX_DIR = os.getenv("EMBED_ONNX_DIR", "./models/onnx")
+# Configuración de cuantización de optimum: arm64 | avx2 | avx512 | avx512_vnni
+ONNX_QUANT_CONFIG = os.getenv("EMBED_QUANT_CONFIG", "avx2")
+
+
+def _load_model(model_name, backend):
+    if backend in ("torch", "multiprocess"):
+        return SentenceTransformer(model_name)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx")
+
+    # onnx-int8: se exporta y cuantiza una sola vez; luego se carga desde disco
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    local_dir = Path(ONNX_DIR) / model_name.replace("/", "__")
+    file_name = f"onnx/model_qint8_{ONNX_QUANT_CONFIG}.onnx"
+    if not (local_dir / file_name).exists():
+        model = SentenceTransformer(model_name, backend="onnx")
+        model.save_pretrained(str(local_dir))
+        export_dynamic_quantized_onnx_model(model, ONNX_QUANT_CONFIG, str(local_dir))
+    return SentenceTransformer(str(local_dir), backend="onnx", model_kwargs={"file_name": file_name})
+
+
+class Encoder:
+    """Envoltorio común a todos los backends: recibe textos ya ordenados por longitud."""
+
+    def __init__(self, model_name, backend="torch", workers=None):
+        if backend not in EMBED_BACKENDS:
+            raise ValueError(f"Backend no reconocido: {backend}. Usa uno de {', '.join(EMBED_BACKENDS)}.")
+        self.backend = backend
+        self.model = _load_model(model_name, backend)
+        self.pool = None
+        if backend == "multiprocess":
+            workers = workers or os.cpu_count() or 1
+            # Cada worker con su parte de los hilos: evita sobre-suscribir núcleos
+            os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
+            self.pool = self.model.start_multi_process_pool(target_devices=["cpu"] * workers)
+
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    @property
+    def max_seq_length(self):
+        return self.model.max_seq_length
+
+    @property
+    def dim(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode_sorted(self, texts, batch_size=64):
+        """Vectores normalizados (float32) de `texts`, que llegan ordenados por longitud."""
+        if self.pool is not None:
+            # Trozos contiguos de la lista ordenada: cada proceso recibe longitudes parecidas
+            return self.model.encode_multi_process(
+                texts, self.pool, batch_size=batch_size, chunk_size=batch_size * 4, normalize_embeddings=True
+            ).astype(np.float32, copy=False)
+        out = [
+            # Una llamada por lote: encode() reordena por caracteres dentro de lo que recibe
+            self.model.encode(texts[i:i + batch_size], batch_size=batch_size, normalize_embeddings=True)
+            for i in range(0, len(texts), batch_size)
+        ]
+        return np.vstack(out).astype(np.float32, copy=False)
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+
+def cosine_agreement(reference, candidate):
+    """Coseno fila a fila entre dos matrices de vectores normalizados: media, mínimo y percentil 1."""
+    cos = np.sum(reference * candidate, axis=1)
+    return {"mean": float(cos.mean()), "min": float(cos.min()), "p01": float(np.percentile(cos, 1))}
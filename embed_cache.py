@@ -0,0 +1,94 @@
+import os, re, time, sqlite3, hashlib, unicodedata
+from pathlib import Path
+
+import numpy as np
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "./cache/embed_cache.sqlite")
+# Vectores máximos en caché (384 float32 ≈ 1.5 KB c/u); al superarlo se expulsan los menos usados
+EMBED_CACHE_MAX_ROWS = int(os.getenv("EMBED_CACHE_MAX_ROWS", 2_000_000))
+
+# Límite de parámetros por consulta en SQLite
+_SQL_BATCH = 500
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Normalización para la clave: Unicode NFC y espacios colapsados (ruido típico del OCR)."""
+    return _SPACES.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_id, text):
+    return hashlib.sha256(f"{model_id}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Caché persistente (SQLite) de vectores por hash del texto normalizado + modelo.
+    Los vectores se guardan como float32 crudo; el tamaño se acota por número de filas (LRU).
+    """
+
+    def __init__(self, path=EMBED_CACHE_PATH, max_rows=EMBED_CACHE_MAX_ROWS):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_access ON embeddings(last_access)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """Devuelve {key: vector float32} de las claves presentes y actualiza su último acceso."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), _SQL_BATCH):
+            batch = unique[start:start + _SQL_BATCH]
+            marks = ", ".join("?" * len(batch))
+            for key, blob in self.conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", batch):
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        if found:
+            now = time.time()
+            self.conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, k) for k in found])
+            self.conn.commit()
+        hits = sum(1 for k in keys if k in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items):
+        """Guarda {key: vector} y aplica el límite de filas."""
+        if not items:
+            return
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+            [(k, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in items.items()]
+        )
+        self.conn.commit()
+        self.evict()
+
+    def evict(self):
+        excess = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_rows
+        if excess <= 0:
+            return 0
+        self.conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+            (excess,)
+        )
+        self.conn.commit()
+        return excess
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"hits={self.hits} misses={self.misses} hit_rate={rate:.1%}"
+
+    def close(self):
+        self.conn.close()
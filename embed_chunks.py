@@ -1,7 +1,14 @@
-import sys, json
-from sentence_transformers import SentenceTransformer
+import json, argparse
+import numpy as np
+from embed_backends import Encoder, EMBED_BACKENDS, cosine_agreement
+from embed_cache import EmbeddingCache, cache_key
+from log import get_logger
+from metrics import MetricsRecorder
+from vector_store import VectorStoreWriter, VECTOR_DTYPES
 
 MODEL_NAME = "intfloat/multilingual-e5-small"  # 384 dimensiones
+# Chunks que se leen, ordenan por longitud y escriben de una vez (memoria acotada)
+EMBED_WINDOW = 1024
 
 def read_jsonl(path):
     with open(path, "r", encoding="utf-8") as f:
@@ -15,33 +22,144 @@ def write_jsonl(path, items):
         for it in items:
             f.write(json.dumps(it, ensure_ascii=False) + "\n")
 
-def main(in_path, out_path, batch_size=64):
-    model = SentenceTransformer(MODEL_NAME)
-    buf_in, buf_out = [], []
-
-    def flush_batch():
-        if not buf_in:
-            return
-        # E5: prefijo "passage: " para documentos
-        texts = [f"passage: {x['content']}" for x in buf_in]
-        vecs = model.encode(texts, normalize_embeddings=True)  # recomendado
-        for x, v in zip(buf_in, vecs):
-            x["content_vector"] = [float(z) for z in v.tolist()]  # listo p/ Azure
-            buf_out.append(x)
-        buf_in.clear()
-
-    for obj in read_jsonl(in_path):
-        buf_in.append(obj)
-        if len(buf_in) >= batch_size:
-            flush_batch()
-
-    flush_batch()
-    write_jsonl(out_path, buf_out)
-    print(f"OK → {len(buf_out)} chunks con embeddings (dim={len(buf_out[0]['content_vector']) if buf_out else 'N/A'})")
+class JsonlVectorWriter:
+    """Salida JSONL con content_vector como lista de floats (formato del indexador de Azure)."""
+
+    def __init__(self, path):
+        self.f = open(path, "w", encoding="utf-8")
+
+    def add_many(self, items, vecs):
+        for x, v in zip(items, vecs.tolist()):  # listo p/ Azure
+            x["content_vector"] = v
+            self.f.write(json.dumps(x, ensure_ascii=False) + "\n")
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_windows(items, size):
+    window = []
+    for it in items:
+        window.append(it)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+def encode_length_bucketed(encoder, texts, batch_size=64):
+    """
+    Codifica `texts` agrupando en lotes por longitud en tokens (menos padding por lote)
+    y devuelve los vectores en el orden original.
+    """
+    lengths = [len(ids) for ids in encoder.tokenizer(
+        texts, truncation=True, max_length=encoder.max_seq_length)["input_ids"]]
+    order = np.argsort(lengths, kind="stable")
+    vecs = np.empty((len(texts), encoder.dim), dtype=np.float32)
+    vecs[order] = encoder.encode_sorted([texts[i] for i in order], batch_size)
+    return vecs
+
+def encode_with_cache(encoder, texts, batch_size, cache, model_id):
+    """
+    Como encode_length_bucketed, pero solo llama al encoder para los textos que no están
+    en la caché; los repetidos dentro de la ventana se codifican una sola vez.
+    """
+    keys = [cache_key(model_id, t) for t in texts]
+    found = cache.get_many(keys)
+    misses = {}
+    for k, t in zip(keys, texts):
+        if k not in found:
+            misses.setdefault(k, t)
+    if misses:
+        vecs = encode_length_bucketed(encoder, list(misses.values()), batch_size)
+        fresh = dict(zip(misses.keys(), vecs))
+        cache.put_many(fresh)
+        found.update(fresh)
+    return np.vstack([found[k] for k in keys])
+
+def check_agreement(encoder, in_path, sample=256, batch_size=64):
+    """Compara los vectores del backend elegido con los fp32 del backend torch en una muestra."""
+    items = next(iter_windows(read_jsonl(in_path), sample), [])
+    texts = [f"passage: {x['content']}" for x in items]
+    if not texts:
+        return None
+    reference = Encoder(MODEL_NAME, "torch")
+    stats = cosine_agreement(
+        encode_length_bucketed(reference, texts, batch_size),
+        encode_length_bucketed(encoder, texts, batch_size),
+    )
+    print(f"📐 Concordancia coseno {encoder.backend} vs torch fp32 ({len(texts)} chunks): "
+          f"media={stats['mean']:.5f} mín={stats['min']:.5f} p1={stats['p01']:.5f}")
+    return stats
+
+def main(in_path, out_path, batch_size=64, window=EMBED_WINDOW, backend="torch", workers=None, agreement_sample=0,
+         use_cache=True, out_format="jsonl", dtype="float32", metrics=None):
+    log = get_logger("embeddings")
+    # Un registro por ventana en ./metrics/embeddings.jsonl (etapas embed / write)
+    recorder = metrics or MetricsRecorder("embeddings")
+    encoder = Encoder(MODEL_NAME, backend, workers)
+    # Los vectores dependen del modelo y del backend (int8 ≠ fp32): ambos van en la clave
+    cache, model_id = (EmbeddingCache() if use_cache else None), f"{MODEL_NAME}|{backend}"
+    if agreement_sample:
+        check_agreement(encoder, in_path, agreement_sample, batch_size)
+    total, dim = 0, None
+
+    # Escritura en streaming: cada ventana se escribe apenas se codifica, la memoria
+    # no crece con el corpus y una caída conserva lo ya procesado
+    try:
+        # "store": directorio binario mapeable (ver vector_store.py) en lugar de JSONL
+        writer = VectorStoreWriter(out_path, dtype) if out_format == "store" else JsonlVectorWriter(out_path)
+        with writer:
+            for n, items in enumerate(iter_windows(read_jsonl(in_path), max(window, batch_size))):
+                m = recorder.start(f"{in_path}#{n}", backend=backend)
+                # E5: prefijo "passage: " para documentos
+                texts = [f"passage: {x['content']}" for x in items]
+                with recorder.profiled(m), m.stage("embed", chunks=len(items)):
+                    if cache is not None:
+                        vecs = encode_with_cache(encoder, texts, batch_size, cache, model_id)
+                    else:
+                        vecs = encode_length_bucketed(encoder, texts, batch_size)
+                with m.stage("write"):
+                    writer.add_many(items, vecs)
+                recorder.finish(m)
+                total += len(items)
+                dim = vecs.shape[1]
+                print(f"… {total} chunks codificados")
+    finally:
+        encoder.close()
+        if metrics is None:
+            recorder.close()
+        if cache is not None:
+            print(f"🗃️ Caché de embeddings: {cache.stats()}")
+            log.info(f"Caché de embeddings ({in_path}): {cache.stats()}")
+            cache.close()
+
+    print(f"OK → {total} chunks con embeddings (dim={dim if dim else 'N/A'}, backend={backend}, formato={out_format})")
     print(f"Salida: {out_path}")
+    return total
 
 if __name__ == "__main__":
-    # Uso: python embed_chunks.py chunks.jsonl chunks_with_vectors.jsonl
-    in_file  = sys.argv[1] if len(sys.argv) > 1 else "PARTE_GENERAL.jsonl"
-    out_file = sys.argv[2] if len(sys.argv) > 2 else "PARTE_GENERAL_vectors.jsonl"
-    main(in_file, out_file)
+    # Uso: python embed_chunks.py chunks.jsonl chunks_with_vectors.jsonl [--backend onnx-int8]
+    parser = argparse.ArgumentParser(description="Embeddings E5 para chunks JSONL")
+    parser.add_argument("in_file", nargs="?", default="PARTE_GENERAL.jsonl")
+    parser.add_argument("out_file", nargs="?", default="PARTE_GENERAL_vectors.jsonl")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--backend", choices=EMBED_BACKENDS, default="torch",
+                        help="torch (actual), multiprocess, onnx u onnx-int8")
+    parser.add_argument("--workers", type=int, default=None, help="procesos para --backend multiprocess")
+    parser.add_argument("--check-agreement", type=int, default=0, metavar="N",
+                        help="compara N chunks contra torch fp32 y reporta la concordancia coseno")
+    parser.add_argument("--no-cache", action="store_true", help="no usar la caché persistente de embeddings")
+    parser.add_argument("--out-format", choices=("jsonl", "store"), default="jsonl",
+                        help="jsonl (Azure) o store: directorio con columnas + matriz de vectores mapeable")
+    parser.add_argument("--dtype", choices=VECTOR_DTYPES, default="float32", help="tipo de los vectores en --out-format store")
+    args = parser.parse_args()
+    main(args.in_file, args.out_file, args.batch_size, backend=args.backend,
+         workers=args.workers, agreement_sample=args.check_agreement, use_cache=not args.no_cache,
+         out_format=args.out_format, dtype=args.dtype)
@@ -0,0 +1,124 @@
+import os, time, sqlite3, threading
+from pathlib import Path
+
+JOB_LEDGER_PATH = os.getenv("JOB_LEDGER_PATH", "./cache/job_ledger.sqlite")
+# Reintentos por file_id y espera base (se duplica en cada intento fallido)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_BACKOFF_S = float(os.getenv("JOB_RETRY_BACKOFF_S", 60))
+
+
+class JobLedger:
+    """
+    Registro local y durable (SQLite) del estado de cada file_id del barrido:
+    pending → running → done | failed. Permite reanudar tras una caída sin rehacer
+    documentos terminados y reintentar los fallidos con backoff exponencial.
+    """
+
+    def __init__(self, path=JOB_LEDGER_PATH, max_attempts=JOB_MAX_ATTEMPTS, backoff_s=JOB_RETRY_BACKOFF_S):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self.backoff_s = backoff_s
+        # Se usa desde el hilo principal y desde los callbacks de subida
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                file_id INTEGER PRIMARY KEY,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                started_at REAL,
+                finished_at REAL,
+                duration REAL,
+                output_blob TEXT,
+                error TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs(status, next_attempt_at)")
+        self.conn.commit()
+
+    def _execute(self, query, params=()):
+        with self.lock:
+            cur = self.conn.execute(query, params)
+            self.conn.commit()
+            return cur
+
+    def seed(self, file_ids):
+        """Registra los ids como pendientes; los que ya existen conservan su estado."""
+        with self.lock:
+            self.conn.executemany("INSERT OR IGNORE INTO jobs (file_id) VALUES (?)", ((i,) for i in file_ids))
+            self.conn.commit()
+
+    def recover(self):
+        """
+        Los jobs 'running' de una corrida que se cayó vuelven a quedar pendientes, salvo los
+        que ya agotaron sus intentos: un documento que tumba el proceso (p. ej. por memoria)
+        queda 'failed' en lugar de hacer caer cada reinicio. Devuelve (reencolados, abandonados).
+        """
+        with self.lock:
+            abandoned = self.conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, "
+                "error = 'interrumpido en ' || attempts || ' intentos (caída del proceso)' "
+                "WHERE status = 'running' AND attempts >= ?",
+                (time.time(), self.max_attempts)
+            ).rowcount
+            requeued = self.conn.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'").rowcount
+            self.conn.commit()
+        return requeued, abandoned
+
+    def runnable_ids(self):
+        """Ids pendientes o fallidos con reintentos disponibles cuyo backoff ya venció."""
+        rows = self._execute(
+            "SELECT file_id FROM jobs WHERE (status = 'pending' OR (status = 'failed' AND attempts < ?)) "
+            "AND next_attempt_at <= ? ORDER BY file_id",
+            (self.max_attempts, time.time())
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def next_retry_in(self):
+        """Segundos hasta el próximo reintento programado; None si no queda nada por reintentar."""
+        row = self._execute(
+            "SELECT MIN(next_attempt_at) FROM jobs WHERE status = 'failed' AND attempts < ?",
+            (self.max_attempts,)
+        ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def start(self, file_id):
+        # El intento cuenta al empezar: si el proceso muere a mitad, recover() lo ve
+        self._execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, error = NULL "
+            "WHERE file_id = ?",
+            (time.time(), file_id)
+        )
+
+    def done(self, file_id, output_blob=None):
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, "
+            "duration = ? - COALESCE(started_at, ?), output_blob = ? WHERE file_id = ?",
+            (now, now, now, output_blob, file_id)
+        )
+
+    def fail(self, file_id, error, retry=True):
+        """Marca el fallo; con retry=False (p.ej. id sin registro) no se vuelve a intentar."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT attempts FROM jobs WHERE file_id = ?", (file_id,)).fetchone()
+            # start() ya contó el intento; un fallo sin start() (id sin registro) cuenta uno
+            attempts = max(row[0] if row else 0, 1)
+            if not retry:
+                attempts = max(attempts, self.max_attempts)
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', attempts = ?, next_attempt_at = ?, finished_at = ?, "
+                "duration = ? - COALESCE(started_at, ?), error = ? WHERE file_id = ?",
+                (attempts, now + self.backoff_s * 2 ** (attempts - 1), now, now, now, str(error)[:2000], file_id)
+            )
+            self.conn.commit()
+
+    def summary(self):
+        rows = self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self):
+        self.conn.close()
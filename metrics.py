@@ -0,0 +1,324 @@
+import os, io, json, time, pstats, cProfile, threading, tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# METRICS=0 desactiva la escritura (las mediciones en memoria siguen siendo baratas)
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+METRICS_DIR = os.getenv("METRICS_DIR", "./metrics")
+# Perfilado por muestreo: cada N documentos (0 = apagado); cprofile | tracemalloc
+PROFILE_EVERY = int(os.getenv("PROFILE_EVERY", 0))
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")
+# Documentos entre reescrituras del resumen Prometheus
+PROM_EVERY = int(os.getenv("METRICS_PROM_EVERY", 10))
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _read_status_kb(field):
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def reset_peak_rss():
+    """En Linux, reinicia el pico de RSS del proceso (VmHWM) para medirlo por documento."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso en MB (VmHWM, getrusage o psutil según la plataforma)."""
+    kb = _read_status_kb("VmHWM:")
+    if kb is not None:
+        return kb / 1024
+    if resource is not None:
+        # ru_maxrss: KB en Linux, bytes en macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024) if os.uname().sysname == "Darwin" else rss / 1024
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def children_peak_rss_mb():
+    """Pico de RSS del mayor subproceso ya terminado (p. ej. workers de OCR); None si no se puede medir."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+class DocMetrics:
+    """
+    Mediciones de un documento (o de una ventana de embeddings): duración por etapa,
+    contadores (bytes, pages, chunks, ...) y máximos (p. ej. ocr_peak_rss_mb). Se puede
+    usar desde varios hilos.
+    """
+
+    def __init__(self, doc, **fields):
+        self.doc = doc
+        self.fields = fields
+        self.stages = {}
+        self.counts = {}
+        self.peaks = {}
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.profile = None
+        # True si su ventana de pico de RSS se solapó con la de otro documento
+        self.overlapped = False
+        # (peak_rss_mb, scope, since) al cerrar la ventana (MetricsRecorder.end_peak)
+        self.peak = None
+
+    @contextmanager
+    def stage(self, name, **counts):
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+            if counts:
+                self.add(**counts)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add(self, **counts):
+        with self.lock:
+            for k, v in counts.items():
+                if v is not None:
+                    self.counts[k] = self.counts.get(k, 0) + v
+
+    def add_max(self, **values):
+        """Como add(), pero se queda con el máximo (picos de memoria)."""
+        with self.lock:
+            for k, v in values.items():
+                if v is not None:
+                    self.peaks[k] = max(self.peaks.get(k, v), v)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "doc": self.doc,
+                **self.fields,
+                "total_s": round(time.perf_counter() - self.started, 4),
+                "stages_s": {k: round(v, 4) for k, v in self.stages.items()},
+                **{k: (round(v, 4) if isinstance(v, float) else v) for k, v in self.counts.items()},
+                **{k: round(v, 1) for k, v in self.peaks.items()},
+            }
+
+
+class MetricsRecorder:
+    """
+    Escribe un JSON por documento en <dir>/<name>.jsonl y un resumen estilo textfile de
+    Prometheus en <dir>/<name>.prom (percentiles por etapa, totales y pico de memoria).
+    """
+
+    def __init__(self, name, out_dir=METRICS_DIR, enabled=METRICS_ENABLED, profile_every=PROFILE_EVERY,
+                 profile_mode=PROFILE_MODE, window=10_000):
+        self.name = name
+        self.enabled = enabled
+        self.dir = Path(out_dir)
+        self.profile_every = profile_every
+        self.profile_mode = profile_mode
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.window = window
+        self.totals = {}
+        self.status = {}
+        self.docs = 0
+        self.started_docs = 0
+        self.peak_rss = 0.0
+        self.peaks = {}
+        # Documentos con la ventana de pico abierta: VmHWM es del proceso, solo se reinicia sin ninguno
+        self._in_flight = set()
+        self._peak_since = time.time()
+        # Fuera de Linux no hay reinicio: el pico es el de toda la vida del proceso
+        self._peak_resettable = False
+        self._jsonl = None
+        if enabled:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._jsonl = open(self.dir / f"{name}.jsonl", "a", encoding="utf-8")
+
+    def start(self, doc, metrics=None, **fields):
+        """
+        Abre la ventana de pico de RSS de un documento; se llama al empezar el trabajo pesado
+        en el proceso (OCR), no al encolar su descarga. `metrics` reutiliza un DocMetrics ya
+        creado (con los tiempos de SQL y descarga). El pico se reinicia solo si no hay otra
+        ventana abierta; si se solapa, su peak_rss_mb es el pico del proceso desde
+        peak_rss_since y el registro lo marca con peak_rss_scope = "shared" ("process" donde
+        el pico no se puede reiniciar o si el documento nunca abrió su ventana).
+        """
+        if metrics is None:
+            metrics = DocMetrics(doc, **fields)
+        else:
+            metrics.fields.update(fields)
+        with self.lock:
+            self.started_docs += 1
+            if not self._in_flight:
+                self._peak_resettable = reset_peak_rss()
+                if self._peak_resettable:
+                    self._peak_since = time.time()
+            else:
+                metrics.overlapped = True
+                for other in self._in_flight:
+                    other.overlapped = True
+            self._in_flight.add(metrics)
+        return metrics
+
+    @contextmanager
+    def profiled(self, metrics):
+        """Perfila el bloque si toca (cada PROFILE_EVERY documentos); el resultado va en el registro JSON."""
+        with self.lock:
+            n = self.started_docs
+        if not self.profile_every or n % self.profile_every:
+            yield
+            return
+        if self.profile_mode == "tracemalloc":
+            tracemalloc.start(10)
+            try:
+                yield
+            finally:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                metrics.profile = {
+                    "mode": "tracemalloc",
+                    "peak_traced_mb": round(peak / (1024 * 1024), 2),
+                    "top": [str(s) for s in snapshot.statistics("lineno")[:10]],
+                }
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            out = self.dir / "profiles"
+            out.mkdir(parents=True, exist_ok=True)
+            path = out / f"{self.name}_{str(metrics.doc).replace('/', '_')}_{int(time.time())}.prof"
+            profiler.dump_stats(str(path))
+            buf = io.StringIO()
+            pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(15)
+            metrics.profile = {"mode": "cprofile", "file": str(path), "top": buf.getvalue().splitlines()[-25:]}
+
+    def end_peak(self, metrics):
+        """
+        Cierra la ventana de pico del documento (fin del OCR y el chunking): lo que pase
+        después, como la subida en segundo plano, ya no se le atribuye. Idempotente.
+        """
+        if metrics.peak is not None:
+            return
+        peak = peak_rss_mb()
+        with self.lock:
+            opened = metrics in self._in_flight
+            self._in_flight.discard(metrics)
+            if not self._peak_resettable or not opened:
+                scope = "process"
+            else:
+                scope = "shared" if metrics.overlapped else "doc"
+            metrics.peak = (peak, scope, self._peak_since)
+
+    def finish(self, metrics, status="ok", error=None):
+        self.end_peak(metrics)
+        record = metrics.to_dict()
+        record["status"] = status
+        if error is not None:
+            record["error"] = str(error)[:500]
+        peak, scope, since = metrics.peak
+        record["peak_rss_mb"] = None if peak is None else round(peak, 1)
+        record["peak_rss_scope"] = scope
+        record["peak_rss_since"] = round(since, 3)
+        children = children_peak_rss_mb()
+        if children:
+            record["children_peak_rss_mb"] = round(children, 1)
+        if metrics.profile:
+            record["profile"] = metrics.profile
+        record["ts"] = time.time()
+        with self.lock:
+            self.docs += 1
+            self.status[status] = self.status.get(status, 0) + 1
+            for stage, seconds in metrics.stages.items():
+                self.durations.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+            self.durations.setdefault("total", deque(maxlen=self.window)).append(record["total_s"])
+            for k, v in metrics.counts.items():
+                if isinstance(v, (int, float)):
+                    self.totals[k] = self.totals.get(k, 0) + v
+            self.peak_rss = max(self.peak_rss, peak or 0.0)
+            for k, v in metrics.peaks.items():
+                self.peaks[k] = max(self.peaks.get(k, v), v)
+            if self._jsonl is not None:
+                self._jsonl.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._jsonl.flush()
+            write_prom = self.enabled and self.docs % PROM_EVERY == 0
+        if write_prom:
+            self.write_prometheus()
+        return record
+
+    def summary(self):
+        """Totales de la corrida: documentos por estado, segundos sumados por etapa y contadores."""
+        with self.lock:
+            return {
+                "docs": self.docs,
+                "status": dict(self.status),
+                "stages_s": {k: round(sum(v), 4) for k, v in sorted(self.durations.items()) if k != "total"},
+                "totals": {k: (round(v, 4) if isinstance(v, float) else v) for k, v in self.totals.items()},
+                "peak_rss_mb": round(self.peak_rss, 1),
+                **{k: round(v, 1) for k, v in self.peaks.items()},
+            }
+
+    def prometheus_text(self):
+        prefix = f"pipeline_{self.name}"
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        with self.lock:
+            for stage, values in sorted(self.durations.items()):
+                ordered = sorted(values)
+                for q in QUANTILES:
+                    v = ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+                    lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} {v:.6f}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {sum(ordered):.6f}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {len(ordered)}')
+            lines.append(f"# TYPE {prefix}_docs_total counter")
+            for status, n in sorted(self.status.items()):
+                lines.append(f'{prefix}_docs_total{{status="{status}"}} {n}')
+            lines.append(f"# TYPE {prefix}_items_total counter")
+            for k, v in sorted(self.totals.items()):
+                lines.append(f'{prefix}_items_total{{item="{k}"}} {v}')
+            lines.append(f"# TYPE {prefix}_peak_rss_bytes gauge")
+            lines.append(f"{prefix}_peak_rss_bytes {int(self.peak_rss * 1024 * 1024)}")
+            for k, v in sorted(self.peaks.items()):
+                # ocr_peak_rss_mb → pipeline_<name>_ocr_peak_rss_bytes
+                name = k[:-len("_mb")] + "_bytes" if k.endswith("_mb") else k
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {int(v * 1024 * 1024) if k.endswith('_mb') else v}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        # Escritura atómica: node_exporter nunca lee un archivo a medias
+        path = self.dir / f"{self.name}.prom"
+        tmp = path.with_suffix(".prom.tmp")
+        tmp.write_text(self.prometheus_text(), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def close(self):
+        if self.enabled:
+            self.write_prometheus()
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
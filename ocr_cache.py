@@ -0,0 +1,109 @@
+import os, time, sqlite3, hashlib
+from pathlib import Path
+
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "./cache/ocr_cache.sqlite")
+# Tamaño máximo del texto cacheado; al superarlo se expulsan las páginas menos usadas (LRU)
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", 2048))
+
+
+def file_sha256(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class OcrCache:
+    """
+    Caché en disco (SQLite) del texto OCR por página, direccionada por contenido:
+    clave = sha256 del PDF + número de página + configuración de OCR
+    (idioma, dpi, versión del motor). Si cambia cualquiera de ellos la entrada no aplica.
+    """
+
+    def __init__(self, path=OCR_CACHE_PATH, max_mb=OCR_CACHE_MAX_MB):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_pages (
+                pdf_hash TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                settings TEXT NOT NULL,
+                text TEXT NOT NULL,
+                dpi INTEGER,
+                conf REAL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (pdf_hash, page, settings)
+            )
+        """)
+        # Cachés creadas antes del OCR adaptativo no tienen dpi/conf
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(ocr_pages)")}
+        for column, sql_type in (("dpi", "INTEGER"), ("conf", "REAL")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE ocr_pages ADD COLUMN {column} {sql_type}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_ocr_pages_last_access ON ocr_pages(last_access)")
+        self.conn.commit()
+
+    def get_many(self, pdf_hash, pages, settings):
+        """Devuelve {page: (texto, dpi, conf)} para las páginas cacheadas y actualiza su último acceso."""
+        found = {}
+        for page in pages:
+            row = self.conn.execute(
+                "SELECT text, dpi, conf FROM ocr_pages WHERE pdf_hash = ? AND page = ? AND settings = ?",
+                (pdf_hash, page, settings)
+            ).fetchone()
+            if row:
+                found[page] = tuple(row)
+        if found:
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE ocr_pages SET last_access = ? WHERE pdf_hash = ? AND page = ? AND settings = ?",
+                [(now, pdf_hash, page, settings) for page in found]
+            )
+            self.conn.commit()
+        self.hits += len(found)
+        self.misses += len(pages) - len(found)
+        return found
+
+    def put_many(self, pdf_hash, settings, page_texts):
+        """Guarda {page: (texto, dpi, conf)} y aplica el límite de tamaño."""
+        if not page_texts:
+            return
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO ocr_pages (pdf_hash, page, settings, text, dpi, conf, size, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(pdf_hash, page, settings, txt, dpi, conf, len(txt.encode("utf-8")), now)
+             for page, (txt, dpi, conf) in page_texts.items()]
+        )
+        self.conn.commit()
+        self.evict()
+
+    def evict(self):
+        """Expulsa las entradas con acceso más antiguo hasta quedar bajo max_bytes."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_pages").fetchone()[0]
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return 0
+        victims, freed = [], 0
+        for rowid, size in self.conn.execute("SELECT rowid, size FROM ocr_pages ORDER BY last_access"):
+            victims.append((rowid,))
+            freed += size
+            if freed >= excess:
+                break
+        self.conn.executemany("DELETE FROM ocr_pages WHERE rowid = ?", victims)
+        self.conn.commit()
+        return len(victims)
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"hits={self.hits} misses={self.misses} hit_rate={rate:.1%}"
+
+    def close(self):
+        self.conn.close()
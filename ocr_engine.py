@@ -0,0 +1,109 @@
+import os
+from functools import lru_cache
+
+import pytesseract
+
+# auto | tesserocr | pytesseract
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")
+
+# Un motor por (nombre, idioma) y por proceso: cada worker del pool mantiene el suyo vivo
+_engines = {}
+
+
+class PytesseractEngine:
+    """Motor de respaldo: lanza un proceso `tesseract` por página."""
+    name = "pytesseract"
+    # Prefiere rutas a archivos: con una imagen PIL pytesseract la vuelve a guardar como PNG
+    in_process = False
+
+    def __init__(self, lang="spa"):
+        self.lang = lang
+
+    def image_to_string(self, image):
+        return pytesseract.image_to_string(image, lang=self.lang)
+
+    def image_to_text_conf(self, image):
+        """Texto y confianza media por palabra (0-100) en una sola ejecución de tesseract."""
+        txt, tsv = pytesseract.run_and_get_multiple_output(image, extensions=["txt", "tsv"], lang=self.lang)
+        confs = []
+        for row in tsv.splitlines()[1:]:
+            cols = row.split("\t")
+            # Columnas: level ... conf text; conf = -1 en filas que no son palabras
+            if len(cols) == 12 and cols[11].strip() and float(cols[10]) >= 0:
+                confs.append(float(cols[10]))
+        return txt, (sum(confs) / len(confs) if confs else 0.0)
+
+    def version(self):
+        return str(pytesseract.get_tesseract_version())
+
+
+class TesserocrEngine:
+    """
+    Motor en proceso (tesserocr, pip install tesserocr): la API de Tesseract y el
+    traineddata se cargan una vez y reciben las imágenes en memoria, sin fork ni PNG.
+    """
+    name = "tesserocr"
+    in_process = True
+
+    def __init__(self, lang="spa"):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self.lang = lang
+        self.api = tesserocr.PyTessBaseAPI(lang=lang)
+
+    def _set_image(self, image):
+        if isinstance(image, (str, os.PathLike)):
+            self.api.SetImageFile(str(image))
+        else:
+            self.api.SetImage(image)
+
+    def image_to_string(self, image):
+        self._set_image(image)
+        return self.api.GetUTF8Text()
+
+    def image_to_text_conf(self, image):
+        """Texto y confianza media por palabra (0-100); reconoce una sola vez."""
+        self._set_image(image)
+        self.api.Recognize()
+        return self.api.GetUTF8Text(), float(self.api.MeanTextConf())
+
+    def version(self):
+        return self._tesserocr.tesseract_version().split()[1]
+
+    def close(self):
+        self.api.End()
+
+
+def resolve_engine(name=OCR_ENGINE):
+    """Nombre concreto del motor: 'auto' es tesserocr si está instalado y si no pytesseract."""
+    if name == "auto":
+        try:
+            import tesserocr  # noqa: F401
+            return "tesserocr"
+        except ImportError:
+            return "pytesseract"
+    if name not in ("tesserocr", "pytesseract"):
+        raise ValueError(f"Motor OCR no reconocido: {name}. Usa 'auto', 'tesserocr' o 'pytesseract'.")
+    return name
+
+
+@lru_cache(maxsize=None)
+def engine_version(name=OCR_ENGINE):
+    """(motor, versión de Tesseract) sin crear la API ni cargar el traineddata."""
+    name = resolve_engine(name)
+    if name == "tesserocr":
+        import tesserocr
+        return name, tesserocr.tesseract_version().split()[1]
+    return name, str(pytesseract.get_tesseract_version())
+
+
+def get_engine(lang="spa", name=OCR_ENGINE):
+    """Motor OCR del proceso actual; 'auto' usa tesserocr si está instalado y si no pytesseract."""
+    key = (name, lang)
+    if key not in _engines:
+        name = resolve_engine(name)
+        if name == "tesserocr":
+            _engines[key] = TesserocrEngine(lang)
+        else:
+            _engines[key] = PytesseractEngine(lang)
+    return _engines[key]
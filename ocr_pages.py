@@ -0,0 +1,223 @@
+import os, time, shutil, platform, tempfile, importlib.util, multiprocessing
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytesseract
+
+from metrics import reset_peak_rss, peak_rss_mb
+from ocr_engine import get_engine, engine_version, OCR_ENGINE
+from rasterizer import count_pages, render_pages, iter_pages
+
+OCR_DPI = 300
+# Número de procesos para OCR en paralelo (1 = modo secuencial)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+# OCR adaptativo (OCR_ADAPTIVE=1): pasada a OCR_DPI_LOW y re-escaneo a OCR_DPI
+# de las páginas cuya confianza media por palabra queda bajo OCR_CONF_MIN
+OCR_DPI_LOW = int(os.getenv("OCR_DPI_LOW", 150))
+OCR_CONF_MIN = float(os.getenv("OCR_CONF_MIN", 80))
+OCR_ADAPTIVE = (OCR_DPI_LOW, OCR_CONF_MIN) if os.getenv("OCR_ADAPTIVE", "0") == "1" else None
+
+# dpi y conf (confianza media 0-100, None si no se midió) de la pasada que produjo el texto;
+# render_s y ocr_s: segundos de rasterización y de reconocimiento (todas las pasadas);
+# peak_rss_mb: pico de RSS del worker del pool durante la página (None si corrió en el proceso principal)
+PageResult = namedtuple("PageResult", "page text error dpi conf render_s ocr_s peak_rss_mb",
+                        defaults=(0.0, 0.0, None))
+
+# True en los workers del OcrPool: cada tarea reinicia y mide el pico de RSS de su proceso
+_in_pool_worker = False
+
+
+def ensure_tesseract():
+    # El motor en proceso (tesserocr) no necesita el ejecutable
+    if OCR_ENGINE != "pytesseract" and importlib.util.find_spec("tesserocr"):
+        return
+    # Si el usuario puso una ruta manual, respétala; si no, detecta
+    if shutil.which("tesseract"):
+        return
+    if platform.system() == "Windows":
+        win_path = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+        if os.path.exists(win_path):
+            pytesseract.pytesseract.tesseract_cmd = win_path
+            return
+    raise RuntimeError(
+        "Tesseract no encontrado. Instálalo (Ubuntu: 'sudo apt install tesseract-ocr tesseract-ocr-spa')."
+    )
+
+
+def ocr_settings(lang="spa", dpi=OCR_DPI, adaptive=None):
+    """Configuración que afecta al texto OCR; forma parte de la clave de caché."""
+    # Solo la versión: el proceso principal no carga un motor que no va a usar
+    name, version = engine_version()
+    settings = f"{name}={version};lang={lang};dpi={dpi}"
+    if adaptive:
+        settings += f";adaptive={adaptive[0]}/{adaptive[1]}"
+    return settings
+
+
+def _init_worker(lang="spa"):
+    global _in_pool_worker
+    _in_pool_worker = True
+    # Tesseract usa OpenMP internamente; con varios procesos compite por los
+    # mismos núcleos y la escalabilidad se cae. Un hilo por proceso.
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    # El worker no hereda tesseract_cmd del proceso padre (spawn / forkserver)
+    ensure_tesseract()
+    # El motor (y el traineddata) se carga una vez y vive lo que vive el worker del OcrPool
+    get_engine(lang)
+
+
+def _mp_context():
+    # forkserver: los workers nacen de un proceso limpio, no de un fork del proceso
+    # principal con hilos vivos (descargas, subidas, heartbeat de leases). Windows usa spawn.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context()
+
+
+class OcrPool:
+    """
+    Pool de procesos de OCR de larga vida, compartido por todos los documentos de la
+    corrida: los workers (y su motor OCR) se crean una sola vez. Si un worker muere
+    (p. ej. por memoria) el pool queda roto; se recrea en el siguiente uso.
+    """
+
+    def __init__(self, workers=OCR_WORKERS, lang="spa"):
+        self.workers = max(1, workers)
+        self.lang = lang
+        self._pool = None
+
+    def executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context(),
+                                             initializer=_init_worker, initargs=(self.lang,))
+        return self._pool
+
+    def reset(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _recognize(engine, image, with_conf):
+    if with_conf:
+        return engine.image_to_text_conf(image)
+    return engine.image_to_string(image), None
+
+
+def _ocr_at(engine, pdfPath, page, dpi, with_conf=False, image=None):
+    """
+    OCR de la página rasterizada a `dpi` (o de `image` si ya viene renderizada).
+    Devuelve (texto, conf, segundos de rasterización).
+    """
+    if image is not None:
+        return (*_recognize(engine, image, with_conf), 0.0)
+    t0 = time.perf_counter()
+    if engine.in_process:
+        # Motor en proceso: la imagen en escala de grises pasa de memoria a Tesseract
+        image = render_pages(pdfPath, page, page, dpi)[0]
+        render_s = time.perf_counter() - t0
+        return (*_recognize(engine, image, with_conf), render_s)
+    # pytesseract: un .pgm que el ejecutable lee directo, sin re-codificar a PNG
+    with tempfile.TemporaryDirectory(prefix="raster_") as tmp:
+        path = render_pages(pdfPath, page, page, dpi, output_folder=tmp)[0]
+        render_s = time.perf_counter() - t0
+        return (*_recognize(engine, path, with_conf), render_s)
+
+
+def _ocr_page(engine, pdfPath, page, dpi, adaptive, image=None):
+    t0 = time.perf_counter()
+    try:
+        if not adaptive:
+            text, conf, render_s = _ocr_at(engine, pdfPath, page, dpi, image=image)
+            return PageResult(page, text, None, dpi, conf, render_s, time.perf_counter() - t0 - render_s)
+        # Primera pasada a baja resolución; solo si la confianza no alcanza se re-escanea
+        dpi_low, conf_min = adaptive
+        text, conf, render_s = _ocr_at(engine, pdfPath, page, dpi_low, with_conf=True, image=image)
+        if conf >= conf_min:
+            return PageResult(page, text, None, dpi_low, conf, render_s, time.perf_counter() - t0 - render_s)
+        text, conf, render2_s = _ocr_at(engine, pdfPath, page, dpi, with_conf=True)
+        render_s += render2_s
+        return PageResult(page, text, None, dpi, conf, render_s, time.perf_counter() - t0 - render_s)
+    except Exception as e:
+        return PageResult(page, "", f"{type(e).__name__}: {e}", None, None)
+
+
+def ocr_page(pdfPath, page, lang="spa", dpi=OCR_DPI, adaptive=OCR_ADAPTIVE):
+    """OCR de una sola página. Devuelve un PageResult."""
+    # Cada worker rasteriza solo su página: no viajan imágenes entre procesos
+    if not _in_pool_worker:
+        # En el proceso principal no se toca su VmHWM: es el pico por documento de metrics.py
+        return _ocr_page(get_engine(lang), pdfPath, page, dpi, adaptive)
+    # Un worker atiende una página a la vez: su pico desde el reinicio es el de esta página
+    reset_peak_rss()
+    r = _ocr_page(get_engine(lang), pdfPath, page, dpi, adaptive)
+    return r._replace(peak_rss_mb=peak_rss_mb())
+
+
+def ocr_pages(pdfPath, lang="spa", dpi=OCR_DPI, workers=OCR_WORKERS, pages=None, adaptive=OCR_ADAPTIVE, pool=None):
+    """
+    Genera un PageResult(page, text, error, dpi, conf) por página, en orden de página.
+    `pages` limita el OCR a esas páginas (por defecto todas).
+    `adaptive` = (dpi_bajo, confianza_mínima): OCR a dpi_bajo y re-escaneo a `dpi` solo
+    de las páginas con confianza media por palabra menor al umbral.
+    Con workers > 1 las páginas se reparten en un pool de procesos; un error
+    en una página se reporta en su resultado sin detener el resto del documento.
+    `pool` (OcrPool) reutiliza los workers entre documentos; sin él se crea uno solo para este PDF.
+    """
+    total = count_pages(pdfPath)
+    pages = list(range(1, total + 1)) if pages is None else sorted(pages)
+    if not pages:
+        return
+    workers = max(1, min(pool.workers if pool is not None else workers, len(pages)))
+
+    if workers == 1 and len(pages) < total:
+        for page in pages:
+            yield ocr_page(pdfPath, page, lang, dpi, adaptive)
+        return
+
+    if workers == 1:
+        # Ventanas de pocas páginas: el OCR de la página 1 empieza antes de renderizar la N
+        engine = get_engine(lang)
+        first_dpi = adaptive[0] if adaptive else dpi
+        rendered = iter_pages(pdfPath, dpi=first_dpi, to_files=not engine.in_process, total=total)
+        while True:
+            # La rasterización ocurre al pedir la siguiente página (una ventana a la vez)
+            t0 = time.perf_counter()
+            item = next(rendered, None)
+            if item is None:
+                return
+            render_s = time.perf_counter() - t0
+            r = _ocr_page(engine, pdfPath, item[0], dpi, adaptive, image=item[1])
+            yield r._replace(render_s=r.render_s + render_s)
+
+    own = pool is None
+    pool = OcrPool(workers, lang) if own else pool
+    try:
+        executor = pool.executor()
+        # Como máximo 2 páginas en vuelo por worker: memoria acotada en PDFs largos
+        # Se consumen en orden de envío: la salida respeta el orden de páginas
+        pending = deque()
+        for page in pages:
+            pending.append(executor.submit(ocr_page, pdfPath, page, lang, dpi, adaptive))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    except BrokenProcessPool:
+        pool.reset()
+        raise
+    finally:
+        if own:
+            pool.close()
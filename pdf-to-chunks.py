@@ -1,53 +1,50 @@
-import os, time, uuid, json, subprocess, shutil, platform
-import pytesseract
-from pdf2image import convert_from_path
+import os, time, uuid, tempfile, threading, argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from azure.storage.blob import BlobClient
-from dotenv import load_dotenv
-import json
-from db_conector import db_conection
+from blob_storage import get_store, is_up_to_date
+from db_conector import db_conection, iter_metadata, close_connection, METADATA_BATCH_SIZE
 from log import get_logger
+from metrics import DocMetrics, MetricsRecorder
+from ocr_pages import ensure_tesseract, ocr_pages, ocr_settings, OcrPool, OCR_WORKERS, OCR_ADAPTIVE
+from ocr_cache import OcrCache, file_sha256
+from job_ledger import JobLedger, JOB_LEDGER_PATH
+from work_queue import LeaseLedger, make_backend, QUEUE_SQLITE_PATH, QUEUE_POLL_S
+from rasterizer import count_pages
+from text_layer import extract_pages_with_pdftotext, has_text_layer
+from token_chunker import chunk_pages_by_tokens
 
 OUT_PATH  = "./descargas/file.pdf" # ruta local de salida
+DOWNLOAD_DIR = "./descargas" # cada job descarga a su propio archivo temporal aquí
 CONTAINER_PDF = "v-ia-files"
 CONTAINER_CHUNKS = "v-ia-op"
 CHUNK_SIZE = 7000
 CHUNK_OVERLAP = 600
-
-def createBlobClient(blobName, containerName):
-    # Se carga .env si existe
-    load_dotenv()
-    conn = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    if not conn:
-            raise RuntimeError("Falta AZURE_STORAGE_CONNECTION_STRING (o pásala como conn_str).")
-    print(conn)
-    # Crear el cliente del blob
-    return BlobClient.from_connection_string(conn_str=conn, container_name= containerName, blob_name=blobName)
+# "chars": chunk_text por página; "tokens": chunks medidos con el tokenizer del modelo
+# de embeddings (ver token_chunker.py), que pueden cruzar páginas
+CHUNK_MODE = os.getenv("CHUNK_MODE", "chars")
+# Documentos descargados por delante del OCR y subidas concurrentes en segundo plano
+PREFETCH_DOCS = int(os.getenv("PREFETCH_DOCS", 2))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 2))
+# Modo --queue: ids que cada nodo toma por vez (los que queden en el aire al caer vuelven a la cola)
+QUEUE_LEASE_BATCH = int(os.getenv("QUEUE_LEASE_BATCH", PREFETCH_DOCS + 2))
 
 def getPdfFromBlob(pdfName, outPath=OUT_PATH):
     # nombre del archivo pdf a descargar
     blobName = f"{pdfName}.pdf"
-
-    # Crear el cliente del blob
-    blob = createBlobClient(blobName, CONTAINER_PDF)
-
-
-    Path(outPath).parent.mkdir(parents=True, exist_ok=True)
     print(blobName)
-    with open(outPath, "wb") as f:
-        f.write(blob.download_blob().readall())
+    # Descarga en streaming directo al archivo (rangos en paralelo); devuelve el ETag del PDF
+    return get_store().download_to_file(CONTAINER_PDF, blobName, outPath)
 
 
 def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
     text =   text.strip()
-    print(f"Texto total a chunkear: {len(text)} caracteres.")
     if not text:
         return []
     chunks, start = [], 0
     while start < len(text):
         end = min(start + size, len(text))
         cut = max(text.rfind("\n\n", start, end), text.rfind(". ", start, end))
-        print(f"Chunk desde {start} hasta {end}, corte en {cut}.")
         if cut == -1 or cut < start + int(size * 0.5):
             cut = end
         chunks.append(text[start:cut].strip())
@@ -56,118 +53,379 @@ def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
         start = max(0, cut - overlap)
     return chunks
 
-def ensure_tesseract():
-    # Si el usuario puso una ruta manual, respétala; si no, detecta
-    if shutil.which("tesseract"):
-        return
-    if platform.system() == "Windows":
-        win_path = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-        if os.path.exists(win_path):
-            pytesseract.pytesseract.tesseract_cmd = win_path
-            return
-    raise RuntimeError(
-        "Tesseract no encontrado. Instálalo (Ubuntu: 'sudo apt install tesseract-ocr tesseract-ocr-spa')."
-    )
-
-def extract_text_with_pdftotext(pdf_path):
-    """Devuelve el texto usando pdftotext si está disponible; '' si no hay texto o no está."""
-    if not shutil.which("pdftotext"):
-        return ""
-    try:
-        out = subprocess.check_output(
-            ["pdftotext", "-layout", pdf_path, "-"],
-            stderr=subprocess.STDOUT
-        )
-        txt = out.decode("utf-8", "ignore").strip()
-        return txt
-    except subprocess.CalledProcessError:
-        return ""
-
-def ocr_pdf_to_chunks(pdfPath, pdfName, pdf_info, lang="spa"):
+def ocr_pdf_to_chunks(pdfPath, pdfName, pdf_info, lang="spa", workers=OCR_WORKERS, use_text_layer=True, cache=None, upload=True, adaptive=OCR_ADAPTIVE, chunk_mode=CHUNK_MODE, metrics=None, ocr_pool=None):
     
     print(f"📄 Procesando PDF: {pdfPath}")
-    doc_id = os.path.basename(pdfPath)
-
-    # 1) Intentar texto directo (más rápido/preciso si no es escaneado)
-    # direct_txt = extract_text_with_pdftotext(pdfPath)
     all_chunks = []
+    # Tiempos por etapa y contadores del documento (ver metrics.py)
+    metrics = metrics or DocMetrics(pdfName)
+
+    # 1) Texto directo por página (más rápido/preciso en páginas no escaneadas)
+    page_texts = {}
+    if use_text_layer:
+        with metrics.stage("text_layer"):
+            for i, txt in enumerate(extract_pages_with_pdftotext(pdfPath), start=1):
+                if has_text_layer(txt):
+                    page_texts[i] = (txt, "text_layer", None, None)
+
+    # 2) OCR solo de las páginas sin capa de texto utilizable
+    total = count_pages(pdfPath)  # requiere poppler-utils
+    ocr_needed = [i for i in range(1, total + 1) if i not in page_texts]
+    metrics.add(pages=total, pages_text_layer=total - len(ocr_needed))
+    print(f"🔎 {total - len(ocr_needed)}/{total} páginas con texto embebido, {len(ocr_needed)} a OCR.")
+    failed_pages = []
+    if ocr_needed:
+        ensure_tesseract()
+        # 3) Páginas ya OCR-eadas en corridas anteriores (mismo PDF y misma configuración)
+        if cache is not None:
+            with metrics.stage("ocr_cache"):
+                pdf_hash, settings = file_sha256(pdfPath), ocr_settings(lang, adaptive=adaptive)
+                cached = cache.get_many(pdf_hash, ocr_needed, settings)
+            for i, (txt, dpi, conf) in cached.items():
+                page_texts[i] = (txt, "ocr", dpi, conf)
+            ocr_needed = [i for i in ocr_needed if i not in cached]
+            metrics.add(pages_ocr_cached=len(cached))
+            get_logger("chunks").info(f"Caché OCR {pdfName}: {len(cached)} hits, {len(ocr_needed)} misses")
+
+        # OCR por página en un pool de procesos; los resultados llegan en orden de página
+        # "ocr" es tiempo de reloj (rasterización + OCR); render_cpu_s / ocr_cpu_s suman los workers
+        fresh = {}
+        with metrics.stage("ocr", pages_ocr=len(ocr_needed)):
+            for r in ocr_pages(pdfPath, lang=lang, workers=workers, pages=ocr_needed, adaptive=adaptive,
+                               pool=ocr_pool):
+                metrics.add(render_cpu_s=r.render_s, ocr_cpu_s=r.ocr_s)
+                # Rasterización y Tesseract corren en los workers: su memoria no está en el VmHWM del proceso
+                metrics.add_max(ocr_peak_rss_mb=r.peak_rss_mb)
+                if r.error:
+                    failed_pages.append(r.page)
+                    print(f"⚠️ Error OCR en página {r.page}: {r.error}")
+                    continue
+                page_texts[r.page] = (r.text, "ocr", r.dpi, r.conf)
+                fresh[r.page] = (r.text, r.dpi, r.conf)
+        if cache is not None:
+            with metrics.stage("ocr_cache"):
+                cache.put_many(pdf_hash, settings, fresh)
+
+    def add_chunk(page, chunk_idx, content, **extra):
+        _, method, dpi, conf = page_texts[page]
+        all_chunks.append({
+            "id": str(uuid.uuid4()),
+            "doc_id": f"{pdfName}.pdf",
+            "page": page,
+            "chunk_idx": chunk_idx,
+            "content": content,
+            **extra,
+            "method": method,
+            "dpi": dpi,
+            "ocr_conf": None if conf is None else round(conf, 1),
+            "number": pdf_info["number"],
+            "year": pdf_info["year"],
+            "month": pdf_info["month"],
+            "account": pdf_info["account_number_homologated"]
+        })
+
+    with metrics.stage("chunking"):
+        if chunk_mode == "tokens":
+            # chunk_idx se numera dentro de la página donde empieza cada chunk
+            per_page = {}
+            for c in chunk_pages_by_tokens([(i, page_texts[i][0]) for i in sorted(page_texts)]):
+                per_page[c["page"]] = per_page.get(c["page"], 0) + 1
+                add_chunk(c["page"], per_page[c["page"]], c["content"], page_end=c["page_end"], tokens=c["tokens"])
+        else:
+            for i in sorted(page_texts):
+                for j, part in enumerate(chunk_text(page_texts[i][0])):
+                    add_chunk(i, j + 1, part)
+    metrics.add(chunks=len(all_chunks), pages_failed=len(failed_pages))
+    print(f"📝 {len(page_texts)} páginas procesadas, {len(all_chunks)} chunks ({chunk_mode}).")
+    if failed_pages:
+        print(f"⚠️ Páginas con error de OCR en {pdfName}: {failed_pages}")
 
-    # if direct_txt:
-    #     for j, part in enumerate(chunk_text(direct_txt)):
-    #         all_chunks.append({
-    #             "id": str(uuid.uuid4()),
-    #             "doc_id": doc_id,
-    #             "page": None,
-    #             "chunk_idx": j + 1,
-    #             "content": part
-    #         })
-    # else:
-        # 2) Si no hay texto, hacer OCR
-    ensure_tesseract()
-    pages = convert_from_path(pdfPath, dpi=300)  # requiere poppler-utils
-    for i, img in enumerate(pages, start=1):
-        print(f"🖼️ Procesando página {i}/{len(pages)}...")
-        txt = pytesseract.image_to_string(img, lang=lang)
-        for j, part in enumerate(chunk_text(txt)):
-            all_chunks.append({
-                "id": str(uuid.uuid4()),
-                "doc_id": f"{pdfName}.pdf",
-                "page": i,
-                "chunk_idx": j + 1,
-                "content": part,
-                "number": pdf_info["number"],
-                "year": pdf_info["year"],
-                "month": pdf_info["month"],
-                "account": pdf_info["account_number_homologated"]
-            })
-        print(f"📝 Página {i}/{len(pages)} procesada, {len(all_chunks)} chunks hasta ahora.")
+    if upload:
+        upload_chunks(pdfName, all_chunks, metrics=metrics)
+    return all_chunks
 
+
+def upload_chunks(pdfName, all_chunks, source_etag=None, metrics=None):
     # Guardar chunks en Azure Blob Storage
     blobName = f"{pdfName}.jsonl"
+    # El ETag del PDF de origen queda en los metadatos: permite saltar salidas ya al día
+    metadata = {"source_etag": source_etag} if source_etag else None
+    with (metrics or DocMetrics(pdfName)).stage("upload"):
+        get_store().upload_jsonl(CONTAINER_CHUNKS, blobName, all_chunks, metadata=metadata)
 
-    # Crear el cliente del blob
-    blob = createBlobClient(blobName, CONTAINER_CHUNKS)
+    print(f"✅ {len(all_chunks)} chunks guardados del archivo {pdfName}")
+    return blobName
 
-    # blob.upload_blob(all_chunks.encode("utf-8"), overwrite=True)
-    jsonl_str = "\n".join(json.dumps(x, ensure_ascii=False) for x in all_chunks)
-    blob.upload_blob(jsonl_str.encode("utf-8"), overwrite=True)
 
-    print(f"✅ {len(all_chunks)} chunks guardados del archivo {pdfName}")
-    
+def fetch_job(file_id, pdf_info=None, metrics=None):
+    """Etapa 1: metadatos en SQL (si no vienen ya resueltos) + descarga del PDF a un archivo temporal propio del job."""
+    metrics = metrics or DocMetrics(file_id)
+    if pdf_info is None:
+        with metrics.stage("sql"):
+            pdf_info = db_conection(file_id, "op")
+    pdf_name, _ = os.path.splitext(pdf_info["pdf_name"])
+    Path(DOWNLOAD_DIR).mkdir(parents=True, exist_ok=True)
+    fd, pdf_path = tempfile.mkstemp(prefix=f"{file_id}_", suffix=".pdf", dir=DOWNLOAD_DIR)
+    os.close(fd)
+    try:
+        with metrics.stage("download"):
+            etag = getPdfFromBlob(pdf_name, pdf_path)
+        metrics.add(bytes_downloaded=os.path.getsize(pdf_path))
+    except Exception:
+        os.remove(pdf_path)
+        raise
+    print(f"✅ PDF {pdf_name} descargado exitosamente.")
+    return pdf_name, pdf_info, pdf_path, etag
+
+
+def list_unchanged(log):
+    """
+    Dos listados (PDFs y salidas) en lugar de una consulta por blob: devuelve el conjunto
+    de nombres de PDF cuya salida JSONL se generó a partir de su ETag actual.
+    """
+    pdfs = get_store().list_props(CONTAINER_PDF)
+    outputs = get_store().list_props(CONTAINER_CHUNKS)
+    unchanged = {
+        name[:-len(".pdf")] for name, props in pdfs.items()
+        if name.endswith(".pdf") and is_up_to_date(outputs, f"{name[:-len('.pdf')]}.jsonl", props["etag"])
+    }
+    log.info(f"{len(unchanged)} de {len(pdfs)} PDFs con salida al día en {CONTAINER_CHUNKS}")
+    return unchanged
 
-if __name__ == "__main__":
-    # inicializar logs
-    log = get_logger("chunks")
-    log.info("Iniciando OCR de PDF")
-    total_time = 0
 
-    for file_id in range(6889,21732):
-        start_t = time.time()
+def run_pipeline(file_ids, log, cache=None, ledger=None, prefetch=PREFETCH_DOCS, upload_workers=UPLOAD_WORKERS,
+                 skip=None, metrics=None, ocr_pool=None, metadata_batch=METADATA_BATCH_SIZE):
+    """
+    Pipeline por etapas: descarga (hilos, `prefetch` documentos por delante del OCR)
+    → OCR en el hilo principal (que usa el pool de procesos) → subida en segundo plano.
+    Las colas entre etapas están acotadas, así la memoria y el disco no crecen sin límite.
+    Si se pasa un JobLedger, el estado de cada file_id queda registrado en él.
+    `skip` es un conjunto de nombres de PDF que no hace falta reprocesar (ver list_unchanged).
+    `metrics` (MetricsRecorder) recibe un registro por documento con los tiempos de cada etapa.
+    `ocr_pool` (OcrPool) es el pool de OCR de la corrida; se crea antes de lanzar cualquier hilo.
+    `file_ids` puede ser un generador: se consume de a `metadata_batch` ids a medida que
+    se libera la ventana de prefetch (así lo alimenta el modo --queue).
+    Devuelve (ok, fail).
+    """
+    stats = {"ok": 0, "fail": 0}
+    lock = threading.Lock()
+    recorder = metrics or MetricsRecorder("chunks", enabled=False)
+
+    def finish(file_id, error=None, output_blob=None, retry=True, m=None):
+        with lock:
+            stats["fail" if error else "ok"] += 1
+        if m is not None:
+            recorder.finish(m, "fail" if error else "ok", error)
+        if ledger is None:
+            return
+        if error:
+            ledger.fail(file_id, error, retry=retry)
+        else:
+            ledger.done(file_id, output_blob)
+
+    def on_uploaded(fut, file_id, pdf_name, start_t, m):
         try:
+            blob_name = fut.result()
+        except Exception as e:
+            log.error(f"Error subiendo chunks de {pdf_name} (file_id {file_id}): {e}")
+            finish(file_id, e, m=m)
+            return
+        log.info(f"PDF {pdf_name} con file_id {file_id} procesado exitosamente en {time.time() - start_t:.2f} s.")
+        print(f"✅ Proceso completado para {pdf_name}.")
+        finish(file_id, output_blob=blob_name, m=m)
+
+    fetch_pool = ThreadPoolExecutor(max_workers=max(1, prefetch), thread_name_prefix="fetch")
+    upload_pool = ThreadPoolExecutor(max_workers=max(1, upload_workers), thread_name_prefix="upload")
+    uploads_slots = threading.BoundedSemaphore(max(1, upload_workers) * 2)
+    # Metadatos resueltos por lotes con una consulta unida, no 3 consultas por documento
+    jobs, fetched = iter_metadata(file_ids, "op", metadata_batch), deque()
+
+    def submit_next():
+        while True:
+            # El tiempo de SQL del lote de metadatos se carga al documento que lo disparó
+            t0 = time.perf_counter()
+            item = next(jobs, None)
+            if item is None:
+                return
+            file_id, pdf_info, error = item
+            sql_s = time.perf_counter() - t0
+            if error is not None:
+                # El lote de metadatos falló dos veces: el documento se reintenta más adelante
+                log.error(f"Error consultando metadatos de file_id {file_id}: {error}")
+                finish(file_id, error)
+                continue
+            if pdf_info is None:
+                log.error(f"file_id {file_id} sin registro en tbl_files_op_final")
+                finish(file_id, "sin registro en tbl_files_op_final", retry=False)
+                continue
+            if not pdf_info["pdf_name"]:
+                log.error(f"file_id {file_id} sin pdf_name en tbl_files_op_final")
+                finish(file_id, "pdf_name vacío en tbl_files_op_final", retry=False)
+                continue
+            pdf_name = os.path.splitext(pdf_info["pdf_name"])[0]
+            if skip and pdf_name in skip:
+                print(f"⏭️ {pdf_name} sin cambios desde la última salida, se omite.")
+                if ledger is not None:
+                    ledger.start(file_id)
+                finish(file_id, output_blob=f"{pdf_name}.jsonl")
+                continue
+            if ledger is not None:
+                ledger.start(file_id)
+            # La ventana de pico de memoria se abre al empezar el OCR (recorder.start), no aquí
+            m = DocMetrics(pdf_name, file_id=file_id)
+            m.add_time("sql", sql_s)
+            fetched.append((file_id, time.time(), m, fetch_pool.submit(fetch_job, file_id, pdf_info, m)))
+            return
+
+    try:
+        for _ in range(max(1, prefetch)):
+            submit_next()
+        while fetched:
+            file_id, start_t, m, fut = fetched.popleft()
+            submit_next()
             print(file_id)
-            #ingresamos el nombre del pdf
-            # pdf_name = input("Ingresa el nombre del PDF (sin extensión): ").strip()
-            pdf_info = db_conection(file_id, "op")
-            pdf_name = pdf_info["pdf_name"]
-            pdf_name, _ = os.path.splitext(pdf_name)
+            try:
+                pdf_name, pdf_info, pdf_path, etag = fut.result()
+            except Exception as e:
+                log.error(f"Error descargando PDF con file_id {file_id}: {e}")
+                print(f"❌ Ocurrió un error: {e}")
+                finish(file_id, e, m=m)
+                continue
+            recorder.start(pdf_name, metrics=m)
+            try:
+                # PROFILE_EVERY=N: cProfile/tracemalloc del hilo principal en uno de cada N documentos
+                with recorder.profiled(m):
+                    chunks = ocr_pdf_to_chunks(pdf_path, pdf_name, pdf_info, cache=cache, upload=False, metrics=m,
+                                              ocr_pool=ocr_pool)
+            except Exception as e:
+                log.error(f"Error procesando PDF {pdf_name}: {e}")
+                print(f"❌ Ocurrió un error: {e}")
+                finish(file_id, e, m=m)
+                continue
+            finally:
+                os.remove(pdf_path)
+                # La subida corre en segundo plano y se solaparía con el OCR del siguiente documento
+                recorder.end_peak(m)
+            # Si las subidas van atrasadas, el OCR espera aquí (cola acotada)
+            uploads_slots.acquire()
+            up = upload_pool.submit(upload_chunks, pdf_name, chunks, etag, m)
+            up.add_done_callback(lambda f, fid=file_id, n=pdf_name, t=start_t, m=m: on_uploaded(f, fid, n, t, m))
+            up.add_done_callback(lambda _: uploads_slots.release())
+    finally:
+        fetch_pool.shutdown(wait=True, cancel_futures=True)
+        upload_pool.shutdown(wait=True)
+    return stats["ok"], stats["fail"]
 
-            print(pdf_name)
-            # input()
 
-            # Obtenemos PDF de azure blob storage
-            getPdfFromBlob(pdf_name)
-            print(f"✅ PDF {pdf_name} descargado exitosamente.")
+def run_local_sweep(ledger, log, cache=None, skip=None, metrics=None, ocr_pool=None):
+    """Barrido de un solo nodo: el ledger local recuerda qué ids ya terminaron."""
+    ok = fail = 0
+    while True:
+        file_ids = ledger.runnable_ids()
+        if not file_ids:
+            # Solo quedan fallidos esperando su backoff (o nada por hacer)
+            wait = ledger.next_retry_in()
+            if wait is None:
+                break
+            print(f"⏳ Esperando {wait:.0f} s para reintentar fallidos...")
+            time.sleep(wait)
+            continue
+        log.info(f"Procesando {len(file_ids)} file_ids pendientes")
+        batch_ok, batch_fail = run_pipeline(file_ids, log, cache=cache, ledger=ledger, skip=skip, metrics=metrics,
+                                            ocr_pool=ocr_pool)
+        ok, fail = ok + batch_ok, fail + batch_fail
+    return ok, fail
 
-            if not os.path.exists(OUT_PATH):
-                raise FileNotFoundError(f"No se encontró {OUT_PATH} en el directorio actual.")
-            ocr_pdf_to_chunks(OUT_PATH, pdf_name, pdf_info)
-            log.info(f"PDF {pdf_name} con file_id {file_id} procesado exitosamente en {time.time() - start_t:.2f} s.")
-            print(f"✅ Proceso completado para {pdf_name}.")
-        except Exception as e:
-            log.error(f"Error procesando PDF {pdf_name}: {e}")
-            print(f"❌ Ocurrió un error: {e}")
-        print(f"⏱️ Tiempo total: {time.time() - start_t:.2f} s")
-        total_time += time.time() - start_t
-        print(f"⏳ Tiempo acumulado para todos los PDFs: {total_time:.2f} s")
 
-    log.info(f"Tiempo acumulado para todos los PDFs: {total_time:.2f} s")
\ No newline at end of file
+def iter_leased_ids(queue_ledger, log, batch=QUEUE_LEASE_BATCH):
+    """
+    Ids de la cola a demanda: se toma un lease de `batch` ids cada vez que el pipeline
+    pide más, sin esperar a que termine el lote anterior. Termina cuando no hay nada
+    disponible en este momento.
+    """
+    while True:
+        file_ids = queue_ledger.lease(batch)
+        if not file_ids:
+            return
+        log.info(f"[{queue_ledger.worker_id}] leases tomados: {file_ids}")
+        yield from file_ids
+
+
+def run_queue_worker(queue_ledger, backend, log, cache=None, skip=None, batch=QUEUE_LEASE_BATCH, metrics=None,
+                     ocr_pool=None):
+    """
+    Nodo de un barrido distribuido: toma leases de la cola compartida hasta vaciarla.
+    Cada nodo hace lo mismo; agregar un nodo es solo lanzarlo con el mismo --queue.
+    El pipeline se alimenta de leases continuamente; solo se vacía cuando la cola no
+    tiene nada disponible por ahora (fallidos en backoff o leases activos de otros nodos).
+    """
+    ok = fail = 0
+    while True:
+        batch_ok, batch_fail = run_pipeline(iter_leased_ids(queue_ledger, log, batch), log, cache=cache,
+                                            ledger=queue_ledger, skip=skip, metrics=metrics, ocr_pool=ocr_pool,
+                                            metadata_batch=batch)
+        ok, fail = ok + batch_ok, fail + batch_fail
+        if not batch_ok and not batch_fail:
+            waiting, active = backend.remaining()
+            if not waiting and not active:
+                break
+            # Fallidos en backoff o leases de otros nodos que podrían vencer
+            print(f"⏳ Cola sin trabajo disponible ({waiting} en espera, {active} en otros nodos)...")
+            time.sleep(QUEUE_POLL_S)
+    return ok, fail
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OCR de PDFs OP a chunks JSONL en Azure Blob Storage")
+    parser.add_argument("--start", type=int, default=6889, help="primer file_id (consecutive) del barrido")
+    parser.add_argument("--end", type=int, default=21732, help="file_id final (exclusivo)")
+    parser.add_argument("--ledger", default=JOB_LEDGER_PATH, help="ruta del registro SQLite de jobs")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="omitir PDFs cuya salida en Blob ya se generó desde su ETag actual")
+    parser.add_argument("--queue", choices=("sqlite", "sqlserver"),
+                        help="repartir el barrido entre nodos con una cola de leases compartida")
+    parser.add_argument("--queue-path", default=QUEUE_SQLITE_PATH, help="archivo de la cola con --queue sqlite")
+    args = parser.parse_args()
+
+    # Pool de OCR de toda la corrida, creado antes que los hilos de descarga, subida y heartbeat
+    ocr_pool = OcrPool(OCR_WORKERS)
+    # inicializar logs
+    log = get_logger("chunks")
+    log.info("Iniciando OCR de PDF")
+    # Caché de OCR por página (OCR_CACHE=0 para desactivarla)
+    cache = OcrCache() if os.getenv("OCR_CACHE", "1") != "0" else None
+
+    # Un registro JSON por documento y resumen Prometheus en ./metrics (METRICS=0 para desactivar)
+    recorder = MetricsRecorder("chunks")
+    start_t = time.time()
+    skip = list_unchanged(log) if args.skip_unchanged else None
+    if args.queue:
+        # Encolar es idempotente: todos los nodos pueden hacerlo con el mismo rango
+        backend = make_backend(args.queue, args.queue_path)
+        backend.enqueue(range(args.start, args.end))
+        ledger = LeaseLedger(backend)
+        ok, fail = run_queue_worker(ledger, backend, log, cache=cache, skip=skip, metrics=recorder,
+                                    ocr_pool=ocr_pool)
+    else:
+        # El ledger recuerda qué ids ya terminaron: relanzar el script reanuda donde quedó
+        ledger = JobLedger(args.ledger)
+        ledger.seed(range(args.start, args.end))
+        recovered, abandoned = ledger.recover()
+        if recovered or abandoned:
+            log.info(f"{recovered} jobs interrumpidos vuelven a pendientes, "
+                     f"{abandoned} quedan fallidos por agotar sus intentos")
+        ok, fail = run_local_sweep(ledger, log, cache=cache, skip=skip, metrics=recorder, ocr_pool=ocr_pool)
+    total_time = time.time() - start_t
+    print(f"⏳ Tiempo acumulado para todos los PDFs: {total_time:.2f} s (OK: {ok} | FALLAS: {fail})")
+
+    log.info(f"Tiempo acumulado para todos los PDFs: {total_time:.2f} s")
+    log.info(f"Estado del ledger: {ledger.summary()}")
+    ledger.close()
+    recorder.close()
+    ocr_pool.close()
+    if args.queue:
+        backend.close()
+    close_connection()
+    if cache is not None:
+        log.info(f"Caché OCR: {cache.stats()}")
+        cache.close()
@@ -1,83 +1,229 @@
-import pytesseract
-import time
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-import PyPDF2
-
-from pdf2image import convert_from_path
 import os
 import re
+import time
+import sqlite3
+import argparse
 from datetime import datetime
-import pyodbc
-from dotenv import load_dotenv
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import PyPDF2
+
+from db_conector import get_connection, close_connection
+from log import get_logger
+
+BASE_PATH = os.getenv("OCCIRED_BASE_PATH", os.path.join("occired-payments", "2023"))
+TABLE = os.getenv("OCCIRED_TABLE", "master_kipa.tbl_files_occired_temp")
+FILE_URL_BASE = "https://proanalitica.blob.core.windows.net/v-ia-files"
+MANIFEST_PATH = os.getenv("OCCIRED_MANIFEST_PATH", "./cache/occired_manifest.sqlite")
+# Filas por executemany (una sola transacción por lote)
+INSERT_BATCH = int(os.getenv("OCCIRED_INSERT_BATCH", 500))
+PARSE_WORKERS = int(os.getenv("OCCIRED_WORKERS", os.cpu_count() or 1))
+
+PATTERN = re.compile(r"IVA No\. Transacción0\s+([A-Z0-9]+)")
+# Upsert por file_path: un archivo ya registrado (por esta versión o por el script anterior)
+# se actualiza en lugar de insertarse otra vez; creation_date conserva la fecha original
+UPSERT_SQL = f"""
+    MERGE {TABLE} WITH (HOLDLOCK) AS t
+    USING (SELECT ? AS consecutive, ? AS file_name, ? AS file_path, ? AS file_url, ? AS file_type, ? AS creation_date) AS s
+    ON t.file_path = s.file_path
+    WHEN MATCHED THEN UPDATE SET
+        consecutive = s.consecutive, file_name = s.file_name, file_url = s.file_url, file_type = s.file_type
+    WHEN NOT MATCHED THEN INSERT (consecutive, file_name, file_path, file_url, file_type, creation_date)
+        VALUES (s.consecutive, s.file_name, s.file_path, s.file_url, s.file_type, s.creation_date);
+"""
+
+
+def _walk(ruta):
+    rutas = []
+    for root, dirs, files in os.walk(ruta):
+        for archivo in files:
+            rutas.append(os.path.join(root, archivo))
+    return rutas
+
+
+def listRoutes(ruta_base, workers=8):
+    """Recorre el árbol en paralelo (un hilo por subcarpeta de primer nivel); rutas ordenadas."""
+    entries = list(os.scandir(ruta_base))
+    rutas = [e.path for e in entries if e.is_file()]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for sub in pool.map(_walk, [e.path for e in entries if e.is_dir()]):
+            rutas.extend(sub)
+    return sorted(rutas)
+
+
+def parse_first_page(ruta):
+    """Worker: (ruta, consecutive | None, error | None) leyendo solo la primera página."""
+    try:
+        with open(ruta, "rb") as archivo:
+            lector = PyPDF2.PdfReader(archivo, strict=False)
+            texto = lector.pages[0].extract_text() or ""
+    except Exception as e:
+        return ruta, None, f"{type(e).__name__}: {e}"
+    resultado = PATTERN.search(texto)
+    return ruta, (resultado.group(1) if resultado else None), None
 
-def listRoutes(ruta_base):
-        rutas = []
-        for root, dirs, files in os.walk(ruta_base):
-            for archivo in files:
-                ruta_completa = os.path.join(root, archivo)
-                rutas.append(ruta_completa)
-        return rutas
-load_dotenv()
-USER = os.getenv("SQLSERVER_USER")
-PASS = os.getenv("SQLSERVER_PASS")
-HOST = os.getenv("SQLSERVER_HOST")
-DB   = os.getenv("SQLSERVER_DB")
-SCHEMA = os.getenv("SQLSERVER_SCHEMA")
 
+def build_row(ruta, consecutive):
+    file_name = os.path.basename(ruta)
+    path_fixed = ruta.replace("\\", "/")
+    file_url = f"{FILE_URL_BASE}/{path_fixed}"
+    file_type = os.path.splitext(file_name)[1].replace(".", "")
+    return (consecutive, file_name, ruta, file_url, file_type, datetime.now())
 
 
+class Manifest:
+    """
+    Registro local (SQLite) de archivos ya procesados, por ruta + tamaño + mtime.
+    Un archivo que no cambió no se vuelve a leer ni a insertar en corridas siguientes.
+    """
 
-conectionText = 'DRIVER={ODBC Driver 17 for SQL Server};'+ f'SERVER={HOST};DATABASE={DB};UID={USER};PWD={PASS};Encrypt=yes;TrustServerCertificate=yes;'
+    def __init__(self, path=MANIFEST_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                consecutive TEXT,
+                error TEXT,
+                processed_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
 
-print(conectionText)
+    def pending(self, rutas):
+        """Rutas nuevas o modificadas, o que fallaron en una corrida anterior, con su (size, mtime_ns)."""
+        known = {p: (s, m) for p, s, m in self.conn.execute(
+            "SELECT path, size, mtime_ns FROM files WHERE status != 'error'")}
+        out = {}
+        for ruta in rutas:
+            st = os.stat(ruta)
+            if known.get(ruta) != (st.st_size, st.st_mtime_ns):
+                out[ruta] = (st.st_size, st.st_mtime_ns)
+        return out
 
+    def mark_many(self, rows):
+        """rows: (path, size, mtime_ns, status, consecutive, error)."""
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, status, consecutive, error, processed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", [(*r, now) for r in rows])
+        self.conn.commit()
 
-inicio = time.time()
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM files LIMIT 1").fetchone() is None
 
-pdf_path = r"occired-payments\2023"
-listas = listRoutes(pdf_path)
-print(f"Rutas encontradas: {len(listas)}")
-input("Presiona Enter para iniciar el procesamiento de los archivos PDF...")
+    def seed(self, registered, rutas):
+        """
+        Primera corrida: toma como ya procesados los archivos que la tabla ya tiene
+        (p. ej. cargados por el script anterior), con su tamaño y mtime actuales.
+        """
+        rows = []
+        for ruta in rutas:
+            consecutive = registered.get(ruta)
+            if consecutive is None:
+                continue
+            st = os.stat(ruta)
+            rows.append((ruta, st.st_size, st.st_mtime_ns, "inserted", consecutive, None))
+        self.mark_many(rows)
+        return len(rows)
 
-for i in range(2218, len(listas)):
-    ruta = listas[i]
-    conn = pyodbc.connect(conectionText)
+    def summary(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM files GROUP BY status").fetchall())
+
+    def close(self):
+        self.conn.close()
+
+
+def registered_paths(conn):
+    """{file_path: consecutive} de lo que ya está en la tabla."""
     cursor = conn.cursor()
-    print(f"Procesando: {listas[i]}")
-    print(f"indice: {i}")
-    with open(listas[i], "rb") as archivo:
-        
-        lector = PyPDF2.PdfReader(archivo)
-        texto = lector.pages[0].extract_text()
-        
-        print(f"\n----- Página {1} -----\n")
-        print(texto)
-        patron = r"IVA No\. Transacción0\s+([A-Z0-9]+)"
-
-        resultado = re.search(patron, texto)
-
-        if resultado:
-            consecutive = resultado.group(1)
-            print("Número extraído:", consecutive)
-            file_name = os.path.basename(ruta)
-            file_path = ruta
-            path_fixed = ruta.replace("\\", "/")
-            file_url = f"https://proanalitica.blob.core.windows.net/v-ia-files/{path_fixed}"
-            file_type = os.path.splitext(file_name)[1].replace(".", "")
-            creation_date = datetime.now()
-            print("""
-                INSERT INTO master_kipa.tbl_files_occired_temp (consecutive, file_name, file_path, file_url, file_type, creation_date)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, consecutive, file_name, file_path, file_url, file_type, creation_date)
-            cursor.execute("""
-                INSERT INTO master_kipa.tbl_files_occired_temp (consecutive, file_name, file_path, file_url, file_type, creation_date)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, consecutive, file_name, file_path, file_url, file_type, creation_date)
-
-
-            conn.commit()
-            cursor.close()
-            conn.close()
-        else:
-            print("No se encontró el número")
-            # input("Presiona Enter para continuar con la siguiente página...")
\ No newline at end of file
+    try:
+        cursor.execute(f"SELECT file_path, consecutive FROM {TABLE}")
+        return {path: consecutive for path, consecutive in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def insert_batch(conn, rows):
+    """Upsert por lotes con fast_executemany (parámetros enviados como arreglo) y un solo commit."""
+    cursor = conn.cursor()
+    cursor.fast_executemany = True
+    try:
+        cursor.executemany(UPSERT_SQL, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def ingest(base_path=BASE_PATH, start=0, workers=PARSE_WORKERS, batch_size=INSERT_BATCH, manifest_path=MANIFEST_PATH):
+    log = get_logger("occired")
+    inicio = time.time()
+    listas = listRoutes(base_path)
+    manifest = Manifest(manifest_path)
+    conn = get_connection()
+    if manifest.is_empty():
+        seeded = manifest.seed(registered_paths(conn), listas)
+        print(f"Manifiesto nuevo: {seeded} archivos ya registrados en {TABLE} se omiten")
+    pending = manifest.pending(listas[start:])
+    print(f"Rutas encontradas: {len(listas)} · desde índice {start}: {len(listas) - start} · "
+          f"pendientes (nuevas o modificadas): {len(pending)}")
+
+    counts = {"inserted": 0, "no_match": 0, "error": 0}
+    rows, marks = [], []
+
+    def flush():
+        if rows:
+            insert_batch(conn, rows)
+        # El manifiesto se actualiza después del commit en SQL Server
+        manifest.mark_many(marks)
+        rows.clear()
+        marks.clear()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # chunksize > 1: menos viajes entre procesos para miles de archivos pequeños
+            for n, (ruta, consecutive, error) in enumerate(
+                    pool.map(parse_first_page, list(pending), chunksize=16), start=1):
+                size, mtime_ns = pending[ruta]
+                if error:
+                    status = "error"
+                    log.error(f"No se pudo leer {ruta}: {error}")
+                elif consecutive:
+                    status = "inserted"
+                    rows.append(build_row(ruta, consecutive))
+                else:
+                    status = "no_match"
+                counts[status] += 1
+                marks.append((ruta, size, mtime_ns, status, consecutive, error))
+                if len(marks) >= batch_size:
+                    flush()
+                    print(f"… {n}/{len(pending)} archivos ({counts})")
+            flush()
+    finally:
+        close_connection()
+        log.info(f"Ingesta occired {base_path}: {counts} · manifiesto: {manifest.summary()}")
+        manifest.close()
+
+    print(f"✅ {counts['inserted']} insertados, {counts['no_match']} sin número, {counts['error']} con error "
+          f"en {time.time() - inicio:.1f} s")
+    return counts
+
+
+if __name__ == "__main__":
+    # Uso: python pdf-to-text-occired.py [--base occired-payments/2023] [--start 0] [--workers 8]
+    parser = argparse.ArgumentParser(description="Registra en SQL Server los PDFs de occired con su número de transacción")
+    parser.add_argument("--base", default=BASE_PATH, help="carpeta raíz con los PDFs")
+    parser.add_argument("--start", type=int, default=0, help="índice (en el orden de rutas) desde donde procesar")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS, help="procesos para leer las primeras páginas")
+    parser.add_argument("--batch-size", type=int, default=INSERT_BATCH, help="filas por lote de inserción")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="ruta del manifiesto SQLite")
+    args = parser.parse_args()
+    ingest(args.base, args.start, args.workers, args.batch_size, args.manifest)
@@ -3,8 +3,8 @@ import pytesseract
 import time
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
-from pdf2image import convert_from_path
-import os
+from ocr_engine import get_engine
+from rasterizer import iter_pages
 
 
 pdf_name = input("ingresa el nombre del pdf: ")
@@ -13,22 +13,17 @@ inicio = time.time()
 # Ruta al PDF escaneado
 pdf_path = f"{pdf_name}.pdf"
 
-# Carpeta temporal para imágenes
-temp_dir = "paginas_temp"
-os.makedirs(temp_dir, exist_ok=True)
-
-# Convertir PDF a imágenes (una imagen por página)
-paginas = convert_from_path(pdf_path, dpi=300)
-
 texto_completo = ""
 
-for i, pagina in enumerate(paginas):
-    img_path = os.path.join(temp_dir, f"pagina_{i+1}.png")
-    pagina.save(img_path, "PNG")
+# Motor OCR: en proceso (tesserocr) si está instalado; si no, pytesseract
+engine = get_engine("spa")  # "spa" para español
 
+# Rasterizar por ventanas de páginas (escala de grises) en lugar de todo el PDF en RAM.
+# Las páginas van directo al motor, sin guardarlas antes como PNG
+for i, pagina in iter_pages(pdf_path, dpi=300, to_files=not engine.in_process):
     # Extraer texto de la imagen usando OCR
-    texto = pytesseract.image_to_string(img_path, lang="spa")  # "spa" para español
-    texto_completo += f"\n--- Página {i+1} ---\n{texto}"
+    texto = engine.image_to_string(pagina)
+    texto_completo += f"\n--- Página {i} ---\n{texto}"
 
 # Guardar el texto extraído
 with open(f"{pdf_name}.txt", "w", encoding="utf-8") as f:
@@ -0,0 +1,322 @@
+import os, sys, json, time, queue, argparse, threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from ann_index import IVFIndex
+from bm25_index import BM25Index, rrf_fuse
+from embed_backends import Encoder, EMBED_BACKENDS
+from embed_cache import normalize_text
+from embed_chunks import MODEL_NAME, encode_length_bucketed
+from log import get_logger
+from vector_store import VectorStore
+
+QUERY_HOST = os.getenv("QUERY_HOST", "127.0.0.1")
+QUERY_PORT = int(os.getenv("QUERY_PORT", 8765))
+# Micro-lotes: se espera hasta QUERY_MAX_WAIT_MS a que lleguen más consultas, hasta QUERY_MAX_BATCH
+QUERY_MAX_BATCH = int(os.getenv("QUERY_MAX_BATCH", 32))
+QUERY_MAX_WAIT_MS = float(os.getenv("QUERY_MAX_WAIT_MS", 5))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 10_000))
+# Bloque de filas para la búsqueda exacta sobre el store cuando no hay índice ANN
+SCAN_BLOCK = 262_144
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class LatencyStats:
+    """Latencias recientes (ventana acotada) e histograma de tamaños de lote."""
+
+    def __init__(self, window=10_000):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.window = window
+        self.batches = {b: 0 for b in BATCH_BUCKETS}
+        self.requests = 0
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.latencies.setdefault(name, deque(maxlen=self.window)).append(seconds * 1000)
+
+    def observe_batch(self, size):
+        with self.lock:
+            bucket = next((b for b in BATCH_BUCKETS if size <= b), BATCH_BUCKETS[-1])
+            self.batches[bucket] += 1
+
+    def snapshot(self):
+        with self.lock:
+            out = {"requests": self.requests, "batch_size_histogram": {f"<={b}": n for b, n in self.batches.items()}}
+            for name, values in self.latencies.items():
+                arr = np.fromiter(values, dtype=np.float64)
+                out[f"{name}_ms"] = {
+                    "count": len(arr),
+                    "p50": round(float(np.percentile(arr, 50)), 3),
+                    "p99": round(float(np.percentile(arr, 99)), 3),
+                }
+            return out
+
+
+class QueryVectorCache:
+    """LRU en memoria de vectores de consulta, por texto normalizado."""
+
+    def __init__(self, size=QUERY_CACHE_SIZE):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            vec = self.items.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, key, vec):
+        with self.lock:
+            self.items[key] = vec
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+
+class MicroBatcher:
+    """
+    Un hilo dueño del modelo: junta las consultas que llegan mientras tanto (hasta
+    max_batch o max_wait_ms desde la primera) y las codifica en una sola llamada.
+    """
+
+    def __init__(self, encoder, stats, max_batch=QUERY_MAX_BATCH, max_wait_ms=QUERY_MAX_WAIT_MS,
+                 cache_size=QUERY_CACHE_SIZE):
+        self.encoder = encoder
+        self.stats = stats
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.cache = QueryVectorCache(cache_size)
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self.thread.start()
+
+    def embed(self, text):
+        """Vector normalizado de una consulta (bloquea hasta que su lote se codifique)."""
+        key = normalize_text(text)
+        vec = self.cache.get(key)
+        if vec is not None:
+            return vec
+        fut = Future()
+        self.pending.put((key, fut))
+        vec = fut.result()
+        self.cache.put(key, vec)
+        return vec
+
+    def _loop(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            t0 = time.perf_counter()
+            try:
+                # E5: prefijo "query: " para consultas (los chunks se codifican con "passage: ")
+                unique = list(dict.fromkeys(key for key, _ in batch))
+                vecs = encode_length_bucketed(self.encoder, [f"query: {k}" for k in unique], len(unique))
+                by_key = dict(zip(unique, vecs))
+                for key, fut in batch:
+                    fut.set_result(by_key[key])
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            self.stats.observe("encode", time.perf_counter() - t0)
+            self.stats.observe_batch(len(batch))
+
+
+class Searcher:
+    """Búsqueda sobre el VectorStore: índice ANN si existe, si no exacta por bloques; BM25 opcional con RRF."""
+
+    def __init__(self, store_dir, index_dir=None, bm25_dir=None):
+        self.store = VectorStore(store_dir)
+        self.ann = None
+        self.bm25 = None
+        if index_dir:
+            self.ann = IVFIndex.load(index_dir)
+        if bm25_dir:
+            self.bm25 = BM25Index(bm25_dir)
+
+    def _vector_search(self, vec, k, filters):
+        if self.ann is not None:
+            return self.ann.search(vec, k, filters)
+        if filters:
+            raise ValueError("Los filtros requieren un índice ANN (--index).")
+        best_ids, best_scores = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        for start in range(0, len(self.store), SCAN_BLOCK):
+            scores = self.store.vectors_f32(start, start + SCAN_BLOCK) @ vec
+            top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+            best_ids = np.concatenate([best_ids, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+        order = np.argsort(-best_scores)[:k]
+        return best_ids[order], best_scores[order]
+
+    def search(self, vec, k=10, filters=None, text=None):
+        ids, scores = self._vector_search(vec, k, filters)
+        results = [(int(i), float(s)) for i, s in zip(ids, scores)]
+        if self.bm25 is not None and text:
+            # Los números de documento del BM25 son filas del store si se construyó con el mismo JSONL
+            lexical, _ = self.bm25.search(text, k)
+            results = rrf_fuse([[i for i, _ in results], [int(i) for i in lexical]], top=k)
+        out = []
+        for row, score in results:
+            rec = self.store.record(row)
+            rec["score"] = round(score, 6)
+            out.append(rec)
+        return out
+
+
+class QueryService:
+    def __init__(self, batcher, searcher, stats):
+        self.batcher = batcher
+        self.searcher = searcher
+        self.stats = stats
+
+    def handle(self, payload):
+        """payload: {"query": str, "k": int, "filters": {...}} o {"texts": [...]} para solo embeddings."""
+        t0 = time.perf_counter()
+        with self.stats.lock:
+            self.stats.requests += 1
+        try:
+            if "texts" in payload:
+                return {"vectors": [self.batcher.embed(t).tolist() for t in payload["texts"]]}
+            text = payload["query"]
+            vec = self.batcher.embed(text)
+            if self.searcher is None:
+                return {"vector": vec.tolist()}
+            results = self.searcher.search(vec, int(payload.get("k", 10)), payload.get("filters"), text)
+            return {"query": text, "results": results}
+        finally:
+            self.stats.observe("request", time.perf_counter() - t0)
+
+    def metrics(self):
+        out = self.stats.snapshot()
+        cache = self.batcher.cache
+        out["query_cache"] = {"size": len(cache.items), "hits": cache.hits, "misses": cache.misses}
+        return out
+
+
+class QueryHTTPServer(ThreadingHTTPServer):
+    # La cola de conexiones por defecto (5) corta conexiones con ráfagas de consultas concurrentes
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _run(self, payload):
+            try:
+                self._send(200, service.handle(payload))
+            except (KeyError, ValueError) as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/metrics":
+                return self._send(200, service.metrics())
+            if url.path == "/search":
+                qs = parse_qs(url.query)
+                return self._run({"query": qs.get("q", [""])[0], "k": qs.get("k", [10])[0]})
+            self._send(404, {"error": "ruta no encontrada"})
+
+        def do_POST(self):
+            if urlparse(self.path).path not in ("/search", "/embed"):
+                return self._send(404, {"error": "ruta no encontrada"})
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            except json.JSONDecodeError as e:
+                return self._send(400, {"error": f"JSON inválido: {e}"})
+            self._run(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve_stdin(service):
+    """Una consulta por línea (texto plano o JSON); una respuesta JSON por línea."""
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            # Una línea con JSON inválido responde un error y el servicio sigue leyendo
+            payload = json.loads(line) if line.startswith("{") else {"query": line}
+            if payload.get("metrics"):
+                print(json.dumps(service.metrics(), ensure_ascii=False), flush=True)
+                continue
+            print(json.dumps(service.handle(payload), ensure_ascii=False), flush=True)
+        except Exception as e:
+            print(json.dumps({"error": str(e)}, ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    # Uso:
+    #   python query_service.py --store store_dir [--index ann_dir] [--bm25 bm25_dir]        (HTTP)
+    #   echo "cuenta 1001210002790" | python query_service.py --store store_dir --stdin
+    # HTTP: GET /search?q=...&k=10 · POST /search {"query", "k", "filters"} · POST /embed {"texts"} · GET /metrics
+    parser = argparse.ArgumentParser(description="Servicio local de consultas: embeddings en micro-lotes + búsqueda")
+    parser.add_argument("--store", help="directorio del VectorStore (embed_chunks.py --out-format store)")
+    parser.add_argument("--index", help="directorio del índice ANN (ann_index.py build)")
+    parser.add_argument("--bm25", help="directorio del índice BM25 (bm25_index.py build) para fusión híbrida")
+    # multiprocess no aplica: el servicio codifica lotes chicos en un solo hilo
+    parser.add_argument("--backend", choices=[b for b in EMBED_BACKENDS if b != "multiprocess"], default="torch")
+    parser.add_argument("--host", default=QUERY_HOST)
+    parser.add_argument("--port", type=int, default=QUERY_PORT)
+    parser.add_argument("--max-batch", type=int, default=QUERY_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=QUERY_MAX_WAIT_MS)
+    parser.add_argument("--stdin", action="store_true", help="leer consultas de stdin en lugar de HTTP")
+    args = parser.parse_args()
+
+    log = get_logger("query_service")
+    t0 = time.perf_counter()
+    stats = LatencyStats()
+    encoder = Encoder(MODEL_NAME, args.backend)
+    # Calentamiento: la primera llamada paga la inicialización del runtime
+    encode_length_bucketed(encoder, ["query: calentamiento"], 1)
+    batcher = MicroBatcher(encoder, stats, args.max_batch, args.max_wait_ms)
+    searcher = Searcher(args.store, args.index, args.bm25) if args.store else None
+    service = QueryService(batcher, searcher, stats)
+    print(f"🔥 Modelo listo en {time.perf_counter() - t0:.1f} s (backend={encoder.backend})", file=sys.stderr)
+    log.info(f"Servicio de consultas iniciado: store={args.store} index={args.index} bm25={args.bm25}")
+
+    if args.stdin:
+        serve_stdin(service)
+    else:
+        server = QueryHTTPServer((args.host, args.port), make_handler(service))
+        print(f"🌐 Escuchando en http://{args.host}:{args.port}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            encoder.close()
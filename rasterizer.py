@@ -0,0 +1,40 @@
+import os, tempfile
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+# Páginas que se rasterizan por llamada a pdftoppm; acota la memoria pico
+RASTER_WINDOW = int(os.getenv("RASTER_WINDOW", 4))
+
+
+def count_pages(pdfPath):
+    return int(pdfinfo_from_path(pdfPath)["Pages"])
+
+
+def render_pages(pdfPath, first, last, dpi=300, output_folder=None):
+    """
+    Rasteriza las páginas [first, last] en escala de grises (1 byte/píxel en vez de 3).
+    Con output_folder devuelve rutas a los .pgm generados por pdftoppm, que Tesseract
+    lee directamente sin pasar la imagen por Python.
+    """
+    kwargs = dict(dpi=dpi, first_page=first, last_page=last, grayscale=True)
+    if output_folder:
+        return convert_from_path(pdfPath, output_folder=output_folder, paths_only=True, **kwargs)
+    return convert_from_path(pdfPath, **kwargs)
+
+
+def iter_pages(pdfPath, dpi=300, window=RASTER_WINDOW, to_files=False, total=None):
+    """
+    Genera (page, imagen) renderizando ventanas de `window` páginas, de modo que la
+    memoria pico no depende del tamaño del PDF y el consumidor empieza con la página 1
+    antes de que se rendericen las siguientes.
+    Con to_files=True genera (page, ruta) y borra cada ventana al avanzar.
+    """
+    total = total or count_pages(pdfPath)
+    for first in range(1, total + 1, window):
+        last = min(first + window - 1, total)
+        if to_files:
+            with tempfile.TemporaryDirectory(prefix="raster_") as tmp:
+                paths = render_pages(pdfPath, first, last, dpi, output_folder=tmp)
+                yield from zip(range(first, last + 1), paths)
+        else:
+            yield from zip(range(first, last + 1), render_pages(pdfPath, first, last, dpi))
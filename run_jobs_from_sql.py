@@ -19,6 +19,13 @@
 #   # Ejemplo: python process_pdf.py --path "{file_path}"
 #   COMMAND_TEMPLATE='python process_pdf.py --path "{file_path}"'
 #
+#   # Modo en proceso (opcional): workers persistentes que importan el pipeline una vez
+#   # y llaman una función por archivo en lugar de lanzar un intérprete por fila.
+#   EXEC_MODE=inprocess
+#   JOB_CALLABLE="process_pdf:main"          # o "ruta/archivo.py:funcion"; recibe file_path
+#   WORKERS=4                                # procesos persistentes (por defecto nº de CPUs)
+#   JOB_TIMEOUT_S=900                        # tiempo máximo por archivo (0 = sin límite)
+#
 # Uso:
 #   python run_jobs_from_sql.py
 #
@@ -27,13 +34,20 @@
 #  - Puedes filtrar filas con la variable de entorno WHERE_CLAUSE (opcional), p.ej. WHERE_CLAUSE="WHERE is_active = 1"
 #  - Si la tabla no tiene columna id, se ordena por file_path.
 #  - Para auditoría, se crea logs/run_jobs.log
+#  - En modo inprocess la función devuelve 0/None si todo fue bien; otro valor o una
+#    excepción cuentan como FALLA. Un worker que excede JOB_TIMEOUT_S se reemplaza.
 
 import os
 import sys
+import time
 import shlex
 import logging
+import importlib
+import importlib.util
 import subprocess
-from typing import Iterator
+import multiprocessing as mp
+from multiprocessing.connection import wait
+from typing import Callable, Iterable, Iterator, Tuple
 
 import pyodbc
 from dotenv import load_dotenv
@@ -143,8 +157,165 @@ def run_command_for_file(command_template: str, file_path: str) -> int:
         logging.exception("Error inesperado ejecutando el comando.")
         return 1
 
+# ---------------------- Workers persistentes ---------
+def load_callable(spec: str) -> Callable:
+    """
+    Resuelve 'modulo:funcion' o 'ruta/archivo.py:funcion'.
+    La forma con ruta permite scripts con guiones en el nombre (p.ej. pdf-to-chunks.py).
+    """
+    target, _, func_name = spec.rpartition(":")
+    if not target or not func_name:
+        raise ValueError(f"JOB_CALLABLE inválido: {spec!r} (usa 'modulo:funcion')")
+    if target.endswith(".py"):
+        name = os.path.splitext(os.path.basename(target))[0].replace("-", "_")
+        module_spec = importlib.util.spec_from_file_location(name, target)
+        module = importlib.util.module_from_spec(module_spec)
+        sys.modules[name] = module
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(target)
+    return getattr(module, func_name)
+
+
+def _worker_loop(callable_spec: str, conn) -> None:
+    """Importa el pipeline una sola vez y procesa file_paths hasta recibir None."""
+    func = load_callable(callable_spec)
+    while True:
+        file_path = conn.recv()
+        if file_path is None:
+            break
+        try:
+            rc = func(file_path)
+            rc = 0 if rc is None else int(rc)
+        except Exception:
+            logging.exception(f"Error procesando {file_path}")
+            rc = 1
+        conn.send(rc)
+
+
+class _Worker:
+    def __init__(self, callable_spec: str):
+        self.conn, child_conn = mp.Pipe()
+        self.proc = mp.Process(target=_worker_loop, args=(callable_spec, child_conn), daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.file_path = None
+        self.deadline = None
+
+    def assign(self, file_path: str, timeout_s: float) -> bool:
+        """Envía la tarea; False si el worker ya murió (p.ej. al importar el pipeline)."""
+        self.file_path = file_path
+        self.deadline = time.monotonic() + timeout_s if timeout_s > 0 else None
+        try:
+            self.conn.send(file_path)
+        except (BrokenPipeError, OSError):
+            return False
+        return True
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.proc.join(timeout=5)
+        if self.proc.is_alive():
+            self.proc.terminate()
+
+    def kill(self) -> None:
+        self.proc.terminate()
+        self.proc.join()
+        self.conn.close()
+
+
+def run_in_process(callable_spec: str, file_paths: Iterable[str], workers: int, timeout_s: float) -> Tuple[int, int, int]:
+    """
+    Reparte los file_paths entre `workers` procesos persistentes (una tarea a la vez
+    por worker). Un worker que excede el timeout o muere se reemplaza por uno nuevo.
+    Devuelve (total, ok, fail).
+    """
+    total = ok = fail = 0
+    idle = [_Worker(callable_spec) for _ in range(max(1, workers))]
+    busy = {}
+    paths = iter(file_paths)
+    exhausted = False
+    try:
+        while True:
+            while idle and not exhausted:
+                fp = next(paths, None)
+                if fp is None:
+                    exhausted = True
+                    break
+                total += 1
+                worker = idle.pop()
+                logging.info(f"→ [worker {worker.proc.pid}] {fp}")
+                if not worker.assign(fp, timeout_s):
+                    logging.error(f"El worker {worker.proc.pid} terminó antes de recibir {fp}; se reemplaza")
+                    worker.kill()
+                    fail += 1
+                    idle.append(_Worker(callable_spec))
+                    continue
+                busy[worker.conn] = worker
+            if not busy:
+                break
+
+            deadlines = [w.deadline for w in busy.values() if w.deadline is not None]
+            wait_s = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            for conn in wait(list(busy), timeout=wait_s):
+                worker = busy.pop(conn)
+                try:
+                    rc = conn.recv()
+                except (EOFError, OSError):
+                    # EOF o conexión reiniciada: el worker murió a mitad de la tarea
+                    logging.error(f"El worker {worker.proc.pid} terminó inesperadamente con {worker.file_path}")
+                    worker.kill()
+                    worker, rc = _Worker(callable_spec), 1
+                if rc == 0:
+                    ok += 1
+                else:
+                    fail += 1
+                idle.append(worker)
+
+            now = time.monotonic()
+            for conn, worker in list(busy.items()):
+                if worker.deadline is not None and now >= worker.deadline:
+                    logging.error(f"Timeout ({timeout_s:.0f} s) procesando {worker.file_path}; se reemplaza el worker")
+                    del busy[conn]
+                    worker.kill()
+                    fail += 1
+                    idle.append(_Worker(callable_spec))
+    finally:
+        for worker in idle:
+            worker.stop()
+        for worker in busy.values():
+            worker.kill()
+    return total, ok, fail
+
 # ---------------------- Main -------------------------
 def main() -> int:
+    exec_mode = os.getenv("EXEC_MODE", "subprocess").strip().lower()
+
+    if exec_mode == "inprocess":
+        callable_spec = os.getenv("JOB_CALLABLE")
+        if not callable_spec:
+            logging.error(
+                "Define JOB_CALLABLE en .env para EXEC_MODE=inprocess, por ejemplo:\n"
+                "JOB_CALLABLE=process_pdf:main"
+            )
+            return 2
+        # Se resuelve una vez antes de lanzar workers: un JOB_CALLABLE inválido falla aquí,
+        # no en cada worker (que contaría cada fila como FALLA)
+        try:
+            load_callable(callable_spec)
+        except Exception as e:
+            logging.error(f"No se pudo cargar JOB_CALLABLE={callable_spec!r}: {type(e).__name__}: {e}")
+            return 2
+        workers = int(os.getenv("WORKERS", os.cpu_count() or 1))
+        timeout_s = float(os.getenv("JOB_TIMEOUT_S", "0"))
+        logging.info(f"Modo en proceso: {workers} workers persistentes ejecutando {callable_spec}")
+        total, ok, fail = run_in_process(callable_spec, yield_file_paths(), workers, timeout_s)
+        logging.info(f"Procesadas: {total} | OK: {ok} | FALLAS: {fail}")
+        return 0 if fail == 0 else 1
+
     command_template = os.getenv("COMMAND_TEMPLATE")
     if not command_template:
         logging.error(
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from bm25_index import tokenize, normalize, varint_encode, varint_decode, encode_postings, decode_postings
+
+
+@pytest.mark.parametrize("values", [
+    [],
+    [0],
+    [0, 1, 127, 128, 255, 16_383, 16_384],
+    [2 ** 32, 2 ** 56 - 1, 2 ** 63 - 1],
+])
+def test_varint_round_trip(values):
+    assert varint_decode(varint_encode(values)).tolist() == values
+
+
+def test_varint_uses_one_byte_below_128():
+    assert varint_encode([0, 1, 127]) == bytes([0, 1, 127])
+    # 300 = 0b10_0101100 → 0xAC 0x02 (bajo primero, bit alto = continúa)
+    assert varint_encode([300]) == bytes([0xAC, 0x02])
+
+
+def test_postings_round_trip():
+    doc_ids = [3, 4, 10, 1_000, 1_000_000]
+    tfs = [1, 2, 1, 300, 7]
+    ids, freqs = decode_postings(encode_postings(doc_ids, tfs), len(doc_ids))
+    assert ids.tolist() == doc_ids
+    assert freqs.tolist() == tfs
+
+
+def test_postings_store_gaps():
+    # Ids consecutivos: todos los gaps caben en un byte
+    buf = encode_postings(np.arange(1_000, 1_200), np.ones(200))
+    assert len(buf) == 2 + 199 + 200
+
+
+@pytest.mark.parametrize("text", ["9,860,000.00", "9.860.000,00", "9860000"])
+def test_number_formats_share_a_token(text):
+    assert "9860000" in tokenize(text)
+
+
+def test_number_formats_match_each_other():
+    us, eu = tokenize("9,860,000.00"), tokenize("9.860.000,00")
+    assert set(us) & set(eu) == {"9860000", "9860000.00"}
+
+
+@pytest.mark.parametrize("text, unrelated", [
+    ("9,860,000.00", "986000000"),
+    ("9.860.000,00", "986000000"),
+    ("1.50", "150"),
+    ("0,50", "050"),
+])
+def test_decimals_are_never_joined_to_the_integer_part(text, unrelated):
+    assert unrelated not in tokenize(text)
+    assert not set(tokenize(text)) & set(tokenize(unrelated))
+
+
+def test_tokenize_keeps_account_numbers_whole():
+    assert tokenize("Cuenta 1001210002790") == ["cuenta", "1001210002790"]
+
+
+def test_tokenize_drops_stopwords_and_single_letters():
+    assert tokenize("Pago de la OP a y b nómina") == ["pago", "op", "nomina"]
+
+
+def test_normalize_fixes_ocr_digits():
+    assert "1001" in normalize("1OO1")
+    assert "215" in normalize("2l5")
+    # Solo dentro de números: las palabras no se tocan
+    assert normalize("Operación") == "operacion"
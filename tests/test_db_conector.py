@@ -0,0 +1,72 @@
+import pytest
+
+pyodbc = pytest.importorskip("pyodbc")
+
+import db_conector  # noqa: E402
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Conexiones abiertas por get_connection; close_connection debe descartar la del hilo."""
+    opened = []
+
+    def connect(*args, **kwargs):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(db_conector.pyodbc, "connect", connect)
+    db_conector.close_connection()
+    yield opened
+    db_conector.close_connection()
+
+
+def _flaky_batch(monkeypatch, failures):
+    """db_metadata_batch que falla `failures` veces (con la conexión del hilo) y luego responde."""
+    calls = []
+
+    def batch(ids, typeFile="op", batch_size=None):
+        conn = db_conector.get_connection()
+        calls.append((list(ids), conn))
+        if len(calls) <= failures:
+            raise pyodbc.Error("08S01", "Communication link failure")
+        return {i: {"pdf_name": f"{i}.pdf"} for i in ids}, []
+
+    monkeypatch.setattr(db_conector, "db_metadata_batch", batch)
+    return calls
+
+
+def test_batch_is_retried_once_on_a_new_connection(monkeypatch, connections):
+    calls = _flaky_batch(monkeypatch, failures=1)
+    out = list(db_conector.iter_metadata([1, 2, 3], batch_size=10))
+    assert out == [(i, {"pdf_name": f"{i}.pdf"}, None) for i in (1, 2, 3)]
+    assert len(calls) == 2
+    # El reintento no reutiliza la conexión caída
+    assert calls[0][1] is not calls[1][1]
+    assert connections[0].closed
+
+
+def test_batch_that_fails_twice_reports_each_id_and_moves_on(monkeypatch, connections):
+    calls = _flaky_batch(monkeypatch, failures=2)
+    out = list(db_conector.iter_metadata([1, 2, 3, 4], batch_size=2))
+    assert [(i, r) for i, r, _ in out] == [(1, None), (2, None), (3, {"pdf_name": "3.pdf"}), (4, {"pdf_name": "4.pdf"})]
+    assert all(isinstance(e, pyodbc.Error) for _, _, e in out[:2])
+    assert [e for _, _, e in out[2:]] == [None, None]
+    assert [ids for ids, _ in calls] == [[1, 2], [1, 2], [3, 4]]
+    assert len(connections) == 3
+
+
+def test_other_errors_are_not_swallowed(monkeypatch, connections):
+    def batch(ids, typeFile="op", batch_size=None):
+        raise ValueError("Tipo no reconocido")
+
+    monkeypatch.setattr(db_conector, "db_metadata_batch", batch)
+    with pytest.raises(ValueError):
+        list(db_conector.iter_metadata([1]))
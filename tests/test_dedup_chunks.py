@@ -0,0 +1,78 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+from ann_index import IVFIndex, build_from_store
+from dedup_chunks import dedup
+from vector_store import VectorStoreWriter
+
+ROOT = Path(__file__).resolve().parent.parent
+TEMPLATE = (ROOT / "175922-OP_0004.txt").read_text(encoding="utf-8")[:1500]
+OTHER = (ROOT / "175924_OP_0001.txt").read_text(encoding="utf-8")[:1500]
+
+
+def _chunk(op, content, year=2016, month="Enero", account="1001210002790"):
+    return {"id": f"{op}_OP_0001_p1_c0", "doc_id": f"{op}_OP_0001.txt", "page": 1, "chunk_idx": 0,
+            "content": content, "year": year, "month": month, "account": account, "number": op}
+
+
+def _write(path, chunks):
+    path.write_text("".join(json.dumps(c, ensure_ascii=False) + "\n" for c in chunks), encoding="utf-8")
+
+
+def _read(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_template_collapses_across_documents(tmp_path):
+    # La misma plantilla en 10 OP distintas (y de dos años), con el número de OP cambiado
+    chunks = [_chunk(175900 + i, TEMPLATE.replace("175922", str(175900 + i)), year=2016 + i % 2)
+              for i in range(10)]
+    chunks.append(_chunk(175924, OTHER))
+    _write(tmp_path / "in.jsonl", chunks)
+
+    r = dedup([tmp_path / "in.jsonl"], tmp_path / "out.jsonl")
+    assert r == {"total": 11, "kept": 2, "duplicates": 9, "dup_ratio": 9 / 11}
+
+    canonical, other = _read(tmp_path / "out.jsonl")
+    assert canonical["number"] == 175900
+    assert [ref["number"] for ref in canonical["refs"]] == list(range(175901, 175910))
+    assert "content" not in canonical["refs"][0]
+    assert canonical["number_all"] == list(range(175900, 175910))
+    assert canonical["year_all"] == [2016, 2017]
+    assert canonical["month_all"] == ["Enero"]
+    assert "refs" not in other and other["number_all"] == [175924]
+
+
+def test_index_filters_find_canonical_by_duplicate_values(tmp_path):
+    chunks = [_chunk(175900 + i, TEMPLATE, year=2016 + i) for i in range(3)] + [_chunk(175924, OTHER, year=2020)]
+    _write(tmp_path / "in.jsonl", chunks)
+    dedup([tmp_path / "in.jsonl"], tmp_path / "out.jsonl")
+    kept = _read(tmp_path / "out.jsonl")
+    assert len(kept) == 2
+
+    vectors = np.eye(2, 4, dtype=np.float32)
+    with VectorStoreWriter(tmp_path / "store") as writer:
+        writer.add_many(kept, vectors)
+    index = build_from_store(tmp_path / "store", nlist=1)
+    query = vectors[0]
+
+    # Filtro por los valores de un duplicado: responde el canónico (fila 0)
+    assert index.search(query, 2, {"number": 175902})[0].tolist() == [0]
+    assert index.search(query, 2, {"year": 2017})[0].tolist() == [0]
+    assert index.search(query, 2, {"year": 2017, "number": 175924})[0].tolist() == []
+    assert sorted(index.search(query, 2, {"account": "1001210002790"})[0].tolist()) == [0, 1]
+
+    index.save(tmp_path / "index")
+    loaded = IVFIndex.load(tmp_path / "index")
+    assert loaded.search(query, 2, {"number": 175901})[0].tolist() == [0]
+    assert loaded.brute_force(query, 2, {"year": [2018, 2020]})[0].tolist() == [0, 1]
+
+
+def test_index_accepts_multi_valued_metadata():
+    index = IVFIndex(np.eye(1, 2, dtype=np.float32))
+    index.add(np.eye(3, 2, dtype=np.float32), {"year": [[2015, 2016], 2016, None], "month": ["Enero"] * 3})
+    index.compact()
+    assert sorted(index.brute_force([1, 0], 3, {"year": 2016})[0].tolist()) == [0, 1]
+    assert index.brute_force([1, 0], 3, {"year": 2015})[0].tolist() == [0]
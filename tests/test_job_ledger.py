@@ -0,0 +1,80 @@
+import pytest
+
+import job_ledger
+from job_ledger import JobLedger
+
+
+class FakeClock:
+    """Reemplaza al módulo time de job_ledger: el tiempo avanza solo cuando el test lo pide."""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(job_ledger, "time", c)
+    return c
+
+
+@pytest.fixture
+def ledger(tmp_path, clock):
+    l = JobLedger(tmp_path / "ledger.sqlite", max_attempts=3, backoff_s=10)
+    l.seed([1, 2])
+    yield l
+    l.close()
+
+
+def _attempts(ledger, file_id):
+    return ledger.conn.execute("SELECT attempts FROM jobs WHERE file_id = ?", (file_id,)).fetchone()[0]
+
+
+def test_start_counts_the_attempt(ledger):
+    ledger.start(1)
+    assert _attempts(ledger, 1) == 1
+    ledger.done(1, "a.jsonl")
+    assert _attempts(ledger, 1) == 1
+    assert ledger.summary() == {"done": 1, "pending": 1}
+
+
+def test_crash_loop_gives_up_after_max_attempts(ledger):
+    ledger.start(2)
+    ledger.done(2)
+    # Cada "corrida" toma el documento 1 y el proceso muere antes de done/fail
+    for run in range(1, 3):
+        assert ledger.runnable_ids() == [1]
+        ledger.start(1)
+        assert ledger.recover() == (1, 0)
+        assert _attempts(ledger, 1) == run
+    ledger.start(1)
+    assert ledger.recover() == (0, 1)
+    assert ledger.runnable_ids() == []
+    assert ledger.next_retry_in() is None
+    status, error = ledger.conn.execute("SELECT status, error FROM jobs WHERE file_id = 1").fetchone()
+    assert status == "failed"
+    assert "3 intentos" in error
+
+
+def test_fail_backs_off_exponentially(ledger, clock):
+    ledger.start(1)
+    ledger.fail(1, "timeout")
+    assert ledger.runnable_ids() == [2]
+    assert ledger.next_retry_in() == 10
+    clock.now += 10
+    assert ledger.runnable_ids() == [1, 2]
+    ledger.start(1)
+    ledger.fail(1, "timeout")
+    assert _attempts(ledger, 1) == 2
+    assert ledger.next_retry_in() == 20
+
+
+def test_fail_without_retry_is_final(ledger, clock):
+    # Id sin registro: falla sin start() y no se reintenta
+    ledger.fail(1, "sin registro", retry=False)
+    clock.now += 10_000
+    assert ledger.runnable_ids() == [2]
+    assert _attempts(ledger, 1) == 3
@@ -0,0 +1,68 @@
+import pytest
+
+import metrics
+from metrics import DocMetrics, MetricsRecorder
+
+
+@pytest.fixture
+def recorder(tmp_path, monkeypatch):
+    # VmHWM simulado: reinicios y lecturas sin depender de /proc
+    state = {"peak": 100.0, "resets": 0}
+
+    def reset():
+        state["resets"] += 1
+        state["peak"] = 10.0
+        return True
+
+    monkeypatch.setattr(metrics, "reset_peak_rss", reset)
+    monkeypatch.setattr(metrics, "peak_rss_mb", lambda: state["peak"])
+    r = MetricsRecorder("test", out_dir=tmp_path, enabled=False, profile_every=0)
+    r.state = state
+    return r
+
+
+def test_peak_window_is_per_document_while_previous_upload_runs(recorder):
+    # Como run_pipeline: el DocMetrics nace al encolar la descarga; la ventana se abre en el OCR
+    first, second = DocMetrics("a", file_id=1), DocMetrics("b", file_id=2)
+    recorder.start("a", metrics=first)
+    recorder.state["peak"] = 300.0
+    recorder.end_peak(first)
+    # La subida de "a" sigue en curso cuando empieza el OCR de "b"
+    recorder.start("b", metrics=second)
+    recorder.state["peak"] = 50.0
+    recorder.end_peak(second)
+    rec_b = recorder.finish(second)
+    rec_a = recorder.finish(first)
+    assert recorder.state["resets"] == 2
+    assert (rec_a["peak_rss_mb"], rec_a["peak_rss_scope"]) == (300.0, "doc")
+    assert (rec_b["peak_rss_mb"], rec_b["peak_rss_scope"]) == (50.0, "doc")
+    assert rec_a["file_id"] == 1
+
+
+def test_overlapping_windows_are_marked_shared(recorder):
+    a = recorder.start("a")
+    b = recorder.start("b")
+    assert recorder.state["resets"] == 1
+    assert recorder.finish(a)["peak_rss_scope"] == "shared"
+    assert recorder.finish(b)["peak_rss_scope"] == "shared"
+
+
+def test_document_that_never_started_ocr_reports_process_peak(recorder):
+    # Falla en la descarga: nunca abrió su ventana
+    rec = recorder.finish(DocMetrics("a"), "fail", "timeout")
+    assert rec["peak_rss_scope"] == "process"
+    assert recorder.state["resets"] == 0
+
+
+def test_add_max_keeps_the_largest_value(recorder):
+    m = recorder.start("a")
+    m.add_max(ocr_peak_rss_mb=120.0)
+    m.add_max(ocr_peak_rss_mb=None)
+    m.add_max(ocr_peak_rss_mb=80.0)
+    rec = recorder.finish(m)
+    assert rec["ocr_peak_rss_mb"] == 120.0
+    other = recorder.start("b")
+    other.add_max(ocr_peak_rss_mb=90.0)
+    recorder.finish(other)
+    assert recorder.summary()["ocr_peak_rss_mb"] == 120.0
+    assert "pipeline_test_ocr_peak_rss_bytes 125829120" in recorder.prometheus_text()
@@ -0,0 +1,57 @@
+import pytest
+
+import ocr_cache
+from ocr_cache import OcrCache
+
+
+class FakeClock:
+    """Reemplaza al módulo time de ocr_cache: cada lectura avanza un segundo, así los accesos quedan ordenados."""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr_cache, "time", FakeClock())
+    c = OcrCache(tmp_path / "ocr.sqlite")
+    # Límite en bytes para el test (max_mb es en MB)
+    c.max_bytes = 300
+    yield c
+    c.close()
+
+
+def _pages(cache, pdf_hash):
+    return sorted(r[0] for r in cache.conn.execute("SELECT page FROM ocr_pages WHERE pdf_hash = ?", (pdf_hash,)))
+
+
+def test_round_trip_and_hit_rate(cache):
+    cache.put_many("a", "s", {1: ("uno", 300, 91.5), 2: ("dos", 150, None)})
+    assert cache.get_many("a", [1, 2, 3], "s") == {1: ("uno", 300, 91.5), 2: ("dos", 150, None)}
+    # Otra configuración de OCR no aplica
+    assert cache.get_many("a", [1], "otra") == {}
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_evicts_least_recently_used_under_max_bytes(cache):
+    cache.put_many("a", "s", {1: ("x" * 100, None, None), 2: ("x" * 100, None, None)})
+    cache.put_many("b", "s", {1: ("x" * 100, None, None)})
+    assert cache.evict() == 0
+    # Leer a/1 lo vuelve el más reciente: la siguiente expulsión empieza por a/2
+    cache.get_many("a", [1], "s")
+    cache.put_many("c", "s", {1: ("x" * 100, None, None)})
+    assert _pages(cache, "a") == [1]
+    assert _pages(cache, "b") == [1]
+    assert _pages(cache, "c") == [1]
+    # Una entrada grande expulsa varias, en orden de último acceso (b, a, c)
+    cache.put_many("d", "s", {1: ("x" * 250, None, None)})
+    assert [_pages(cache, h) for h in "abcd"] == [[], [], [], [1]]
+
+
+def test_size_counts_utf8_bytes(cache):
+    cache.put_many("a", "s", {1: ("ñ" * 100, None, None)})
+    assert cache.conn.execute("SELECT size FROM ocr_pages").fetchone()[0] == 200
@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("pyodbc")
+pytest.importorskip("dotenv")
+
+import run_jobs_from_sql as jobs  # noqa: E402
+
+
+def _write_module(tmp_path, body):
+    path = tmp_path / "job_module.py"
+    path.write_text(body, encoding="utf-8")
+    return f"{path}:run"
+
+
+def test_bad_callable_fails_before_starting_workers(monkeypatch):
+    def no_workers(*args, **kwargs):
+        raise AssertionError("no debe lanzar workers")
+
+    monkeypatch.setenv("EXEC_MODE", "inprocess")
+    monkeypatch.setenv("JOB_CALLABLE", "no_existe_este_modulo:main")
+    monkeypatch.setattr(jobs, "_Worker", no_workers)
+    monkeypatch.setattr(jobs, "yield_file_paths", lambda: iter(["a.pdf"]))
+    assert jobs.main() == 2
+
+
+def test_assign_to_dead_worker_returns_false(tmp_path):
+    # El worker muere al importar el callable, antes de recibir tareas
+    worker = jobs._Worker(_write_module(tmp_path, "import os\nos._exit(3)\n"))
+    worker.proc.join(timeout=10)
+    assert not worker.proc.is_alive()
+    assert worker.assign("a.pdf", 0) is False
+    worker.kill()
+
+
+def test_rows_sent_to_dying_workers_count_as_failures(tmp_path):
+    spec = _write_module(tmp_path, "import os\nos._exit(3)\n")
+    assert jobs.run_in_process(spec, ["a.pdf", "b.pdf", "c.pdf"], workers=2, timeout_s=0) == (3, 0, 3)
+
+
+def test_persistent_workers_process_every_row(tmp_path):
+    spec = _write_module(tmp_path, "def run(file_path):\n    return 0 if file_path.endswith('.pdf') else 1\n")
+    assert jobs.run_in_process(spec, ["a.pdf", "b.txt", "c.pdf"], workers=2, timeout_s=30) == (3, 2, 1)
@@ -0,0 +1,58 @@
+import re
+
+from token_chunker import chunk_pages_by_tokens
+
+_WORD = re.compile(r"\S+")
+
+
+class WordTokenizer:
+    """Tokenizer de prueba: un token por palabra, con offsets como los de transformers."""
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False):
+        if isinstance(text, list):
+            return {"input_ids": [[0] * len(_WORD.findall(t)) for t in text]}
+        return {"offset_mapping": [m.span() for m in _WORD.finditer(text)]}
+
+
+def _line(tag, n):
+    return " ".join(f"{tag}{i}" for i in range(n))
+
+
+def _chunk(pages, max_tokens=10, overlap_tokens=4):
+    return chunk_pages_by_tokens(pages, max_tokens, overlap_tokens, tokenizer=WordTokenizer())
+
+
+def test_chunks_cross_page_breaks():
+    chunks = _chunk([(1, _line("a", 4) + "\n" + _line("b", 4)), (2, _line("c", 4))], overlap_tokens=0)
+    assert [(c["page"], c["page_end"], c["tokens"]) for c in chunks] == [(1, 1, 8), (2, 2, 4)]
+    chunks = _chunk([(1, _line("a", 3)), (2, _line("b", 3)), (3, _line("c", 6))], overlap_tokens=0)
+    assert [(c["page"], c["page_end"]) for c in chunks] == [(1, 2), (3, 3)]
+    # El salto de página no pega palabras
+    assert chunks[0]["content"] == "a0 a1 a2\nb0 b1 b2"
+
+
+def test_long_line_is_split_by_token_offsets():
+    chunks = _chunk([(1, _line("w", 25))], overlap_tokens=0)
+    assert [c["tokens"] for c in chunks] == [10, 10, 5]
+    assert " ".join(c["content"] for c in chunks) == _line("w", 25)
+    assert all(c["page"] == c["page_end"] == 1 for c in chunks)
+
+
+def test_overlap_is_whole_lines_within_bounds():
+    lines = "\n".join(_line(f"l{i}_", 3) for i in range(6))
+    chunks = _chunk([(1, lines)], max_tokens=10, overlap_tokens=4)
+    assert all(c["tokens"] <= 10 for c in chunks)
+    for prev, cur in zip(chunks, chunks[1:]):
+        prev_lines, cur_lines = prev["content"].splitlines(), cur["content"].splitlines()
+        # Se arrastra la última línea completa (3 tokens ≤ 4) y nunca más de overlap_tokens
+        assert cur_lines[0] == prev_lines[-1]
+        assert cur_lines[1] not in prev_lines
+
+
+def test_overlap_is_dropped_when_it_does_not_fit():
+    chunks = _chunk([(1, _line("a", 3) + "\n" + _line("b", 8))], max_tokens=10, overlap_tokens=4)
+    assert [c["content"] for c in chunks] == [_line("a", 3), _line("b", 8)]
+
+
+def test_empty_pages_give_no_chunks():
+    assert _chunk([(1, ""), (2, "  \n\n")]) == []
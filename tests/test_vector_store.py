@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+
+from vector_store import quantize, jsonl_to_store, store_to_jsonl, VectorStore, VectorStoreWriter
+
+
+def _records(n=5, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    # float32 exactos: el round trip en float32 debe devolver los mismos valores
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    records = []
+    for i in range(n):
+        records.append({
+            "id": f"doc{i}_p1_c{i}",
+            "doc_id": f"doc{i}",
+            "page": i + 1,
+            "chunk_idx": i,
+            "content": f"Orden de pago {i} · cuenta 1001210002790 · señor Muñoz",
+            "number": 9_860_000 + i,
+            "year": 2023,
+            "month": "Enero",
+            "account": "1001210002790",
+            "method": "ocr",
+            "dpi": 300,
+            "content_vector": vectors[i].tolist(),
+        })
+    # Nulos en columnas enteras y de texto
+    records[-1].update(page=None, number=None, month=None, account=None)
+    return records
+
+
+def test_quantize_float32_is_identity():
+    vecs = np.random.default_rng(1).normal(size=(4, 16)).astype(np.float32)
+    data, scales = quantize(vecs, "float32")
+    assert scales is None
+    assert np.array_equal(data, vecs)
+
+
+def test_quantize_float16():
+    vecs = np.random.default_rng(2).normal(size=(4, 16)).astype(np.float32)
+    data, scales = quantize(vecs, "float16")
+    assert data.dtype == np.float16 and scales is None
+    assert np.allclose(data.astype(np.float32), vecs, atol=1e-2)
+
+
+def test_quantize_int8_error_is_within_half_a_step():
+    vecs = np.random.default_rng(3).normal(size=(32, 64)).astype(np.float32)
+    data, scales = quantize(vecs, "int8")
+    assert data.dtype == np.int8 and scales.dtype == np.float32
+    # El máximo absoluto de cada fila usa todo el rango
+    assert np.all(np.abs(data).max(axis=1) == 127)
+    error = np.abs(data * scales[:, None] - vecs)
+    assert np.all(error <= scales[:, None] / 2 + 1e-6)
+
+
+def test_quantize_int8_zero_row():
+    data, scales = quantize(np.zeros((1, 4)), "int8")
+    assert not data.any()
+    assert scales[0] == 1.0
+
+
+def test_writer_rejects_unknown_dtype(tmp_path):
+    with pytest.raises(ValueError):
+        VectorStoreWriter(tmp_path / "store", dtype="bfloat16")
+
+
+def test_jsonl_store_round_trip_is_lossless(tmp_path):
+    records = _records()
+    src = tmp_path / "chunks.jsonl"
+    src.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records), encoding="utf-8")
+
+    # batch_size pequeño: varios add_many en el mismo store
+    assert jsonl_to_store(src, tmp_path / "store", batch_size=2) == len(records)
+    assert store_to_jsonl(tmp_path / "store", tmp_path / "out.jsonl") == len(records)
+
+    with open(tmp_path / "out.jsonl", encoding="utf-8") as f:
+        back = [json.loads(line) for line in f]
+    assert back == records
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_store_keeps_metadata(tmp_path, dtype):
+    records = _records(seed=4)
+    with VectorStoreWriter(tmp_path / "store", dtype) as writer:
+        writer.add_many(records)
+    store = VectorStore(tmp_path / "store")
+    assert len(store) == len(records)
+    for i, r in enumerate(records):
+        rec = store.record(i, with_vector=True)
+        vector = rec.pop("content_vector")
+        assert rec == {k: v for k, v in r.items() if k != "content_vector"}
+        cos = np.dot(vector, r["content_vector"]) / (np.linalg.norm(vector) * np.linalg.norm(r["content_vector"]))
+        assert cos > 0.999
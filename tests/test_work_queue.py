@@ -0,0 +1,127 @@
+import pytest
+
+import work_queue
+from work_queue import SqliteQueueBackend, LeaseLedger
+
+
+class FakeClock:
+    """Reemplaza al módulo time de work_queue: el tiempo avanza solo cuando el test lo pide."""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(work_queue, "time", c)
+    return c
+
+
+@pytest.fixture
+def backend(tmp_path, clock):
+    b = SqliteQueueBackend(tmp_path / "queue.sqlite", lease_s=100, max_attempts=3, backoff_s=10)
+    b.enqueue(range(1, 11))
+    yield b
+    b.close()
+
+
+def test_enqueue_is_idempotent(backend):
+    backend.enqueue(range(1, 21))
+    assert backend.summary() == {"pending": 20}
+
+
+def test_leases_are_exclusive_and_ordered(backend):
+    a = backend.lease("a", 4)
+    b = backend.lease("b", 4)
+    assert a == [1, 2, 3, 4]
+    assert b == [5, 6, 7, 8]
+    assert backend.lease("c", 10) == [9, 10]
+    assert backend.lease("c", 10) == []
+    assert backend.remaining() == (0, 10)
+
+
+def test_two_connections_never_share_a_lease(tmp_path, clock):
+    path = tmp_path / "queue.sqlite"
+    first, second = SqliteQueueBackend(path), SqliteQueueBackend(path)
+    first.enqueue(range(100))
+    taken = []
+    while True:
+        ids = first.lease("a", 7) + second.lease("b", 5)
+        if not ids:
+            break
+        taken += ids
+    assert sorted(taken) == list(range(100))
+    first.close()
+    second.close()
+
+
+def test_expired_lease_is_taken_by_another_node(backend, clock):
+    assert backend.lease("a", 2) == [1, 2]
+    clock.now += 99
+    assert backend.lease("b", 2) == [3, 4]
+    clock.now += 2
+    # Los leases de "a" vencieron: vuelven a la cola antes que los pendientes de id mayor
+    assert backend.lease("b", 2) == [1, 2]
+
+
+def test_fencing_rejects_results_from_a_stale_lease(backend, clock):
+    backend.lease("a", 1)
+    clock.now += 101
+    assert backend.lease("b", 1) == [1]
+    assert not backend.complete("a", 1, "a.jsonl")
+    assert not backend.fail("a", 1, "tarde")
+    assert backend.complete("b", 1, "b.jsonl")
+    assert backend.summary() == {"done": 1, "pending": 9}
+
+
+def test_heartbeat_extends_only_own_leases(backend, clock):
+    backend.lease("a", 2)
+    clock.now += 90
+    assert backend.heartbeat("a", [1, 2]) == 2
+    assert backend.heartbeat("b", [1, 2]) == 0
+    clock.now += 90
+    # Sin el heartbeat habrían vencido a los 100 s
+    assert backend.lease("b", 10) == list(range(3, 11))
+
+
+def test_failed_jobs_back_off_exponentially_until_max_attempts(backend, clock):
+    assert backend.lease("a", 1) == [1]
+    assert backend.fail("a", 1, "error 1")
+    assert backend.lease("a", 1) == [2]        # el 1 espera su backoff (10 s)
+    backend.complete("a", 2)
+    clock.now += 10
+    assert backend.lease("a", 1) == [1]
+    backend.fail("a", 1, "error 2")
+    clock.now += 10
+    assert 1 not in backend.lease("a", 1)      # segundo intento fallido: 20 s
+    clock.now += 10
+    assert backend.lease("b", 1) == [1]
+    backend.fail("b", 1, "error 3")
+    clock.now += 1000
+    # Tres intentos agotados: no se vuelve a entregar
+    assert 1 not in backend.lease("c", 10)
+    assert backend.remaining()[0] == 0
+
+
+def test_fail_without_retry_is_final(backend, clock):
+    backend.lease("a", 1)
+    backend.fail("a", 1, "sin registro", retry=False)
+    clock.now += 10_000
+    assert 1 not in backend.lease("a", 10)
+
+
+def test_lease_ledger_tracks_held_ids(backend):
+    ledger = LeaseLedger(backend, worker_id="nodo-1", heartbeat_s=3600)
+    try:
+        assert ledger.lease(3) == [1, 2, 3]
+        assert ledger.held == {1, 2, 3}
+        ledger.done(1, "1.jsonl")
+        ledger.fail(2, "error")
+        assert ledger.held == {3}
+        assert ledger.summary() == {"done": 1, "failed": 1, "leased": 1, "pending": 7}
+    finally:
+        ledger.close()
@@ -0,0 +1,41 @@
+import os, re, shutil, subprocess
+
+# Mínimo de caracteres alfanuméricos para considerar que una página tiene texto real
+TEXT_MIN_CHARS = int(os.getenv("TEXT_MIN_CHARS", 50))
+# Proporción mínima de caracteres "legibles" (evita capas de texto basura sin ToUnicode)
+TEXT_MIN_RATIO = float(os.getenv("TEXT_MIN_RATIO", 0.8))
+
+_READABLE = re.compile(r"[\w.,;:()$%/#*\-–'\"¿?¡!|°]")
+
+
+def extract_pages_with_pdftotext(pdf_path):
+    """
+    Devuelve una lista con el texto de cada página usando pdftotext (una sola llamada
+    para todo el documento; pdftotext separa las páginas con \\f).
+    Lista vacía si pdftotext no está disponible o falla.
+    """
+    if not shutil.which("pdftotext"):
+        return []
+    try:
+        out = subprocess.check_output(
+            ["pdftotext", "-layout", pdf_path, "-"],
+            stderr=subprocess.DEVNULL
+        )
+    except subprocess.CalledProcessError:
+        return []
+    pages = out.decode("utf-8", "ignore").split("\f")
+    # pdftotext termina con un \f tras la última página
+    if pages and not pages[-1].strip():
+        pages.pop()
+    return pages
+
+
+def has_text_layer(txt, min_chars=TEXT_MIN_CHARS, min_ratio=TEXT_MIN_RATIO):
+    """True si el texto embebido de la página es suficiente para no hacer OCR."""
+    visible = "".join(txt.split())
+    if sum(c.isalnum() for c in visible) < min_chars:
+        return False
+    if "�" in visible or "(cid:" in visible:
+        return False
+    readable = len(_READABLE.findall(visible))
+    return readable / len(visible) >= min_ratio
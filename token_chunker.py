@@ -0,0 +1,81 @@
+import os, re
+from functools import lru_cache
+
+# Debe coincidir con embed_chunks.MODEL_NAME: el tamaño se mide con su propio tokenizer
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", "intfloat/multilingual-e5-small")
+# E5-small trunca a 512 tokens; se reserva margen para "passage: " y los tokens especiales
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 480))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 48))
+
+# Una línea con sus saltos de línea finales: unidad mínima de corte
+_UNIT = re.compile(r"[^\n]*\n+|[^\n]+$")
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name=TOKENIZER_MODEL):
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def _split_long(tokenizer, text, max_tokens):
+    """Parte una unidad que por sí sola excede max_tokens usando los offsets del tokenizer."""
+    enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+    offsets = enc["offset_mapping"]
+    parts = []
+    for start in range(0, len(offsets), max_tokens):
+        window = offsets[start:start + max_tokens]
+        begin = window[0][0]
+        end = offsets[start + max_tokens][0] if start + max_tokens < len(offsets) else len(text)
+        parts.append((text[begin:end], len(window)))
+    return parts
+
+
+def chunk_pages_by_tokens(pages, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, tokenizer=None):
+    """
+    Chunking por tokens del modelo de embeddings, cruzando límites de página.
+    `pages` es una lista de (page, texto) en orden. Todas las líneas se tokenizan en
+    un solo lote. Devuelve dicts {page, page_end, content, tokens}: `page` es la
+    página donde empieza el chunk y `page_end` donde termina.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    # Cada página termina en salto de línea para que los chunks que cruzan páginas no peguen palabras
+    units = [(page, u) for page, text in pages for u in _UNIT.findall(text.rstrip() + "\n") if u.strip()]
+    if not units:
+        return []
+    lengths = [len(ids) for ids in tokenizer([u for _, u in units], add_special_tokens=False)["input_ids"]]
+
+    pieces = []
+    for (page, text), n in zip(units, lengths):
+        if n > max_tokens:
+            pieces.extend((page, part, m) for part, m in _split_long(tokenizer, text, max_tokens))
+        else:
+            pieces.append((page, text, n))
+
+    chunks, current, current_tokens = [], [], 0
+
+    def emit():
+        chunks.append({
+            "page": current[0][0],
+            "page_end": current[-1][0],
+            "content": "".join(t for _, t, _ in current).strip(),
+            "tokens": current_tokens,
+        })
+
+    for piece in pieces:
+        if current and current_tokens + piece[2] > max_tokens:
+            emit()
+            # Solapamiento: se arrastran las últimas líneas hasta overlap_tokens
+            tail, tail_tokens = [], 0
+            for prev in reversed(current):
+                if tail_tokens + prev[2] > overlap_tokens:
+                    break
+                tail.insert(0, prev)
+                tail_tokens += prev[2]
+            if tail_tokens + piece[2] > max_tokens:
+                tail, tail_tokens = [], 0
+            current, current_tokens = tail, tail_tokens
+        current.append(piece)
+        current_tokens += piece[2]
+    if current:
+        emit()
+    return chunks
@@ -0,0 +1,227 @@
+import os, sys, json, time, argparse
+from pathlib import Path
+
+import numpy as np
+
+# Formato en disco (un directorio):
+#   manifest.json            count, dim, dtype y columnas
+#   vectors.bin              matriz count × dim contigua (float32 | float16 | int8), mapeable con np.memmap
+#   scales.bin               solo int8: escala float32 por fila (x ≈ q * scale)
+#   <col>.bin                columnas enteras (int64, INT_NULL = nulo)
+#   <col>.offsets.bin/.data.bin/.valid.bin   columnas de texto (offsets int64 + UTF-8 + validez)
+# Los campos que no son columnas (method, dpi, page_end, ...) van como JSON en la columna "extra".
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+INT_COLUMNS = ("page", "chunk_idx", "number", "year")
+STR_COLUMNS = ("id", "doc_id", "month", "account", "content", "extra")
+INT_NULL = np.iinfo(np.int64).min
+
+
+def quantize(vecs, dtype):
+    """Devuelve (matriz en dtype, escalas por fila o None)."""
+    vecs = np.asarray(vecs, dtype=np.float32)
+    if dtype == "float32":
+        return vecs, None
+    if dtype == "float16":
+        return vecs.astype(np.float16), None
+    scales = np.abs(vecs).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vecs / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class VectorStoreWriter:
+    """Escritura en streaming: los archivos crecen por append y el manifest se escribe al cerrar."""
+
+    def __init__(self, out_dir, dtype="float32"):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"dtype no soportado: {dtype}. Usa {', '.join(VECTOR_DTYPES)}.")
+        self.dir = Path(out_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.dtype = dtype
+        self.dim = None
+        self.count = 0
+        self._vectors = open(self.dir / "vectors.bin", "wb")
+        self._scales = open(self.dir / "scales.bin", "wb") if dtype == "int8" else None
+        self._ints = {c: open(self.dir / f"{c}.bin", "wb") for c in INT_COLUMNS}
+        self._strs = {c: {
+            "offsets": open(self.dir / f"{c}.offsets.bin", "wb"),
+            "data": open(self.dir / f"{c}.data.bin", "wb"),
+            "valid": open(self.dir / f"{c}.valid.bin", "wb"),
+            "pos": 0,
+        } for c in STR_COLUMNS}
+        for col in self._strs.values():
+            col["offsets"].write(np.int64(0).tobytes())
+
+    def add_many(self, records, vectors=None):
+        """Agrega registros; los vectores vienen en `vectors` o en record["content_vector"]."""
+        if not records:
+            return
+        if vectors is None:
+            vectors = [r["content_vector"] for r in records]
+        data, scales = quantize(vectors, self.dtype)
+        if self.dim is None:
+            self.dim = data.shape[1]
+        elif data.shape[1] != self.dim:
+            raise ValueError(f"Dimensión {data.shape[1]} distinta de la del store ({self.dim}).")
+        self._vectors.write(np.ascontiguousarray(data).tobytes())
+        if scales is not None:
+            self._scales.write(scales.tobytes())
+
+        for c in INT_COLUMNS:
+            values = [INT_NULL if r.get(c) is None else int(r[c]) for r in records]
+            self._ints[c].write(np.asarray(values, dtype=np.int64).tobytes())
+        for c in STR_COLUMNS:
+            col, offsets, valid = self._strs[c], [], []
+            for r in records:
+                if c == "extra":
+                    extra = {k: v for k, v in r.items()
+                             if k not in INT_COLUMNS and k not in STR_COLUMNS and k != "content_vector"}
+                    value = json.dumps(extra, ensure_ascii=False) if extra else None
+                else:
+                    value = r.get(c)
+                raw = b"" if value is None else str(value).encode("utf-8")
+                col["data"].write(raw)
+                col["pos"] += len(raw)
+                offsets.append(col["pos"])
+                valid.append(value is not None)
+            col["offsets"].write(np.asarray(offsets, dtype=np.int64).tobytes())
+            col["valid"].write(np.asarray(valid, dtype=np.uint8).tobytes())
+        self.count += len(records)
+
+    def close(self):
+        for f in [self._vectors, self._scales, *self._ints.values()]:
+            if f is not None:
+                f.close()
+        for col in self._strs.values():
+            for key in ("offsets", "data", "valid"):
+                col[key].close()
+        manifest = {
+            "count": self.count,
+            "dim": self.dim or 0,
+            "dtype": self.dtype,
+            "int_columns": list(INT_COLUMNS),
+            "str_columns": list(STR_COLUMNS),
+        }
+        with open(self.dir / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _StrColumn:
+    def __init__(self, base):
+        self.offsets = np.memmap(f"{base}.offsets.bin", dtype=np.int64, mode="r")
+        self.valid = np.memmap(f"{base}.valid.bin", dtype=np.uint8, mode="r")
+        size = os.path.getsize(f"{base}.data.bin")
+        self.data = np.memmap(f"{base}.data.bin", dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+
+    def __getitem__(self, i):
+        if not self.valid[i]:
+            return None
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+
+class VectorStore:
+    """Lectura con np.memmap: abrir el store no carga vectores ni columnas en RAM."""
+
+    def __init__(self, path):
+        self.dir = Path(path)
+        with open(self.dir / "manifest.json", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.count, self.dim, self.dtype = self.manifest["count"], self.manifest["dim"], self.manifest["dtype"]
+        shape = (self.count, self.dim)
+        self.vectors = np.memmap(self.dir / "vectors.bin", dtype=self.dtype, mode="r", shape=shape) \
+            if self.count else np.zeros((0, self.dim), dtype=self.dtype)
+        self.scales = np.memmap(self.dir / "scales.bin", dtype=np.float32, mode="r", shape=(self.count,)) \
+            if self.dtype == "int8" and self.count else None
+        self.ints = {c: np.memmap(self.dir / f"{c}.bin", dtype=np.int64, mode="r")
+                     for c in self.manifest["int_columns"]} if self.count else {}
+        self.strs = {c: _StrColumn(self.dir / c) for c in self.manifest["str_columns"]} if self.count else {}
+
+    def __len__(self):
+        return self.count
+
+    def vectors_f32(self, start=0, stop=None):
+        """Vectores [start, stop) como float32 (de-cuantizados si hace falta)."""
+        block = np.asarray(self.vectors[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:stop, None]
+        return block
+
+    def int_column(self, name):
+        return self.ints[name]
+
+    def record(self, i, with_vector=False):
+        rec = {c: self.strs[c][i] for c in ("id", "doc_id")}
+        for c in ("page", "chunk_idx"):
+            rec[c] = None if self.ints[c][i] == INT_NULL else int(self.ints[c][i])
+        rec["content"] = self.strs["content"][i]
+        extra = self.strs["extra"][i]
+        if extra:
+            rec.update(json.loads(extra))
+        rec["number"] = None if self.ints["number"][i] == INT_NULL else int(self.ints["number"][i])
+        rec["year"] = None if self.ints["year"][i] == INT_NULL else int(self.ints["year"][i])
+        rec["month"] = self.strs["month"][i]
+        rec["account"] = self.strs["account"][i]
+        if with_vector:
+            rec["content_vector"] = self.vectors_f32(i, i + 1)[0].tolist()
+        return rec
+
+
+def jsonl_to_store(in_path, out_dir, dtype="float32", batch_size=4096):
+    """Convierte la salida JSONL de embed_chunks.py al store binario, en streaming."""
+    with VectorStoreWriter(out_dir, dtype) as writer, open(in_path, "r", encoding="utf-8") as f:
+        batch = []
+        for line in f:
+            if line.strip():
+                batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                writer.add_many(batch)
+                batch = []
+        writer.add_many(batch)
+    return writer.count
+
+
+def store_to_jsonl(store_dir, out_path):
+    """Convierte el store al JSONL con content_vector (ruta del indexador de Azure)."""
+    store = VectorStore(store_dir)
+    with open(out_path, "w", encoding="utf-8") as f:
+        for i in range(len(store)):
+            f.write(json.dumps(store.record(i, with_vector=True), ensure_ascii=False) + "\n")
+    return len(store)
+
+
+if __name__ == "__main__":
+    # Uso:
+    #   python vector_store.py to-store chunks_with_vectors.jsonl store_dir --dtype float16
+    #   python vector_store.py to-jsonl store_dir chunks_with_vectors.jsonl
+    #   python vector_store.py info store_dir
+    parser = argparse.ArgumentParser(description="Store binario de vectores de chunks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("to-store")
+    p.add_argument("jsonl")
+    p.add_argument("store_dir")
+    p.add_argument("--dtype", choices=VECTOR_DTYPES, default="float32")
+    p = sub.add_parser("to-jsonl")
+    p.add_argument("store_dir")
+    p.add_argument("jsonl")
+    p = sub.add_parser("info")
+    p.add_argument("store_dir")
+    args = parser.parse_args()
+
+    if args.cmd == "to-store":
+        n = jsonl_to_store(args.jsonl, args.store_dir, args.dtype)
+        print(f"✅ {n} chunks → {args.store_dir} ({args.dtype})")
+    elif args.cmd == "to-jsonl":
+        n = store_to_jsonl(args.store_dir, args.jsonl)
+        print(f"✅ {n} chunks → {args.jsonl}")
+    else:
+        t0 = time.perf_counter()
+        store = VectorStore(args.store_dir)
+        print(f"📦 {len(store)} vectores dim={store.dim} dtype={store.dtype} "
+              f"abiertos en {1000 * (time.perf_counter() - t0):.2f} ms")
+    sys.exit(0)
@@ -0,0 +1,300 @@
+import os, time, socket, sqlite3, threading
+from pathlib import Path
+
+# Duración de un lease; el nodo lo renueva cada QUEUE_HEARTBEAT_S mientras procesa
+QUEUE_LEASE_S = int(os.getenv("QUEUE_LEASE_S", 900))
+QUEUE_HEARTBEAT_S = float(os.getenv("QUEUE_HEARTBEAT_S", QUEUE_LEASE_S / 3))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", 5))
+QUEUE_RETRY_BACKOFF_S = int(os.getenv("QUEUE_RETRY_BACKOFF_S", 60))
+QUEUE_SQLITE_PATH = os.getenv("QUEUE_SQLITE_PATH", "./cache/work_queue.sqlite")
+# Espera entre sondeos cuando no hay trabajo disponible pero otros nodos tienen leases activos
+QUEUE_POLL_S = float(os.getenv("QUEUE_POLL_S", 30))
+
+# Estados: pending → leased → done | failed (reintenta con backoff hasta QUEUE_MAX_ATTEMPTS).
+# Un lease vencido (nodo caído) vuelve a estar disponible sin intervención.
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SqliteQueueBackend:
+    """Cola en SQLite: para pruebas y para varios procesos en una misma máquina."""
+
+    def __init__(self, path=QUEUE_SQLITE_PATH, lease_s=QUEUE_LEASE_S, max_attempts=QUEUE_MAX_ATTEMPTS,
+                 backoff_s=QUEUE_RETRY_BACKOFF_S):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lease_s, self.max_attempts, self.backoff_s = lease_s, max_attempts, backoff_s
+        self.lock = threading.Lock()
+        # isolation_level=None: las transacciones se controlan a mano (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS work_queue (
+                file_id INTEGER PRIMARY KEY,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker_id TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                started_at REAL,
+                finished_at REAL,
+                output_blob TEXT,
+                error TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_work_queue_status ON work_queue(status, lease_until)")
+
+    def enqueue(self, file_ids):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany("INSERT OR IGNORE INTO work_queue (file_id) VALUES (?)", ((i,) for i in file_ids))
+            self.conn.execute("COMMIT")
+
+    def lease(self, worker_id, n=1):
+        """Toma hasta n ids disponibles (pendientes, con lease vencido o fallidos listos para reintento)."""
+        now = time.time()
+        with self.lock:
+            # BEGIN IMMEDIATE toma el lock de escritura: dos procesos no pueden elegir las mismas filas
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [r[0] for r in self.conn.execute(
+                    "SELECT file_id FROM work_queue WHERE attempts < ? AND ("
+                    "status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                    "OR (status = 'failed' AND next_attempt_at <= ?)) ORDER BY file_id LIMIT ?",
+                    (self.max_attempts, now, now, n))]
+                self.conn.executemany(
+                    "UPDATE work_queue SET status = 'leased', worker_id = ?, lease_until = ?, "
+                    "attempts = attempts + 1, started_at = ?, error = NULL WHERE file_id = ?",
+                    [(worker_id, now + self.lease_s, now, i) for i in ids])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def heartbeat(self, worker_id, file_ids):
+        """Renueva los leases de este nodo; devuelve cuántos seguían siendo suyos."""
+        if not file_ids:
+            return 0
+        marks = ", ".join("?" * len(file_ids))
+        with self.lock:
+            return self.conn.execute(
+                f"UPDATE work_queue SET lease_until = ? WHERE status = 'leased' AND worker_id = ? "
+                f"AND file_id IN ({marks})", (time.time() + self.lease_s, worker_id, *file_ids)).rowcount
+
+    def complete(self, worker_id, file_id, output_blob=None):
+        """False si el lease ya no era de este nodo (venció y lo tomó otro)."""
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE work_queue SET status = 'done', finished_at = ?, output_blob = ?, lease_until = NULL "
+                "WHERE file_id = ? AND worker_id = ? AND status = 'leased'",
+                (time.time(), output_blob, file_id, worker_id)).rowcount == 1
+
+    def fail(self, worker_id, file_id, error, retry=True):
+        now = time.time()
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE work_queue SET status = 'failed', finished_at = ?, lease_until = NULL, error = ?, "
+                "attempts = CASE WHEN ? THEN attempts ELSE ? END, "
+                "next_attempt_at = ? + ? * (1 << (attempts - 1)) "
+                "WHERE file_id = ? AND worker_id = ? AND status = 'leased'",
+                (now, str(error)[:2000], retry, self.max_attempts, now, self.backoff_s, file_id, worker_id)).rowcount == 1
+
+    def summary(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM work_queue GROUP BY status").fetchall())
+
+    def remaining(self):
+        """(disponibles ahora o más adelante, leases activos de cualquier nodo)."""
+        now = time.time()
+        with self.lock:
+            waiting, active = self.conn.execute(
+                "SELECT SUM(CASE WHEN attempts < ? AND (status = 'pending' OR status = 'failed' "
+                "OR (status = 'leased' AND lease_until < ?)) THEN 1 ELSE 0 END), "
+                "SUM(CASE WHEN status = 'leased' AND lease_until >= ? THEN 1 ELSE 0 END) FROM work_queue",
+                (self.max_attempts, now, now)).fetchone()
+        return waiting or 0, active or 0
+
+    def close(self):
+        self.conn.close()
+
+
+class SqlServerQueueBackend:
+    """
+    Cola en SQL Server, junto a tbl_files_op_final: la comparten todos los nodos.
+    Los tiempos son los del servidor (SYSUTCDATETIME), no los relojes de cada VM.
+    """
+
+    def __init__(self, table=None, lease_s=QUEUE_LEASE_S, max_attempts=QUEUE_MAX_ATTEMPTS,
+                 backoff_s=QUEUE_RETRY_BACKOFF_S):
+        from db_conector import SCHEMA, get_connection
+        self.table = table or f"{SCHEMA}.tbl_work_queue_op"
+        self.lease_s, self.max_attempts, self.backoff_s = lease_s, max_attempts, backoff_s
+        # Conexión por hilo (db_conector): el hilo de heartbeat no comparte la del pipeline
+        self._get_connection = get_connection
+        self._execute(f"""
+            IF OBJECT_ID('{self.table}', 'U') IS NULL
+            CREATE TABLE {self.table} (
+                file_id INT NOT NULL PRIMARY KEY,
+                status VARCHAR(10) NOT NULL DEFAULT 'pending',
+                worker_id VARCHAR(128) NULL,
+                lease_until DATETIME2 NULL,
+                attempts INT NOT NULL DEFAULT 0,
+                next_attempt_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME(),
+                started_at DATETIME2 NULL,
+                finished_at DATETIME2 NULL,
+                output_blob NVARCHAR(512) NULL,
+                error NVARCHAR(2000) NULL,
+                INDEX ix_work_queue_status (status, lease_until)
+            )
+        """)
+
+    def _execute(self, query, params=(), fetch=False):
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            rows = cursor.fetchall() if fetch else cursor.rowcount
+            conn.commit()
+            return rows
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def enqueue(self, file_ids):
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        try:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (file_id) SELECT ? WHERE NOT EXISTS "
+                f"(SELECT 1 FROM {self.table} WITH (UPDLOCK, HOLDLOCK) WHERE file_id = ?)",
+                [(i, i) for i in file_ids])
+            conn.commit()
+        finally:
+            cursor.close()
+
+    def lease(self, worker_id, n=1):
+        # READPAST salta las filas que otro nodo está tomando en este instante; UPDLOCK evita
+        # que dos nodos elijan la misma fila. Todo en una sentencia: no hace falta coordinar nodos.
+        rows = self._execute(f"""
+            WITH candidates AS (
+                SELECT TOP (?) * FROM {self.table} WITH (READPAST, UPDLOCK, ROWLOCK)
+                WHERE attempts < ? AND (
+                    status = 'pending'
+                    OR (status = 'leased' AND lease_until < SYSUTCDATETIME())
+                    OR (status = 'failed' AND next_attempt_at <= SYSUTCDATETIME()))
+                ORDER BY file_id
+            )
+            UPDATE candidates SET status = 'leased', worker_id = ?,
+                lease_until = DATEADD(second, ?, SYSUTCDATETIME()), attempts = attempts + 1,
+                started_at = SYSUTCDATETIME(), error = NULL
+            OUTPUT inserted.file_id
+        """, (n, self.max_attempts, worker_id, self.lease_s), fetch=True)
+        return sorted(r[0] for r in rows)
+
+    def heartbeat(self, worker_id, file_ids):
+        if not file_ids:
+            return 0
+        marks = ", ".join("?" * len(file_ids))
+        return self._execute(
+            f"UPDATE {self.table} SET lease_until = DATEADD(second, ?, SYSUTCDATETIME()) "
+            f"WHERE status = 'leased' AND worker_id = ? AND file_id IN ({marks})",
+            (self.lease_s, worker_id, *file_ids))
+
+    def complete(self, worker_id, file_id, output_blob=None):
+        return self._execute(
+            f"UPDATE {self.table} SET status = 'done', finished_at = SYSUTCDATETIME(), output_blob = ?, "
+            f"lease_until = NULL WHERE file_id = ? AND worker_id = ? AND status = 'leased'",
+            (output_blob, file_id, worker_id)) == 1
+
+    def fail(self, worker_id, file_id, error, retry=True):
+        return self._execute(
+            f"UPDATE {self.table} SET status = 'failed', finished_at = SYSUTCDATETIME(), lease_until = NULL, "
+            f"error = ?, attempts = CASE WHEN ? = 1 THEN attempts ELSE ? END, "
+            f"next_attempt_at = DATEADD(second, ? * POWER(2, attempts - 1), SYSUTCDATETIME()) "
+            f"WHERE file_id = ? AND worker_id = ? AND status = 'leased'",
+            (str(error)[:2000], int(retry), self.max_attempts, self.backoff_s, file_id, worker_id)) == 1
+
+    def summary(self):
+        return dict(self._execute(f"SELECT status, COUNT(*) FROM {self.table} GROUP BY status", fetch=True))
+
+    def remaining(self):
+        waiting, active = self._execute(f"""
+            SELECT
+                SUM(CASE WHEN attempts < ? AND (status IN ('pending', 'failed')
+                    OR (status = 'leased' AND lease_until < SYSUTCDATETIME())) THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = 'leased' AND lease_until >= SYSUTCDATETIME() THEN 1 ELSE 0 END)
+            FROM {self.table}
+        """, (self.max_attempts,), fetch=True)[0]
+        return waiting or 0, active or 0
+
+    def close(self):
+        from db_conector import close_connection
+        close_connection()
+
+
+class LeaseLedger:
+    """
+    Adaptador con la interfaz de JobLedger (start/done/fail) que usa run_pipeline, más un
+    hilo que renueva los leases en curso. Si el nodo muere, solo sus leases vencen y vuelven a la cola.
+    """
+
+    def __init__(self, backend, worker_id=None, heartbeat_s=QUEUE_HEARTBEAT_S):
+        self.backend = backend
+        self.worker_id = worker_id or default_worker_id()
+        self.heartbeat_s = heartbeat_s
+        self.held = set()
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+
+    def lease(self, n=1):
+        ids = self.backend.lease(self.worker_id, n)
+        with self.lock:
+            self.held.update(ids)
+        return ids
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_s):
+            with self.lock:
+                ids = sorted(self.held)
+            try:
+                renewed = self.backend.heartbeat(self.worker_id, ids)
+                if renewed < len(ids):
+                    print(f"⚠️ {len(ids) - renewed} leases vencidos antes de renovarse (los tomó otro nodo)")
+            except Exception as e:
+                print(f"⚠️ Error renovando leases: {e}")
+
+    def start(self, file_id):
+        pass
+
+    def done(self, file_id, output_blob=None):
+        with self.lock:
+            self.held.discard(file_id)
+        if not self.backend.complete(self.worker_id, file_id, output_blob):
+            print(f"⚠️ El lease de {file_id} ya no era de este nodo; el resultado queda, el estado no se cambia")
+
+    def fail(self, file_id, error, retry=True):
+        with self.lock:
+            self.held.discard(file_id)
+        self.backend.fail(self.worker_id, file_id, error, retry)
+
+    def summary(self):
+        return self.backend.summary()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def make_backend(kind, path=QUEUE_SQLITE_PATH):
+    if kind == "sqlite":
+        return SqliteQueueBackend(path)
+    if kind == "sqlserver":
+        return SqlServerQueueBackend()
+    raise ValueError(f"Backend de cola no reconocido: {kind}. Usa 'sqlite' o 'sqlserver'.")